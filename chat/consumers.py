@@ -6,6 +6,8 @@ from channels.db import database_sync_to_async
 from channels.exceptions import StopConsumer
 from rest_framework_simplejwt.tokens import AccessToken
 from .models import Room, Message
+from . import presence
+from .offline import queue_offline_delivery, clear_pending
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from datetime import datetime
@@ -30,6 +32,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_id = self.scope['url_route']['kwargs']['room_id']
             self.room_group_name = f'chat_{self.room_id}'
             self.ping_task = None
+            self.presence_registered = False
+            self.coalesce = False
+            self.coalesce_buffer = []
+            self.coalesce_task = None
 
             # Token doğrulaması
             query_string = self.scope['query_string'].decode('utf-8')
@@ -38,6 +44,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             params = dict(x.split('=') for x in query_string.split('&'))
             token = params.get('token', '')
 
+            # İstemci dizi halinde toplu çerçeveleri destekliyorsa olayları birleştir
+            self.coalesce = params.get('coalesce') == '1'
+            self.coalesce_window = settings.CHANNEL_SETTINGS['COALESCE_MIN_WINDOW_MS'] / 1000
+
             if not token:
                 logger.error(f"Token bulunamadı: Oda {self.room_id}")
                 await self.close(code=4001)
@@ -74,6 +84,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 )
                 
                 logger.info(f"Kullanıcı {self.user.email} odaya başarıyla bağlandı: {self.room_id}")
+
+                # Çevrimiçi olarak işaretle, bu odanın bekleyen özet bildirimlerini düşür
+                await presence.mark_connected(self.room_id, self.user.id)
+                self.presence_registered = True
+                await database_sync_to_async(clear_pending)(self.room_id, self.user.id)
                 
                 # Bağlantı başarılı mesajı gönder
                 await self.send(text_data=json.dumps({
@@ -118,6 +133,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if self.ping_task:
                 self.ping_task.cancel()
                 logger.debug("Ping döngüsü durduruldu.")
+
+            if getattr(self, 'coalesce_task', None):
+                self.coalesce_task.cancel()
+
+            if getattr(self, 'presence_registered', False):
+                await presence.mark_disconnected(self.room_id, self.user.id)
+                self.presence_registered = False
             
             if hasattr(self, 'channel_name'):
                 await self.channel_layer.group_discard(
@@ -143,6 +165,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     "type": "ping",
                     "timestamp": datetime.now().isoformat()
                 }))
+                await presence.refresh(self.room_id, self.user.id)
                 logger.debug(f"Ping gönderildi: Oda {self.room_id}")
             except asyncio.CancelledError:
                 logger.debug("Ping döngüsü durduruldu")
@@ -202,6 +225,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 )
                 logger.info(f"Mesaj gruba gönderildi: {message.id}")
 
+                # Bağlı olmayan katılımcıları özet emaili için kuyruğa al
+                offline_ids = await database_sync_to_async(queue_offline_delivery)(message)
+                if offline_ids:
+                    logger.info(f"Çevrimdışı bildirim kuyruğa alındı: {message.id} -> {offline_ids}")
+
                 # Bildirim gönder
                 await self.channel_layer.group_send(
                     self.room_group_name,
@@ -241,12 +269,65 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             }
 
-            await self.send(text_data=json.dumps(response))
+            await self.send_event(response)
             logger.debug(f"Mesaj gönderildi: {data.get('id')}")
         except Exception as e:
             logger.error(f"Mesaj gönderme hatası: {str(e)}")
             logger.exception(e)  # Stack trace için
 
+    async def send_event(self, payload):
+        """
+        Olayı WebSocket'e gönder. Birleştirme açıksa sessiz dönemdeki ilk olay hemen gider,
+        pencere süresince gelenler tek bir JSON dizi çerçevesinde toplanır.
+        Birleştirme açık istemciye olay çerçeveleri tek olay için bile her zaman dizidir.
+        """
+        if not self.coalesce:
+            await self.send(text_data=json.dumps(payload))
+            return
+
+        if self.coalesce_task is None:
+            # Trafik yokken gecikme ekleme, sadece yeni bir pencere aç
+            self.coalesce_task = asyncio.create_task(self.coalesce_loop())
+            await self.send(text_data=json.dumps([payload]))
+            return
+
+        self.coalesce_buffer.append(payload)
+        if len(self.coalesce_buffer) >= settings.CHANNEL_SETTINGS['COALESCE_MAX_BATCH']:
+            await self.flush_events()
+
+    async def flush_events(self):
+        """Birikmiş olayları tek çerçevede gönder"""
+        if not self.coalesce_buffer:
+            return 0
+        batch, self.coalesce_buffer = self.coalesce_buffer, []
+        await self.send(text_data=json.dumps(batch))
+        return len(batch)
+
+    async def coalesce_loop(self):
+        """Pencere sonunda tamponu boşalt; trafiğe göre pencereyi büyüt veya küçült"""
+        min_window = settings.CHANNEL_SETTINGS['COALESCE_MIN_WINDOW_MS'] / 1000
+        max_window = settings.CHANNEL_SETTINGS['COALESCE_MAX_WINDOW_MS'] / 1000
+        try:
+            while True:
+                await asyncio.sleep(self.coalesce_window)
+                sent = await self.flush_events()
+                if sent == 0:
+                    # Pencere boş geçti: trafik azaldı, pencereyi küçült ve kapat
+                    self.coalesce_window = max(min_window, self.coalesce_window / 2)
+                    break
+                if sent > 1:
+                    self.coalesce_window = min(max_window, self.coalesce_window * 2)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Olay birleştirme hatası: {str(e)}")
+        finally:
+            self.coalesce_task = None
+
+    async def notify_message(self, event):
+        """Bildirim olayı; canlı bağlantılar mesajı chat_message ile zaten aldı"""
+        logger.debug(f"Bildirim alındı: Oda {event.get('room_id')}, gönderen {event.get('sender_id')}")
+
     @database_sync_to_async
     def get_user_from_token(self, user_id):
         """Token'dan kullanıcı bilgisini al"""
@@ -0,0 +1,49 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chat.views import broadcast_message
+from core.models import AccountingFirm, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Muhasebeci duyurusunun (rooms/broadcast/) verilen sayıda müşteriye gönderim süresini '
+        've sorgu sayısını ölçer; oluşturulan kayıtlar geri alınır'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, action='append', dest='client_counts',
+                            help='Müşteri sayısı (tekrarlanabilir; varsayılan: 10, 100, 1000)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'müşteri':<10}{'süre (ms)':>12}{'sorgu':>8}")
+        for clients in options['client_counts'] or [10, 100, 1000]:
+            result = self.measure(clients)
+            self.stdout.write(f"{clients:<10}{result['elapsed'] * 1000:>12.0f}{result['queries']:>8}")
+
+    def measure(self, clients):
+        run = uuid.uuid4().hex[:8]
+        with transaction.atomic():
+            accountant = User.objects.create_user(f'benchmark-{run}@example.com', user_type='accountant')
+            users = User.objects.bulk_create([
+                User(email=f'benchmark-{run}-{index}@example.com', user_type='client', password='!')
+                for index in range(clients)
+            ])
+            firm = AccountingFirm.objects.create(owner=accountant, name=f'benchmark {run}')
+            firm.clients.add(*users)
+
+            request = APIRequestFactory().post('/broadcast/', {'content': 'Beyanname son gün 26 Mart'}, format='json')
+            force_authenticate(request, user=accountant)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = broadcast_message(request)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 201 or response.data['room_count'] != clients:
+                raise RuntimeError(f'Beklenmeyen yanıt: {response.status_code} {response.data}')
+            transaction.set_rollback(True)
+        return {'elapsed': elapsed, 'queries': len(queries)}
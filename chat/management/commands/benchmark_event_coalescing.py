@@ -0,0 +1,85 @@
+import asyncio
+import json
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.consumers import ChatConsumer
+
+
+class Command(BaseCommand):
+    help = (
+        'Giden olay birleştirmenin teslim edilen olay başına soket yazma (syscall) '
+        've CPU maliyetini birleştirme kapalı/açık karşılaştırarak ölçer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=5000, help='Gönderilecek olay sayısı')
+        parser.add_argument('--rate', type=float, default=2000,
+                            help='Saniyedeki olay sayısı (0: bekleme olmadan)')
+        parser.add_argument('--payload-size', type=int, default=200, help='Mesaj içeriği uzunluğu')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['events']} olay, {options['rate']:g} olay/sn, {options['payload_size']} karakter içerik"
+        )
+        self.stdout.write(f"{'mod':<12}{'çerçeve':>10}{'syscall/olay':>14}{'CPU µs/olay':>14}{'ort. grup':>11}")
+        for coalesce in (False, True):
+            result = asyncio.run(self.measure(coalesce, options['events'], options['rate'], options['payload_size']))
+            self.stdout.write(
+                f"{'birleştirme' if coalesce else 'tekil':<12}"
+                f"{result['writes']:>10}"
+                f"{result['writes'] / result['events']:>14.3f}"
+                f"{result['cpu'] / result['events'] * 1e6:>14.1f}"
+                f"{result['events'] / result['writes']:>11.1f}"
+            )
+
+    async def measure(self, coalesce, events, rate, payload_size):
+        """
+        Tüketiciyi gerçek bir soket çiftine yazdırır. Her çerçeve sunucunun yaptığı gibi
+        tek bir sendall ile yazılır; yazma sayısı çerçeve başına send syscall'una karşılık gelir.
+        """
+        loop = asyncio.get_running_loop()
+        writer, reader = socket.socketpair()
+        writer.setblocking(False)
+        reader.setblocking(False)
+        counters = {'writes': 0, 'events': 0}
+
+        async def send(text_data):
+            counters['writes'] += 1
+            data = json.loads(text_data)
+            counters['events'] += len(data) if isinstance(data, list) else 1
+            await loop.sock_sendall(writer, text_data.encode('utf-8'))
+
+        async def drain():
+            while await loop.sock_recv(reader, 1 << 16):
+                pass
+
+        consumer = ChatConsumer()
+        consumer.coalesce = coalesce
+        consumer.coalesce_buffer = []
+        consumer.coalesce_task = None
+        consumer.coalesce_window = settings.CHANNEL_SETTINGS['COALESCE_MIN_WINDOW_MS'] / 1000
+        consumer.send = send
+
+        drain_task = asyncio.create_task(drain())
+        content = 'x' * payload_size
+
+        cpu_start = time.process_time()
+        started = loop.time()
+        for index in range(events):
+            if rate:
+                delay = started + index / rate - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await consumer.send_event({'type': 'message', 'data': {'id': index, 'content': content, 'room_id': 1}})
+        if consumer.coalesce_task:
+            await consumer.coalesce_task
+        cpu = time.process_time() - cpu_start
+
+        writer.close()
+        await drain_task
+        reader.close()
+        return {'writes': counters['writes'], 'events': counters['events'], 'cpu': cpu}
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from chat.offline import send_offline_digests
+
+
+class Command(BaseCommand):
+    help = 'Çevrimdışı katılımcılara bekleyen mesajların özet emailini gönderir'
+
+    def handle(self, *args, **options):
+        result = send_offline_digests()
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['emails']} özet emaili gönderildi ({result['messages']} mesaj)"
+        ))
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.2 on 2026-10-19 06:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='offlinenotification',
+            name='message',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offline_notifications', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='offlinenotification',
+            name='recipient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offline_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='accountant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accountant_rooms', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_rooms', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chat.room'),
+        ),
+        migrations.AddIndex(
+            model_name='offlinenotification',
+            index=models.Index(fields=['sent_at', 'recipient', 'created_at'], name='chat_offlin_sent_at_ec90de_idx'),
+        ),
+    ]
@@ -35,4 +35,20 @@ class Message(models.Model):
     def __str__(self):
         if self.message_type == 'file':
             return f"{self.sender.email} - {self.file.name}"
-        return f"{self.sender.email}: {self.content[:50]}" 
\ No newline at end of file
+        return f"{self.sender.email}: {self.content[:50]}"
+
+class OfflineNotification(models.Model):
+    """Mesaj geldiğinde bağlı olmayan katılımcı için bekleyen bildirim"""
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='offline_notifications', on_delete=models.CASCADE)
+    message = models.ForeignKey(Message, related_name='offline_notifications', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)  # Özet emaili gönderildiğinde dolar
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['sent_at', 'recipient', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient.email} - {self.message_id}"
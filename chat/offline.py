@@ -0,0 +1,169 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from core.push import queue_push
+from core.utils import send_email_via_smtp2go
+from . import presence
+from .models import OfflineNotification
+
+logger = logging.getLogger(__name__)
+
+
+def queue_offline_delivery(message):
+    """
+    Mesaj geldiği anda odaya bağlı olmayan katılımcılar için bekleyen bildirim oluşturur
+    ve mobil cihazlarına push bildirimi kuyruğa alır.
+    Emailler burada gönderilmez, send_offline_digests ile alıcı başına toplanır.
+    """
+    return queue_offline_delivery_many([message])
+
+
+def queue_offline_delivery_many(messages, push_collapse_key=None):
+    """
+    Birden fazla mesaj için çevrimdışı teslimatı tek seferde kuyruğa alır.
+    push_collapse_key verilirse tüm alıcılara aynı içerikli tek bir push bildirimi gider
+    (toplu duyurularda multicast ile birleşebilmesi için).
+    """
+    recipients = {
+        message.id: {message.room.accountant_id, message.room.client_id} - {message.sender_id}
+        for message in messages
+    }
+    connected = presence.connected_pairs(
+        (message.room_id, user_id) for message in messages for user_id in recipients[message.id]
+    )
+
+    notifications = []
+    offline_by_message = {}
+    for message in messages:
+        offline_ids = [
+            user_id for user_id in recipients[message.id]
+            if (message.room_id, user_id) not in connected
+        ]
+        offline_by_message[message.id] = offline_ids
+        notifications.extend(
+            OfflineNotification(recipient_id=user_id, message=message)
+            for user_id in offline_ids
+        )
+    if not notifications:
+        return []
+
+    OfflineNotification.objects.bulk_create(notifications)
+
+    if push_collapse_key:
+        message = messages[0]
+        queue_push(
+            {n.recipient_id for n in notifications},
+            collapse_key=push_collapse_key,
+            title=_sender_name(message.sender),
+            body=_push_body(message),
+            data={'type': 'chat_broadcast', 'message_id': message.id}
+        )
+    else:
+        for message in messages:
+            if offline_by_message[message.id]:
+                queue_push(
+                    offline_by_message[message.id],
+                    collapse_key=f'room_{message.room_id}',
+                    title=_sender_name(message.sender),
+                    body=_push_body(message),
+                    data={'type': 'chat_message', 'room_id': message.room_id, 'message_id': message.id}
+                )
+    return sorted({n.recipient_id for n in notifications})
+
+
+def _sender_name(user):
+    return f"{user.first_name} {user.last_name}".strip() or user.email
+
+
+def _push_body(message):
+    return '📎 Dosya' if message.message_type == 'file' else (message.content or '')[:200]
+
+
+def clear_pending(room_id, user_id):
+    """Kullanıcı odaya bağlandığında o odanın bekleyen bildirimlerini düşür"""
+    return OfflineNotification.objects.filter(
+        recipient_id=user_id,
+        message__room_id=room_id,
+        sent_at__isnull=True
+    ).delete()[0]
+
+
+def send_offline_digests():
+    """
+    Bekleme penceresi dolan alıcılara tek bir özet emaili gönderir.
+
+    Returns:
+        dict: gönderilen email ve kapsanan mesaj sayıları
+    """
+    config = settings.CHAT_OFFLINE_DIGEST
+    cutoff = timezone.now() - timedelta(seconds=config['WINDOW'])
+
+    # Alıcı başına en eski bekleyen bildirim pencereyi doldurmuş olmalı
+    due_rows = (
+        OfflineNotification.objects.filter(sent_at__isnull=True)
+        .values('recipient_id')
+        .annotate(first_created_at=Min('created_at'))
+        .filter(first_created_at__lte=cutoff)
+        .order_by('first_created_at')[:config['MAX_RECIPIENTS_PER_RUN']]
+    )
+    due_recipients = [row['recipient_id'] for row in due_rows]
+    if not due_recipients:
+        return {'emails': 0, 'messages': 0}
+
+    pending = (
+        OfflineNotification.objects.filter(
+            recipient_id__in=due_recipients,
+            sent_at__isnull=True
+        )
+        .select_related('recipient', 'message__sender', 'message__room')
+        .order_by('recipient_id', 'created_at')
+    )
+
+    grouped = defaultdict(list)
+    for notification in pending:
+        grouped[notification.recipient_id].append(notification)
+
+    delivered_ids = []
+    emails = 0
+    for notifications in grouped.values():
+        recipient = notifications[0].recipient
+        if not recipient.is_active:
+            # Pasif kullanıcıya email atma, bildirimleri kapat
+            delivered_ids.extend(n.id for n in notifications)
+            continue
+        try:
+            _send_digest(recipient, notifications, config['MAX_MESSAGES_PER_DIGEST'])
+        except Exception as e:
+            # Gönderilemeyenler bir sonraki çalışmada tekrar denenir
+            logger.error(f"Özet emaili gönderilemedi ({recipient.email}): {str(e)}")
+            continue
+        delivered_ids.extend(n.id for n in notifications)
+        emails += 1
+
+    OfflineNotification.objects.filter(id__in=delivered_ids).update(sent_at=timezone.now())
+    return {'emails': emails, 'messages': len(delivered_ids)}
+
+
+def _send_digest(recipient, notifications, max_messages):
+    messages = [n.message for n in notifications]
+    shown = messages[:max_messages]
+    html_message = render_to_string('emails/chat_digest.html', {
+        'user': recipient,
+        'messages': shown,
+        'total_count': len(messages),
+        'hidden_count': len(messages) - len(shown),
+        'frontend_url': settings.FRONTEND_URL,
+    })
+    send_email_via_smtp2go(
+        to_list=recipient.email,
+        subject=f"Çek Fişi - {len(messages)} yeni mesajınız var",
+        html_body=html_message,
+        text_body=strip_tags(html_message)
+    )
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+# Bağlantılar farklı süreçlerde olabilir; sayaçlar ortak önbellekte tutulur
+cache = ConnectionProxy(caches, 'shared')
+
+
+def _presence_key(room_id, user_id):
+    return f'chat_presence_{room_id}_{user_id}'
+
+
+def _presence_timeout():
+    # Ping döngüsü anahtarı yeniler; süreç çökerse sayaç kendiliğinden düşer
+    return settings.CHANNEL_SETTINGS['PING_INTERVAL'] * 3
+
+
+async def mark_connected(room_id, user_id):
+    """Kullanıcının odadaki açık bağlantı sayısını artır"""
+    key = _presence_key(room_id, user_id)
+    await cache.aadd(key, 0, _presence_timeout())
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        # Anahtar arada süresi dolarak silinmiş olabilir
+        await cache.aset(key, 1, _presence_timeout())
+
+
+async def mark_disconnected(room_id, user_id):
+    """Kullanıcının odadaki açık bağlantı sayısını azalt"""
+    key = _presence_key(room_id, user_id)
+    try:
+        remaining = await cache.adecr(key)
+    except ValueError:
+        return
+    if remaining <= 0:
+        await cache.adelete(key)
+
+
+async def refresh(room_id, user_id):
+    """Canlı bağlantının varlık kaydını uzat"""
+    await cache.atouch(_presence_key(room_id, user_id), _presence_timeout())
+
+
+def is_connected(room_id, user_id):
+    return (cache.get(_presence_key(room_id, user_id)) or 0) > 0
+
+
+def connected_pairs(pairs):
+    """
+    (oda, kullanıcı) çiftlerinden bağlı olanlar. Toplu gönderimde alıcı başına ayrı
+    önbellek isteği yerine tek get_many yapılır.
+    """
+    keys = {_presence_key(room_id, user_id): (room_id, user_id) for room_id, user_id in pairs}
+    if not keys:
+        return set()
+    return {keys[key] for key, count in cache.get_many(list(keys)).items() if (count or 0) > 0}
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from django.utils import timezone
+
+from chat import presence
+from chat.consumers import ChatConsumer
+from chat.models import Message, OfflineNotification, Room
+from chat.offline import queue_offline_delivery, send_offline_digests
+from core.models import AccountingFirm, User
+
+
+class FakeSmtp2goServer:
+    """SMTP2GO API'si yerine gelen istekleri kaydeden yerel HTTP sunucusu"""
+
+    def __init__(self, status=200):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                server.requests.append(json.loads(self.rfile.read(length)))
+                body = json.dumps({'data': {'succeeded': 1, 'failed': 0}}).encode()
+                self.send_response(server.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.status = status
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/v3/email/send'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class OfflineDigestTests(TestCase):
+    def setUp(self):
+        self.accountant = User.objects.create_user('muhasebe@example.com', user_type='accountant')
+        self.client_user = User.objects.create_user(
+            'mukellef@example.com', user_type='client', first_name='Ayşe', last_name='Yılmaz'
+        )
+        self.room = Room.objects.create(name='oda', accountant=self.accountant, client=self.client_user)
+
+    def _message(self, content):
+        return Message.objects.create(room=self.room, sender=self.client_user, content=content)
+
+    def _age_pending(self, seconds):
+        OfflineNotification.objects.update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_digest_groups_pending_messages_per_recipient(self):
+        for index in range(3):
+            queue_offline_delivery(self._message(f'mesaj {index}'))
+        self._age_pending(3600)
+
+        with FakeSmtp2goServer() as smtp, override_settings(SMTP2GO_API_URL=smtp.url):
+            result = send_offline_digests()
+
+        self.assertEqual(result, {'emails': 1, 'messages': 3})
+        self.assertEqual(len(smtp.requests), 1)
+        self.assertEqual(smtp.requests[0]['to'], ['muhasebe@example.com'])
+        self.assertIn('3 yeni mesaj', smtp.requests[0]['subject'])
+        self.assertFalse(OfflineNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_recipient_inside_window_is_not_emailed(self):
+        queue_offline_delivery(self._message('yeni'))
+
+        with FakeSmtp2goServer() as smtp, override_settings(SMTP2GO_API_URL=smtp.url):
+            result = send_offline_digests()
+
+        self.assertEqual(result, {'emails': 0, 'messages': 0})
+        self.assertEqual(smtp.requests, [])
+
+    def test_failed_send_keeps_notifications_pending(self):
+        queue_offline_delivery(self._message('mesaj'))
+        self._age_pending(3600)
+
+        with FakeSmtp2goServer(status=500) as smtp, override_settings(SMTP2GO_API_URL=smtp.url):
+            result = send_offline_digests()
+
+        self.assertEqual(result, {'emails': 0, 'messages': 0})
+        self.assertEqual(len(smtp.requests), 1)
+        self.assertTrue(OfflineNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_connected_recipient_gets_no_notification(self):
+        async_to_sync(presence.mark_connected)(self.room.id, self.accountant.id)
+        try:
+            self.assertEqual(queue_offline_delivery(self._message('mesaj')), [])
+        finally:
+            async_to_sync(presence.mark_disconnected)(self.room.id, self.accountant.id)
+        self.assertFalse(presence.is_connected(self.room.id, self.accountant.id))
+
+    def test_digest_shows_at_most_max_messages(self):
+        for index in range(5):
+            queue_offline_delivery(self._message(f'mesaj {index}'))
+        self._age_pending(3600)
+
+        config = {**settings.CHAT_OFFLINE_DIGEST, 'MAX_MESSAGES_PER_DIGEST': 2}
+        with FakeSmtp2goServer() as smtp, override_settings(SMTP2GO_API_URL=smtp.url, CHAT_OFFLINE_DIGEST=config):
+            result = send_offline_digests()
+
+        self.assertEqual(result, {'emails': 1, 'messages': 5})
+        body = smtp.requests[0]['html_body']
+        self.assertIn('mesaj 0', body)
+        self.assertIn('mesaj 1', body)
+        self.assertNotIn('mesaj 2', body)
+        self.assertIn('3 mesaj daha', body)
+
+    def test_run_is_limited_to_max_recipients(self):
+        other_client = User.objects.create_user('diger@example.com', user_type='client')
+        other_room = Room.objects.create(name='oda 2', accountant=self.accountant, client=other_client)
+        queue_offline_delivery(self._message('ilk'))
+        queue_offline_delivery(Message.objects.create(room=other_room, sender=self.accountant, content='ikinci'))
+        self._age_pending(3600)
+        OfflineNotification.objects.filter(recipient=other_client).update(
+            created_at=timezone.now() - timedelta(seconds=7200)
+        )
+
+        config = {**settings.CHAT_OFFLINE_DIGEST, 'MAX_RECIPIENTS_PER_RUN': 1}
+        with FakeSmtp2goServer() as smtp, override_settings(SMTP2GO_API_URL=smtp.url, CHAT_OFFLINE_DIGEST=config):
+            first = send_offline_digests()
+            second = send_offline_digests()
+
+        # En uzun bekleyen alıcı önce
+        self.assertEqual([request['to'] for request in smtp.requests], [['diger@example.com'], ['muhasebe@example.com']])
+        self.assertEqual((first['emails'], second['emails']), (1, 1))
+
+
+class EventCoalescingTests(SimpleTestCase):
+    def _consumer(self):
+        consumer = ChatConsumer()
+        consumer.coalesce = True
+        consumer.coalesce_buffer = []
+        consumer.coalesce_task = None
+        consumer.coalesce_window = 0.01
+        consumer.frames = []
+
+        async def send(text_data):
+            consumer.frames.append(json.loads(text_data))
+        consumer.send = send
+        return consumer
+
+    def test_frames_are_always_arrays(self):
+        consumer = self._consumer()
+
+        async def run():
+            await consumer.send_event({'type': 'message', 'data': {'id': 1}})
+            await consumer.send_event({'type': 'message', 'data': {'id': 2}})
+            await consumer.coalesce_task
+
+        async_to_sync(run)()
+        self.assertEqual(consumer.frames, [
+            [{'type': 'message', 'data': {'id': 1}}],
+            [{'type': 'message', 'data': {'id': 2}}],
+        ])
+
+    def test_full_batch_is_flushed_without_waiting_for_the_window(self):
+        consumer = self._consumer()
+        channel_settings = {**settings.CHANNEL_SETTINGS, 'COALESCE_MAX_BATCH': 3}
+
+        async def run():
+            for index in range(7):
+                await consumer.send_event({'id': index})
+            frames_before_window = len(consumer.frames)
+            await consumer.coalesce_task
+            return frames_before_window
+
+        with override_settings(CHANNEL_SETTINGS=channel_settings):
+            frames_before_window = async_to_sync(run)()
+        self.assertEqual(frames_before_window, 3)
+        self.assertEqual([len(frame) for frame in consumer.frames], [1, 3, 3])
+
+    def test_window_grows_under_load_and_shrinks_when_idle(self):
+        consumer = self._consumer()
+        channel_settings = {
+            **settings.CHANNEL_SETTINGS, 'COALESCE_MIN_WINDOW_MS': 10, 'COALESCE_MAX_WINDOW_MS': 40,
+        }
+        windows = []
+
+        async def run():
+            await consumer.send_event({'id': 0})
+            for index in range(1, 4):
+                await consumer.send_event({'id': index})
+                await consumer.send_event({'id': index})
+                await asyncio.sleep(consumer.coalesce_window)
+                windows.append(consumer.coalesce_window)
+            await consumer.coalesce_task
+            windows.append(consumer.coalesce_window)
+
+        consumer.coalesce_window = 0.01
+        with override_settings(CHANNEL_SETTINGS=channel_settings):
+            async_to_sync(run)()
+        self.assertEqual(max(windows), 0.04)
+        self.assertLess(windows[-1], 0.04)
+        self.assertEqual(sum(len(frame) for frame in consumer.frames), 7)
+
+
+class BroadcastTests(TestCase):
+    def setUp(self):
+        self.accountant = User.objects.create_user('muhasebe@example.com', user_type='accountant')
+        self.firm = AccountingFirm.objects.create(owner=self.accountant, name='Büro')
+        self.api = APIClient()
+        self.api.force_authenticate(self.accountant)
+
+    def _add_clients(self, count):
+        start = self.firm.clients.count()
+        clients = User.objects.bulk_create([
+            User(email=f'mukellef{index}@example.com', user_type='client', password='!')
+            for index in range(start, start + count)
+        ])
+        self.firm.clients.add(*clients)
+        return clients
+
+    def _broadcast(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.post('/api/v1/chat/rooms/broadcast/', {'content': 'Son gün yarın'}, secure=True)
+        self.assertEqual(response.status_code, 201)
+        return response.json(), len(queries)
+
+    def test_connected_clients_get_no_offline_notification(self):
+        clients = self._add_clients(3)
+        result, _ = self._broadcast()
+        self.assertEqual(result['room_count'], 3)
+
+        room = Room.objects.get(client=clients[0])
+        async_to_sync(presence.mark_connected)(room.id, clients[0].id)
+        try:
+            result, _ = self._broadcast()
+        finally:
+            async_to_sync(presence.mark_disconnected)(room.id, clients[0].id)
+        self.assertEqual(result['offline_recipient_count'], 2)
+        self.assertEqual(Message.objects.filter(room__accountant=self.accountant).count(), 6)
+
+    def test_query_count_does_not_grow_with_clients(self):
+        self._add_clients(5)
+        self._broadcast()
+        _, few = self._broadcast()
+        self._add_clients(45)
+        self._broadcast()
+        _, many = self._broadcast()
+        self.assertEqual(few, many)
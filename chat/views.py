@@ -6,6 +6,7 @@ from rest_framework.decorators import api_view, permission_classes, authenticati
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .serializers import RoomSerializer, MessageSerializer
+from .offline import queue_offline_delivery, queue_offline_delivery_many
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.pagination import PageNumberPagination
@@ -14,6 +15,11 @@ import uuid
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+import asyncio
 
 User = get_user_model()
 
@@ -75,6 +81,7 @@ def room_messages(request, room_id):
                     content=request.data.get('content'),
                     file_url=file_data['url']  # URL'i file_url alanına kaydediyoruz
                 )
+                queue_offline_delivery(message)
                 serializer = MessageSerializer(message)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             except Exception as e:
@@ -86,7 +93,8 @@ def room_messages(request, room_id):
             data['room'] = room_id
             serializer = MessageSerializer(data=data)
             if serializer.is_valid():
-                serializer.save(room=room, sender=request.user)
+                message = serializer.save(room=room, sender=request.user)
+                queue_offline_delivery(message)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -125,6 +133,85 @@ def create_room(request):
     serializer = RoomSerializer(room)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def broadcast_message(request):
+    """Muhasebecinin tüm müşteri odalarına aynı mesajı tek seferde gönder"""
+    if not request.user.user_type == 'accountant':
+        return Response({"error": "Only accountants can broadcast"},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    content = (request.data.get('content') or '').strip()
+    if not content:
+        return Response({"error": "content is required"},
+                       status=status.HTTP_400_BAD_REQUEST)
+
+    client_ids = list(User.objects.filter(
+        accounting_firms__owner=request.user,
+        is_active=True
+    ).values_list('id', flat=True).distinct())
+    if not client_ids:
+        return Response({'room_count': 0, 'created_room_count': 0})
+
+    now = timezone.now()
+    with transaction.atomic():
+        rooms = list(Room.objects.filter(accountant=request.user, client_id__in=client_ids))
+        # Henüz odası olmayan müşteriler için odaları toplu oluştur
+        missing_client_ids = set(client_ids) - {room.client_id for room in rooms}
+        created_rooms = Room.objects.bulk_create([
+            Room(name=f"room_{request.user.id}_{client_id}", accountant=request.user, client_id=client_id)
+            for client_id in missing_client_ids
+        ])
+        rooms.extend(created_rooms)
+
+        messages = Message.objects.bulk_create([
+            Message(room=room, sender=request.user, content=content, message_type='text')
+            for room in rooms
+        ])
+
+    offline_ids = queue_offline_delivery_many(
+        messages,
+        push_collapse_key=f'broadcast_{request.user.id}'
+    )
+
+    sender = {
+        'id': request.user.id,
+        'email': request.user.email,
+        'user_type': request.user.user_type
+    }
+    events = [
+        (f'chat_{message.room_id}', {
+            'type': 'chat_message',
+            'data': {
+                'id': message.id,
+                'content': message.content,
+                'sender': sender,
+                'timestamp': (message.timestamp or now).isoformat(),
+                'room_id': str(message.room_id)
+            }
+        })
+        for message in messages
+    ]
+    async_to_sync(_group_send_all)(events, settings.CHANNEL_SETTINGS['BROADCAST_CONCURRENCY'])
+
+    return Response({
+        'room_count': len(rooms),
+        'created_room_count': len(created_rooms),
+        'offline_recipient_count': len(offline_ids)
+    }, status=status.HTTP_201_CREATED)
+
+async def _group_send_all(events, concurrency):
+    """Grup mesajlarını sınırlı eşzamanlılıkla paralel gönder"""
+    channel_layer = get_channel_layer()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(group, event):
+        async with semaphore:
+            await channel_layer.group_send(group, event)
+
+    await asyncio.gather(*(send(group, event) for group, event in events))
+
 class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
@@ -198,6 +285,7 @@ def upload_message(request, room_id):
             file=file,
             content=f"📎 {file.name}"
         )
+        queue_offline_delivery(message)
         serializer = MessageSerializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     except Exception as e:
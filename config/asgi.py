@@ -18,17 +18,25 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from channels.auth import AuthMiddlewareStack
 import chat.routing
+import core.routing
 
 # ASGI uyguamasını oluştur
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
-            chat.routing.websocket_urlpatterns
+            chat.routing.websocket_urlpatterns + core.routing.websocket_urlpatterns
         )
     ),
 })
 
+# Yeniden başlatmada bellekteki kuyrukla birlikte kaybolan fiş analizlerini tekrar kuyruğa al
+from core.tasks import analysis_queue
+analysis_queue.start_requeue_loop()
+# Satıcı indeksi fiş başına veritabanına gitmez; diğer süreçlerin değişiklikleri arka planda alınır
+from core.vendors import vendor_index
+vendor_index.start_refresh_loop()
+
 
 
 
@@ -110,9 +110,10 @@ DATABASES = {
         'PASSWORD': os.getenv('DEV_DATABASE_PASSWORD'),
         'HOST': os.getenv('DEV_DATABASE_HOST'),
         'PORT': os.getenv('DEV_DATABASE_PORT'),
+        # SSL gereklilik durumu; testler sqlite ile de çalıştırılabilsin
         'OPTIONS': {
-            'sslmode': 'require',  # SSL gereklilik durumu
-        },
+            'sslmode': 'require',
+        } if os.getenv('DEV_DATABASE_ENGINE') == 'django.db.backends.postgresql' else {},
     }
 }
 
@@ -214,6 +215,7 @@ AUTH_USER_MODEL = 'core.User'
 # SMTP2GO Configuration
 SMTP2GO_API_KEY = os.getenv('SMTP2GO_API_KEY')
 SMTP2GO_FROM_EMAIL = os.getenv('SMTP2GO_FROM_EMAIL')
+SMTP2GO_API_URL = os.getenv('SMTP2GO_API_URL', 'https://api.smtp2go.com/v3/email/send')  # Testlerde sahte sunucuya yönlendirilebilir
 
 # Media files
 MEDIA_URL = '/media/'
@@ -274,11 +276,22 @@ STATIC_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/static/'
 MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/'
 
 # Cache ayarları
+REDIS_URL = os.getenv('REDIS_URL')
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # Süreçler arasında ortak olması gereken durum (sohbet varlığı, yetki kapsamı).
+    # Redis yoksa veritabanı tablosu kullanılır: python manage.py createcachetable
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'shared_cache',
+    },
 }
 
 # CORS ve CSRF ayarları
@@ -387,13 +400,14 @@ APPEND_SLASH = False  # URL sonunda / zorunluluğunu kaldır
 ASGI_APPLICATION = "config.asgi.application"
 
 CHANNEL_LAYERS = {
+    # REDIS_URL verilirse olaylar tüm süreçlere (yönetim komutları dahil) ulaşır
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'  # Test ortamı için in-memory
-        # Production için Redis kullanılabilir:
-        # 'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        # 'CONFIG': {
-        #     "hosts": [('127.0.0.1', 6379)],
-        # },
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            'hosts': [REDIS_URL],
+        },
+    } if REDIS_URL else {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer'  # Tek süreçli geliştirme/test ortamı için in-memory
     }
 }
 
@@ -401,6 +415,18 @@ CHANNEL_LAYERS = {
 CHANNEL_SETTINGS = {
     'PING_INTERVAL': 30,  # saniye
     'PING_TIMEOUT': 20,   # saniye
+    'BROADCAST_CONCURRENCY': 50,  # Toplu duyuruda aynı anda yapılacak en fazla group_send
+    # ?coalesce=1 ile bağlanan istemciler için giden olay birleştirme
+    'COALESCE_MIN_WINDOW_MS': 5,   # Az trafikte pencere
+    'COALESCE_MAX_WINDOW_MS': 50,  # Yoğun trafikte pencerenin çıkabileceği üst sınır
+    'COALESCE_MAX_BATCH': 50,      # Bir çerçevedeki en fazla olay
+}
+
+# Çevrimdışı katılımcılara mesaj özeti ayarları
+CHAT_OFFLINE_DIGEST = {
+    'WINDOW': 10 * 60,  # saniye - alıcının ilk bekleyen mesajından sonra toplama süresi
+    'MAX_MESSAGES_PER_DIGEST': 20,  # Emailde gösterilecek en fazla mesaj
+    'MAX_RECIPIENTS_PER_RUN': 200,  # Bir çalıştırmada email gönderilecek en fazla alıcı
 }
 
 # WebSocket için allowed hosts
@@ -448,6 +474,11 @@ LOGGING = {
             'handlers': ['console', 'file'],
             'level': 'DEBUG',
             'propagate': True,
+        },
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
         }
     },
 }
@@ -458,6 +489,15 @@ CHANNEL_SECURITY = {
     'ALGORITHMS': ['HS256'],
 }
 
+# Push bildirim ayarları (firebase-admin)
+PUSH_NOTIFICATIONS = {
+    'BACKEND': os.getenv('PUSH_BACKEND', 'firebase'),  # 'firebase' veya yerel test sunucusu için 'local'
+    'CREDENTIALS_FILE': os.getenv('FIREBASE_CREDENTIALS_FILE'),  # Servis hesabı JSON dosyası
+    'LOCAL_ENDPOINT': os.getenv('PUSH_LOCAL_ENDPOINT', 'http://localhost:9099/fcm/send'),
+    'MULTICAST_LIMIT': 500,  # FCM multicast başına en fazla token
+    'BATCH_SIZE': 1000,  # Bir çalıştırmada işlenecek en fazla bekleyen bildirim
+}
+
 # Cities Light ayarları
 CITIES_LIGHT_TRANSLATION_LANGUAGES = ['tr']
 CITIES_LIGHT_INCLUDE_COUNTRIES = ['TR']
@@ -466,6 +506,99 @@ CITIES_LIGHT_INCLUDE_CITY_TYPES = ['PPL', 'PPLA', 'PPLA2', 'PPLA3', 'PPLA4']
 # OpenAI Settings
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# Fiş görsellerinin modele gönderilmeden önce hazırlanması
+RECEIPT_IMAGE_PROCESSING = {
+    'MAX_SIDE': 2048,  # piksel - uzun kenar bu değere küçültülür
+    'JPEG_QUALITY': 85,
+    'PDF_DPI': 150,
+    'PDF_MAX_PAGES': 3,  # Bir PDF'ten modele gönderilecek en fazla sayfa
+    'PROCESS_WORKERS': 2,  # Ön işleme için işlem havuzu boyutu
+    'TIMEOUT': 60,  # saniye
+}
+
+# Aynı/benzer belge tespiti
+DOCUMENT_DEDUP = {
+    'NEAR_DUPLICATE_DISTANCE': 6,  # dHash bit farkı; bu değer ve altı benzer sayılır
+    'NEAR_DUPLICATE_WINDOW': 500,  # Karşılaştırılacak son belge sayısı (kullanıcı başına)
+}
+
+# Fiş analizi model istemcisi
+RECEIPT_ANALYSIS_CLIENT = {
+    'BACKEND': os.getenv('RECEIPT_ANALYSIS_BACKEND', 'openai'),  # Testler ve benchmark için 'fake'
+    'MODEL': 'gpt-4-turbo',
+    'MAX_CONCURRENCY': int(os.getenv('RECEIPT_ANALYSIS_MAX_CONCURRENCY', '4')),  # Süreç başına eşzamanlı çağrı
+    'TIMEOUT': 60,  # saniye - çağrı başına; geçici hatalar RECEIPT_ANALYSIS kuyruğunda tekrar denenir
+    'CIRCUIT_FAILURE_THRESHOLD': 5,  # Art arda bu kadar geçici hatada devre açılır
+    'CIRCUIT_RESET_TIMEOUT': 30,  # saniye - devre açık kalma süresi
+    'FAKE_LATENCY': 0.2,  # saniye - fake backend yanıt süresi
+}
+
+# Muhasebeci müşteri kapsamı önbelleği (m2m değişikliğinde ve soft delete'te temizlenir)
+CLIENT_SCOPE = {
+    'CACHE_TIMEOUT': 300,  # saniye
+}
+
+# Belge indirme
+DOCUMENT_DOWNLOAD = {
+    'MODE': os.getenv('DOCUMENT_DOWNLOAD_MODE', 'stream'),  # 'stream' veya 'redirect' (imzalı URL)
+    'CHUNK_SIZE': 64 * 1024,  # bayt - storage'dan okunan parça boyutu
+    'PRESIGNED_EXPIRY': 60,  # saniye - imzalı URL geçerlilik süresi
+}
+
+# Toplu belge dışa aktarımı (ZIP)
+DOCUMENT_EXPORT = {
+    'PREFETCH_WORKERS': 4,  # Storage'dan aynı anda okunan dosya sayısı
+    'PREFETCH_CHUNKS': 8,  # Dosya başına bellekte bekletilen en fazla parça
+    'MAX_FILES': 2000,  # Tek arşivdeki en fazla dosya
+    'ROW_CHUNK_SIZE': 2000,  # CSV/XLSX dışa aktarımında imleçten tek seferde okunan belge
+}
+
+# Süresi dolan müşteri belgeleri bildirimi (send_expiry_digests)
+CLIENT_DOCUMENT_EXPIRY = {
+    'DAYS_AHEAD': 30,  # Bu kadar gün içinde süresi dolacak belgeler bildirilir
+    'NOTIFY_CLIENTS': True,  # Muhasebecinin yanında müşterinin kendisine de özet gönder
+    'MAX_DOCUMENTS_PER_RUN': 5000,  # Bir çalıştırmada işlenecek en fazla belge
+}
+
+# Storage dosya silme kuyruğu (PendingFileDeletion)
+FILE_DELETION = {
+    'BATCH_SIZE': 1000,  # Tek DeleteObjects isteğindeki en fazla anahtar (S3 sınırı 1000)
+    'MAX_ATTEMPTS': 8,  # Bu sayıdan sonra kayıt incelenmek üzere bekletilir
+    'RETRY_BACKOFF': 60,  # saniye - her denemede ikiye katlanır
+    'CLAIM_TIMEOUT': 300,  # saniye - işlenmek üzere alınan kaydın başka worker'a kapalı kaldığı süre
+    'DRAIN_ON_COMMIT': True,  # Silme kaydı commit olunca kuyruğu aynı süreçte arka planda işle
+}
+
+# Çoklu belge yükleme (documents/)
+DOCUMENT_UPLOAD = {
+    'MAX_FILES': 20,  # Tek istekte yüklenebilecek en fazla dosya (fiş analizleri toplu öncelikle kuyruğa alınır)
+}
+
+# Toplu belge işleme (documents/process/bulk/)
+DOCUMENT_BULK_PROCESS = {
+    'MAX_DOCUMENTS': 500,  # Tek istekte durumu değiştirilebilecek en fazla belge
+}
+
+# Satıcı eşleştirme indeksi
+VENDOR_INDEX = {
+    'REFRESH_INTERVAL': 60,  # saniye - diğer süreçlerdeki Vendor değişikliklerinin arka planda indekse yansıma süresi
+    'AUTO_CREATE': True,  # Bilinmeyen satıcıları model kategorisiyle kaydet
+}
+
+# Fiş analizi arka plan kuyruğu
+RECEIPT_ANALYSIS = {
+    'WORKERS': int(os.getenv('RECEIPT_ANALYSIS_WORKERS', '2')),  # Kuyruğu işleyen thread sayısı
+    'MAX_RETRIES': 3,  # Başarısız analiz için tekrar deneme sayısı
+    'RETRY_BACKOFF': 5,  # saniye - her denemede ikiye katlanır
+    'BATCH_SIZE': 5,  # Kuyrukta birikmiş fişlerden tek model çağrısına konacak en fazla adet
+    'DEFAULT_TENANT_WEIGHT': 1,  # Aktif aboneliği olmayan bürolar için kuyruk payı
+    'DEFAULT_TENANT_CONCURRENCY': 1,  # Aktif aboneliği olmayan bürolar için eşzamanlı analiz
+    'LEASE_SECONDS': 10 * 60,  # Kuyruktaki işin kirası; süreç canlıyken düzenli yenilenir
+    'REQUEUE_INTERVAL': 60,  # saniye - kirası dolan/kuyruksuz bekleyen analizleri toplama aralığı
+    'REQUEUE_BATCH': 200,  # Bir turda kuyruğa alınacak en fazla belge
+    'REQUEUE_MAX_QUEUED': 1000,  # Kuyrukta bu kadar iş varsa yeni belge toplanmaz
+}
+
 
 
 
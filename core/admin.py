@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, AccountingFirm, Document, SubscriptionPlan, AccountantSubscription
+from .models import User, AccountingFirm, Document, SubscriptionPlan, AccountantSubscription, Vendor, PendingFileDeletion
 from django.utils import timezone
 from datetime import timedelta
 
@@ -29,6 +29,18 @@ class AccountantSubscriptionAdmin(admin.ModelAdmin):
 
 @admin.register(SubscriptionPlan)
 class SubscriptionPlanAdmin(admin.ModelAdmin):
-    list_display = ['name', 'plan_type', 'base_price', 'base_client_limit', 'is_active']
+    list_display = ['name', 'plan_type', 'base_price', 'base_client_limit', 'analysis_weight', 'analysis_concurrency', 'is_active']
     list_filter = ['plan_type', 'is_active']
     search_fields = ['name']
+
+@admin.register(Vendor)
+class VendorAdmin(admin.ModelAdmin):
+    list_display = ['name', 'normalized_name', 'category', 'is_active', 'updated_at']
+    list_filter = ['category', 'is_active']
+    search_fields = ['name', 'normalized_name']
+
+@admin.register(PendingFileDeletion)
+class PendingFileDeletionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'attempts', 'next_attempt_at', 'created_at']
+    search_fields = ['name']
+    readonly_fields = ['name', 'created_at', 'last_error']
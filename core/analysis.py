@@ -0,0 +1,282 @@
+import base64
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .dedup import find_cached_analysis
+from .events import notify_document_event
+from .llm import get_analysis_client
+from .receipt_images import detect_content_type, preprocess_receipt
+from .receipts import RECEIPT_CATEGORIES, parse_decimal, store_receipt_rows
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_PROMPT = (
+    "Could you extract the following seller pricing information from this image and "
+    "return ONLY the JSON data without any explanation? Include: seller_name, date, "
+    "total_amount, vat_amount, category, items (array of items with name, quantity, "
+    "unit_price, category). Categories must be one of: " + ", ".join(RECEIPT_CATEGORIES)
+)
+
+BATCH_RECEIPT_PROMPT = (
+    "The following images belong to {count} separate receipts. Each receipt's images are "
+    "preceded by a line 'Receipt <id>'. For every receipt extract: seller_name, date, "
+    "total_amount, vat_amount, category, items (array of items with name, quantity, "
+    "unit_price, category). Categories must be one of: " + ", ".join(RECEIPT_CATEGORIES) + ". "
+    "Return ONLY a JSON array with exactly one object per receipt, in the same order, "
+    "each object also containing receipt_id, without any explanation."
+)
+
+
+class MalformedBatchResponse(ValueError):
+    """Toplu yanıt fişlerle eşleştirilemedi"""
+
+
+def analyze_receipt(document, image_data=None):
+    """
+    Fişi OpenAI ile analiz eder ve sonuçları belgeye kaydeder.
+
+    Args:
+        document: Analiz edilecek Document
+        image_data: Yükleme sırasında bellekte olan dosya içeriği; yoksa storage'dan okunur
+
+    Returns:
+        dict: Analiz sonucu
+    """
+    # Aynı içerik daha önce analiz edildiyse modele tekrar gitme
+    cached = find_cached_analysis(document)
+    if cached is not None:
+        apply_analysis(document, cached)
+        return cached
+
+    if image_data is None:
+        with document.file.open('rb') as image_file:
+            image_data = image_file.read()
+
+    pages = preprocess_receipt(image_data)
+
+    started = time.monotonic()
+    analyzed_data = request_receipt_analysis(pages)
+    logger.info(f"Fiş analizi model süresi: {document.id} {(time.monotonic() - started) * 1000:.0f} ms")
+
+    apply_analysis(document, analyzed_data)
+    return analyzed_data
+
+
+def analyze_receipts_batch(items):
+    """
+    Birden fazla fişi tek model çağrısında analiz eder. Yanıt fişlerle eşleştirilemezse
+    ilgili grup için tek tek analize döner.
+
+    Args:
+        items: (document, image_data) listesi
+
+    Returns:
+        dict: belge id -> None (başarılı) veya Exception
+    """
+    results = {}
+    pending = []
+    for document, image_data in items:
+        try:
+            cached = find_cached_analysis(document)
+            if cached is not None:
+                apply_analysis(document, cached)
+                results[document.id] = None
+                continue
+        except Exception as e:
+            results[document.id] = e
+            continue
+        pending.append((document, image_data))
+
+    batch_size = settings.RECEIPT_ANALYSIS['BATCH_SIZE']
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        if len(chunk) == 1:
+            results.update(_analyze_individually(chunk))
+            continue
+        try:
+            prepared = []
+            for document, image_data in chunk:
+                if image_data is None:
+                    with document.file.open('rb') as image_file:
+                        image_data = image_file.read()
+                prepared.append((document, preprocess_receipt(image_data)))
+
+            started = time.monotonic()
+            analyzed = request_batch_analysis(prepared)
+            logger.info(
+                f"Toplu fiş analizi: {len(chunk)} fiş {(time.monotonic() - started) * 1000:.0f} ms"
+            )
+        except MalformedBatchResponse as e:
+            logger.warning(f"Toplu analiz yanıtı hatalı, tek tek analize geçiliyor: {str(e)}")
+            results.update(_analyze_individually(chunk))
+            continue
+        except Exception as e:
+            for document, _ in chunk:
+                results[document.id] = e
+            continue
+
+        for document, _ in chunk:
+            # Bir fişin kaydı başarısız olursa diğerleri etkilenmez
+            try:
+                apply_analysis(document, analyzed[document.id])
+                results[document.id] = None
+            except Exception as e:
+                results[document.id] = e
+    return results
+
+
+def _analyze_individually(items):
+    results = {}
+    for document, image_data in items:
+        try:
+            analyze_receipt(document, image_data=image_data)
+            results[document.id] = None
+        except Exception as e:
+            results[document.id] = e
+    return results
+
+
+def request_batch_analysis(prepared):
+    """
+    Args:
+        prepared: (document, jpeg sayfaları) listesi
+
+    Returns:
+        dict: belge id -> analiz sonucu
+    """
+    content = [{
+        "type": "text",
+        "text": BATCH_RECEIPT_PROMPT.format(count=len(prepared))
+    }]
+    for document, pages in prepared:
+        content.append({"type": "text", "text": f"Receipt {document.id}"})
+        content.extend(image_content(page) for page in pages)
+
+    response_text = get_analysis_client().complete(
+        [{"role": "user", "content": content}],
+        max_tokens=1000 * len(prepared)
+    )
+    return map_batch_response(response_text, [d.id for d, _ in prepared])
+
+
+def map_batch_response(response_text, document_ids):
+    """JSON dizisini önce receipt_id ile, yoksa sıra ile belgelere eşleştir"""
+    try:
+        parsed = parse_json_response(response_text)
+    except ValueError as e:
+        raise MalformedBatchResponse(f"JSON çözülemedi: {str(e)}")
+
+    if not isinstance(parsed, list) or len(parsed) != len(document_ids):
+        raise MalformedBatchResponse(f"{len(document_ids)} elemanlı dizi bekleniyordu")
+    if not all(isinstance(item, dict) for item in parsed):
+        raise MalformedBatchResponse("Dizi elemanları nesne olmalı")
+
+    by_id = {}
+    for item in parsed:
+        try:
+            by_id[int(item.get('receipt_id'))] = item
+        except (TypeError, ValueError):
+            break
+    if set(by_id) == set(document_ids):
+        mapped = by_id
+    else:
+        mapped = dict(zip(document_ids, parsed))
+
+    for item in mapped.values():
+        item.pop('receipt_id', None)
+    return mapped
+
+
+def image_content(page):
+    """Sayfayı modele gönderilecek image_url parçasına çevir"""
+    base64_image = base64.b64encode(page).decode('utf-8')
+    # Ön işlenemeyip olduğu gibi gönderilen dosyalar için gerçek tür; bilinmiyorsa JPEG varsayılır
+    content_type = detect_content_type(page)
+    if not content_type.startswith('image/'):
+        content_type = 'image/jpeg'
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:{content_type};base64,{base64_image}"
+        }
+    }
+
+
+def request_receipt_analysis(pages):
+    response_text = get_analysis_client().complete(
+        [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": RECEIPT_PROMPT
+                    },
+                    *[image_content(page) for page in pages]
+                ]
+            }
+        ],
+        max_tokens=1000
+    )
+
+    return parse_json_response(response_text)
+
+
+def parse_json_response(response_text):
+    """Model yanıtından JSON'ı çıkar (```json bloklarını temizler)"""
+    json_str = response_text.strip()
+    if json_str.startswith('```json'):
+        json_str = json_str[7:]
+    if json_str.endswith('```'):
+        json_str = json_str[:-3]
+    return json.loads(json_str.strip())
+
+
+ANALYSIS_FIELDS = ['analyzed_data', 'analysis_status', 'analysis_lease_until', 'amount', 'vat_rate', 'updated_at']
+
+
+def apply_analysis(document, analyzed_data):
+    """
+    Analiz sonucunu ve türetilen alanları belgeye kaydet.
+    Belge kilitlenip yeniden okunur ve sadece analizin yazdığı alanlar güncellenir;
+    analiz sürerken yapılan durum değişiklikleri ezilmez.
+
+    Returns:
+        Document: Güncellenen belge (analiz sürerken silindiyse None)
+    """
+    from .models import Document
+
+    with transaction.atomic():
+        document = Document.objects.select_for_update().filter(pk=document.pk).first()
+        if document is None:
+            return None
+
+        document.analyzed_data = analyzed_data
+        document.analysis_status = 'completed'
+        document.analysis_lease_until = None
+
+        # Analiz edilen değerleri ilgili alanlara kaydet; sütuna sığmayan (hatalı okunmuş)
+        # değerler kaydı bozmasın diye boş bırakılır
+        if 'total_amount' in analyzed_data:
+            document.amount = parse_decimal(
+                analyzed_data['total_amount'], max_digits=Document._meta.get_field('amount').max_digits
+            )
+
+        if 'vat_amount' in analyzed_data and analyzed_data.get('total_amount'):
+            # KDV oranını hesapla: (KDV tutarı / Toplam tutar) * 100
+            try:
+                vat_rate = (analyzed_data['vat_amount'] / analyzed_data['total_amount']) * 100
+                document.vat_rate = parse_decimal(
+                    round(vat_rate, 2), max_digits=Document._meta.get_field('vat_rate').max_digits
+                )
+            except (ZeroDivisionError, TypeError):
+                pass
+
+        document.save(update_fields=ANALYSIS_FIELDS)
+        store_receipt_rows(document)
+    notify_document_event(document, 'document.analyzed')
+    return document
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+import jwt
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .events import user_group_name
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+class UserEventConsumer(AsyncWebsocketConsumer):
+    """
+    Kullanıcıya özel olay kanalı. Belge analizi ve durum değişiklikleri
+    (document.analyzed, document.status_changed) buradan iletilir.
+    """
+
+    async def connect(self):
+        self.group_name = None
+        self.ping_task = None
+
+        params = dict(
+            x.split('=', 1) for x in self.scope['query_string'].decode('utf-8').split('&') if '=' in x
+        )
+        token = params.get('token', '')
+        if not token:
+            await self.close(code=4001)
+            return
+
+        try:
+            decoded_token = jwt.decode(
+                token,
+                settings.SECRET_KEY,
+                algorithms=settings.CHANNEL_SECURITY['ALGORITHMS']
+            )
+        except jwt.ExpiredSignatureError:
+            logger.error("Olay kanalı: token süresi dolmuş")
+            await self.close(code=4001)
+            return
+        except jwt.InvalidTokenError:
+            logger.error("Olay kanalı: geçersiz token")
+            await self.close(code=4002)
+            return
+
+        self.user = await self.get_user(decoded_token['user_id'])
+        if not self.user:
+            await self.close(code=4002)
+            return
+
+        self.group_name = user_group_name(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send(text_data=json.dumps({
+            'type': 'connection_established',
+            'user': {'id': self.user.id, 'email': self.user.email}
+        }))
+        self.ping_task = asyncio.create_task(self.ping_loop())
+        logger.info(f"Olay kanalı bağlandı: {self.user.email}")
+
+    async def disconnect(self, close_code):
+        if self.ping_task:
+            self.ping_task.cancel()
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            return
+        if data.get('type') == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+
+    async def ping_loop(self):
+        try:
+            while True:
+                await asyncio.sleep(settings.CHANNEL_SETTINGS['PING_INTERVAL'])
+                await self.send(text_data=json.dumps({
+                    'type': 'ping',
+                    'timestamp': datetime.now().isoformat()
+                }))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Olay kanalı ping hatası: {str(e)}")
+
+    async def user_event(self, event):
+        await self.send(text_data=json.dumps({
+            'type': event['event'],
+            'data': event['data']
+        }))
+
+    @database_sync_to_async
+    def get_user(self, user_id):
+        try:
+            return User.objects.get(id=user_id, is_active=True)
+        except User.DoesNotExist:
+            return None
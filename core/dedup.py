@@ -0,0 +1,108 @@
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def compute_content_hash(uploaded_file):
+    """Yüklenen dosyanın SHA-256 özetini parça parça okuyarak hesaplar"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def find_stored_copy(queryset, content_hash):
+    """
+    Aynı içeriğe sahip, dosyası storage'da duran en eski kaydı bul.
+
+    Args:
+        queryset: Aramanın yapılacağı kayıtlar; yükleyenin kendi kayıtlarıyla sınırlanmalı,
+            başka kullanıcının dosyası veya analizi paylaşılmaz
+    """
+    if not content_hash:
+        return None
+    return queryset.filter(content_hash=content_hash).exclude(file='').order_by('id').first()
+
+
+def compute_perceptual_hash(image_data):
+    """
+    Görselin 64 bitlik fark özetini (dHash) döndürür.
+    Görsel açılamazsa (PDF vb.) None döner.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            # JPEG'lerde tam çözünürlükte açmaya gerek yok
+            image.draft('L', (64, 64))
+            pixels = list(image.convert('L').resize((9, 8)).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return f'{value:016x}'
+
+
+def find_near_duplicate(document):
+    """Aynı kullanıcının son belgeleri arasında görsel olarak çok benzer olanı bul"""
+    from .models import Document
+
+    if not document.perceptual_hash:
+        return None
+
+    config = settings.DOCUMENT_DEDUP
+    target = int(document.perceptual_hash, 16)
+    candidates = (
+        Document.objects.filter(uploaded_by_id=document.uploaded_by_id, perceptual_hash__isnull=False)
+        .exclude(id=document.id)
+        .order_by('-created_at')
+        .values_list('id', 'perceptual_hash')[:config['NEAR_DUPLICATE_WINDOW']]
+    )
+    for candidate_id, candidate_hash in candidates:
+        distance = bin(target ^ int(candidate_hash, 16)).count('1')
+        if distance <= config['NEAR_DUPLICATE_DISTANCE']:
+            return candidate_id
+    return None
+
+
+def flag_near_duplicate(document, image_data):
+    """Görsel özeti kaydet, benzer bir belge varsa inceleme için işaretle"""
+    from .models import Document
+
+    document.perceptual_hash = compute_perceptual_hash(image_data)
+    update = {'perceptual_hash': document.perceptual_hash}
+    if document.duplicate_of_id is None:
+        duplicate_id = find_near_duplicate(document)
+        if duplicate_id:
+            logger.info(f"Benzer belge bulundu: {document.id} ~ {duplicate_id}")
+            document.duplicate_of_id = duplicate_id
+            update['duplicate_of_id'] = duplicate_id
+    Document.objects.filter(id=document.id).update(**update)
+
+
+def find_cached_analysis(document):
+    """Aynı kullanıcının aynı içerikli başka bir belgesinin analiz sonucu varsa döndür"""
+    from .models import Document
+
+    if not document.content_hash:
+        return None
+    return (
+        Document.objects.filter(
+            uploaded_by_id=document.uploaded_by_id,
+            content_hash=document.content_hash,
+            analyzed_data__isnull=False
+        )
+        .exclude(id=document.id)
+        .values_list('analyzed_data', flat=True)
+        .first()
+    )
@@ -0,0 +1,198 @@
+import logging
+import threading
+from datetime import timedelta
+from urllib.parse import quote, unquote, urlparse
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .downloads import s3_client, storage_key
+
+logger = logging.getLogger(__name__)
+
+# Storage'daki dosyalara referans veren alanlar; silmeden önce hepsi kontrol edilir
+FILE_REFERENCES = (
+    ('core.Document', 'file'),
+    ('core.ClientDocument', 'file'),
+    ('chat.Message', 'file'),
+    ('core.User', 'profile_image'),
+)
+
+# Dosyaya tam URL ile referans veren alanlar (istemcinin yükleyip URL'ini gönderdiği sohbet dosyaları)
+URL_REFERENCES = (
+    ('chat.Message', 'file_url'),
+)
+
+# Tek sorgudaki en fazla URL koşulu (SQLite ifade derinliği sınırı)
+URL_LOOKUP_CHUNK = 200
+
+
+def schedule_file_deletion(names):
+    """
+    Dosyaları silinmek üzere kuyruğa al. Çağıran transaction geri alınırsa kayıt da geri alınır.
+    Aynı içerik başka kayıtlarca kullanılıyorsa dosya kuyruk işlenirken atlanır.
+    """
+    from .models import PendingFileDeletion
+
+    names = {name for name in names if name}
+    if names:
+        PendingFileDeletion.objects.bulk_create([PendingFileDeletion(name=name) for name in names])
+        if settings.FILE_DELETION['DRAIN_ON_COMMIT']:
+            transaction.on_commit(deletion_drainer.wake)
+
+
+def url_key_candidates(url):
+    """
+    URL yolundan olası nesne anahtarları. Sanal host (bucket.endpoint/anahtar), yol stili
+    (endpoint/bucket/anahtar) ve CDN adresleri aynı şekilde ele alınır: anahtar yolun sonekidir.
+    """
+    parts = unquote(urlparse(url).path).strip('/').split('/')
+    return {'/'.join(parts[index:]) for index in range(len(parts))} - {''}
+
+
+def referenced_names(names):
+    """Hâlâ bir kayıt tarafından kullanılan dosya adları"""
+    names = list(names)
+    referenced = set()
+    for model_label, field in FILE_REFERENCES:
+        model = apps.get_model(model_label)
+        referenced.update(
+            model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True)
+        )
+
+    keys = {storage_key(name): name for name in names}
+    key_list = list(keys)
+    for model_label, field in URL_REFERENCES:
+        model = apps.get_model(model_label)
+        for start in range(0, len(key_list), URL_LOOKUP_CHUNK):
+            condition = Q()
+            for key in key_list[start:start + URL_LOOKUP_CHUNK]:
+                for pattern in {key, quote(key)}:
+                    condition |= Q(**{f'{field}__contains': pattern})
+            for url in model.objects.filter(condition).values_list(field, flat=True):
+                referenced.update(keys[key] for key in url_key_candidates(url) if key in keys)
+    return referenced
+
+
+def drain_file_deletions():
+    """
+    Zamanı gelen silme kayıtlarını DeleteObjects ile topluca işler.
+    Kayıtlar SKIP LOCKED ile alınıp bir süreliğine ertelenerek sahiplenilir; storage isteği
+    satır kilitleri bırakıldıktan sonra yapılır. Birden fazla worker aynı anda çalışabilir,
+    worker istek sırasında durursa kayıtlar erteleme süresi dolunca tekrar alınır.
+
+    Returns:
+        dict: {'deleted': silinen, 'skipped': hâlâ kullanıldığı için atlanan, 'failed': tekrar denenecek}
+    """
+    from .models import PendingFileDeletion
+
+    config = settings.FILE_DELETION
+    with transaction.atomic():
+        pending = list(
+            PendingFileDeletion.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=timezone.now(), attempts__lt=config['MAX_ATTEMPTS'])
+            .order_by('next_attempt_at', 'id')[:min(config['BATCH_SIZE'], 1000)]
+        )
+        if not pending:
+            return {'deleted': 0, 'skipped': 0, 'failed': 0}
+
+        # Silme kuyruğa alındıktan sonra aynı içerik yeniden yüklenmiş (dedup) olabilir
+        referenced = referenced_names({deletion.name for deletion in pending})
+        skipped = [deletion for deletion in pending if deletion.name in referenced]
+        to_delete = [deletion for deletion in pending if deletion.name not in referenced]
+        PendingFileDeletion.objects.filter(id__in=[deletion.id for deletion in skipped]).delete()
+        PendingFileDeletion.objects.filter(id__in=[deletion.id for deletion in to_delete]).update(
+            next_attempt_at=timezone.now() + timedelta(seconds=config['CLAIM_TIMEOUT'])
+        )
+
+    errors = {}
+    if to_delete:
+        keys = {}
+        for deletion in to_delete:
+            keys.setdefault(storage_key(deletion.name), []).append(deletion.id)
+        for key, message in delete_storage_keys(list(keys)).items():
+            errors.update({deletion_id: message for deletion_id in keys.get(key, [])})
+    failed = [deletion for deletion in to_delete if deletion.id in errors]
+
+    with transaction.atomic():
+        PendingFileDeletion.objects.filter(
+            id__in=[deletion.id for deletion in to_delete if deletion.id not in errors]
+        ).delete()
+
+        now = timezone.now()
+        for deletion in failed:
+            deletion.attempts += 1
+            deletion.last_error = errors[deletion.id][:1000]
+            deletion.next_attempt_at = now + timedelta(
+                seconds=config['RETRY_BACKOFF'] * 2 ** (deletion.attempts - 1)
+            )
+            if deletion.attempts >= config['MAX_ATTEMPTS']:
+                logger.error(f"Dosya silinemedi, denemeler tükendi: {deletion.name}: {deletion.last_error}")
+        PendingFileDeletion.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at'])
+
+    return {'deleted': len(to_delete) - len(failed), 'skipped': len(skipped), 'failed': len(failed)}
+
+
+class DeletionDrainer:
+    """
+    Silme kaydı oluşturan transaction commit olunca kuyruğu bu süreçte arka planda işler;
+    kullanıcı isteği storage'ı beklemez. drain_file_deletions --loop worker'ı kaçanları toplar.
+    """
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='file-deletions', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _work(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                while True:
+                    result = drain_file_deletions()
+                    # Başarısız kayıtlar geri çekilme süresi dolunca worker tarafından alınır
+                    if not result['deleted'] and not result['skipped']:
+                        break
+            except Exception as e:
+                logger.exception(f"Dosya silme kuyruğu işlenemedi: {str(e)}")
+            finally:
+                close_old_connections()
+
+
+deletion_drainer = DeletionDrainer()
+
+
+def delete_storage_keys(keys, client=None, bucket=None):
+    """
+    En fazla 1000 anahtarı tek DeleteObjects isteğiyle siler.
+
+    Returns:
+        dict: Silinemeyen anahtar -> hata mesajı
+    """
+    try:
+        response = (client or s3_client()).delete_objects(
+            Bucket=bucket or default_storage.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+        )
+    except Exception as e:
+        logger.error(f"DeleteObjects isteği başarısız: {str(e)}")
+        return {key: str(e) for key in keys}
+
+    # Quiet modda yanıtta sadece hatalar döner; olmayan anahtar hata sayılmaz
+    return {
+        error.get('Key'): f"{error.get('Code')}: {error.get('Message')}"
+        for error in response.get('Errors', [])
+    }
@@ -0,0 +1,133 @@
+import logging
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import (
+    HttpResponse,
+    HttpResponseNotFound,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=\d*-\d*$')
+
+
+def s3_client():
+    """Storage'ın (thread başına) boto3 istemcisi; bağlantı havuzunu paylaşır"""
+    return default_storage.connection.meta.client
+
+
+def storage_key(name):
+    """FileField adını bucket içindeki nesne anahtarına çevir (AWS_LOCATION öneki dahil)"""
+    return default_storage._normalize_name(name)
+
+
+def storage_name(key):
+    """storage_key'in tersi: bucket anahtarından FileField adını üret"""
+    location = default_storage.location.strip('/')
+    if location and key.startswith(f'{location}/'):
+        return key[len(location) + 1:]
+    return key
+
+
+def iter_body(body, chunk_size, label=None):
+    """S3 yanıt gövdesini parça parça okur; istemci bağlantıyı keserse gövdeyi kapatır"""
+    started = time.monotonic()
+    sent = 0
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            sent += len(chunk)
+            yield chunk
+    finally:
+        body.close()
+        if label:
+            logger.debug(f"İndirme tamamlandı: {label} {sent} bayt ({(time.monotonic() - started) * 1000:.0f} ms)")
+
+
+async def aiter_chunks(chunks, thread_sensitive=False):
+    """
+    Senkron parça üreticisini async olarak tüketir. ASGI altında senkron iteratörler
+    yanıt başlamadan tamamen belleğe okunur; burada her parça ayrı thread'de okunur.
+    Veritabanı imleci tutan üreticiler thread_sensitive=True ile aynı thread'de kalmalı.
+    """
+    iterator = iter(chunks)
+    read = sync_to_async(next, thread_sensitive=thread_sensitive)
+    done = object()
+    try:
+        while (chunk := await read(iterator, done)) is not done:
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close:
+            await sync_to_async(close, thread_sensitive=thread_sensitive)()
+
+
+def presigned_url(name, filename, expires_in=None):
+    return s3_client().generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': default_storage.bucket_name,
+            'Key': storage_key(name),
+            'ResponseContentDisposition': f'attachment; filename="{filename}"',
+        },
+        ExpiresIn=expires_in or settings.DOCUMENT_DOWNLOAD['PRESIGNED_EXPIRY'],
+    )
+
+
+def file_download_response(request, name, filename):
+    """
+    Dosyayı sunucuda biriktirmeden storage'dan parça parça aktarır.
+    Range (tek aralık) ve If-None-Match desteklenir. mode=redirect ile (veya ayarda
+    MODE='redirect' ise) kısa ömürlü imzalı URL'ye yönlendirir.
+    """
+    config = settings.DOCUMENT_DOWNLOAD
+    if request.GET.get('mode', config['MODE']) == 'redirect':
+        return HttpResponseRedirect(presigned_url(name, filename))
+
+    params = {'Bucket': default_storage.bucket_name, 'Key': storage_key(name)}
+    range_header = request.headers.get('Range')
+    if range_header and RANGE_RE.match(range_header):
+        params['Range'] = range_header
+    if request.headers.get('If-None-Match'):
+        params['IfNoneMatch'] = request.headers['If-None-Match']
+
+    try:
+        obj = s3_client().get_object(**params)
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code')
+        http_status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if http_status == 304 or code in ('304', 'NotModified'):
+            response = HttpResponseNotModified()
+            response['ETag'] = request.headers['If-None-Match']
+            return response
+        if code == 'InvalidRange':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{default_storage.size(name)}"
+            return response
+        if code in ('NoSuchKey', '404'):
+            return HttpResponseNotFound()
+        raise
+
+    response = StreamingHttpResponse(
+        aiter_chunks(iter_body(obj['Body'], config['CHUNK_SIZE'], label=name)),
+        status=206 if obj.get('ContentRange') else 200,
+        content_type=obj.get('ContentType') or 'application/octet-stream',
+    )
+    response['Content-Length'] = obj['ContentLength']
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if obj.get('ContentRange'):
+        response['Content-Range'] = obj['ContentRange']
+    if obj.get('ETag'):
+        response['ETag'] = obj['ETag']
+    if obj.get('LastModified'):
+        response['Last-Modified'] = obj['LastModified'].strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return response
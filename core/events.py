@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def user_group_name(user_id):
+    return f'user_{user_id}'
+
+
+def send_user_events(events):
+    """
+    Kullanıcı olay kanallarına (ws/events/) toplu gönderim yapar.
+
+    Args:
+        events: (user_id, event, data) listesi
+    """
+    if not events:
+        return
+    try:
+        async_to_sync(_group_send_all)(events)
+    except Exception as e:
+        # Canlı olay iletilemezse istemci bir sonraki listelemede durumu zaten görür
+        logger.error(f"Kullanıcı olayı gönderilemedi: {str(e)}")
+
+
+async def _group_send_all(events):
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(
+        channel_layer.group_send(user_group_name(user_id), {
+            'type': 'user_event',
+            'event': event,
+            'data': data,
+        })
+        for user_id, event, data in events
+    ))
+
+
+def document_event_recipients(client_ids):
+    """Belgeyi yükleyen kullanıcı ve müşterisi olduğu büroların sahipleri (müşteri id -> alıcılar)"""
+    from .models import AccountingFirm
+
+    recipients = {client_id: {client_id} for client_id in client_ids}
+    for client_id, owner_id in AccountingFirm.objects.filter(
+        clients__in=recipients
+    ).values_list('clients', 'owner_id'):
+        recipients[client_id].add(owner_id)
+    return recipients
+
+
+def notify_document_events(documents, event):
+    """
+    Güncel belgeleri ilgili kullanıcılara transaction commit olduktan sonra tek seferde gönderir.
+
+    Args:
+        documents: Güncellenen Document'lar
+        event: 'document.analyzed', 'document.analysis_failed' veya 'document.status_changed'
+    """
+    from .serializers import DocumentSerializer
+
+    documents = list(documents)
+    if not documents:
+        return
+    recipients = document_event_recipients({document.uploaded_by_id for document in documents})
+    events = []
+    for document, data in zip(documents, DocumentSerializer(documents, many=True).data):
+        data = dict(data)
+        events.extend((user_id, event, data) for user_id in recipients[document.uploaded_by_id])
+    transaction.on_commit(lambda: send_user_events(events))
+
+
+def notify_document_event(document, event):
+    notify_document_events([document], event)
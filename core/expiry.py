@@ -0,0 +1,161 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import AccountingFirm, ClientDocument, ExpiryNotice, User
+from .utils import send_email_via_smtp2go
+
+logger = logging.getLogger(__name__)
+
+
+def expiring_documents(days, today=None, notify_clients=True):
+    """
+    Süresi `days` gün içinde dolacak (veya dolmuş) ve henüz bildirilmemiş aktif belgeler.
+    clientdoc_active_expiry_idx üzerinde tek aralık taraması yapar. Müşterilere
+    bildirim kapalıysa bürosu olmayan müşterilerin belgeleri alıcısız kalacağından
+    taramaya alınmaz.
+    """
+    today = today or timezone.localdate()
+    documents = ClientDocument.objects.filter(
+        is_active=True,
+        expiry_date__isnull=False,
+        expiry_date__lte=today + timedelta(days=days),
+        expiry_notified_at__isnull=True,
+    )
+    if not notify_clients:
+        documents = documents.filter(
+            Exists(AccountingFirm.clients.through.objects.filter(user_id=OuterRef('client_id')))
+        )
+    return documents.select_related('client').order_by('expiry_date', 'id')
+
+
+def group_by_recipient(documents, notify_clients=True):
+    """
+    Belgeleri alıcıya göre grupla: muhasebeciye müşterilerinin, müşteriye kendi belgeleri.
+
+    Returns:
+        dict: alıcı id -> {müşteri id -> belge listesi}
+    """
+    by_client = defaultdict(list)
+    for document in documents:
+        by_client[document.client_id].append(document)
+
+    grouped = defaultdict(dict)
+    # Tüm müşterilerin büro sahipleri tek sorguda
+    for client_id, owner_id in AccountingFirm.objects.filter(
+        clients__in=by_client
+    ).values_list('clients', 'owner_id').distinct():
+        grouped[owner_id][client_id] = by_client[client_id]
+    if notify_clients:
+        for client_id, client_documents in by_client.items():
+            grouped[client_id][client_id] = client_documents
+    return grouped
+
+
+def send_expiry_digests(days=None, dry_run=False):
+    """
+    Süresi yaklaşan belgeler için alıcı başına tek özet emaili gönderir.
+    Gönderim alıcı başına ExpiryNotice ile kaydedilir; bir alıcıya gönderim
+    başarısız olursa sonraki çalışmada yalnızca o alıcıya tekrar gönderilir.
+    Belge, en az bir aktif alıcısı olup hepsine gönderildiğinde bildirilmiş sayılır.
+
+    Returns:
+        dict: gönderilen email ve bildirilmiş sayılan belge sayıları
+    """
+    config = settings.CLIENT_DOCUMENT_EXPIRY
+    days = config['DAYS_AHEAD'] if days is None else days
+    today = timezone.localdate()
+
+    documents = list(
+        expiring_documents(days, today, config['NOTIFY_CLIENTS'])[:config['MAX_DOCUMENTS_PER_RUN']]
+    )
+    if not documents:
+        return {'emails': 0, 'documents': 0}
+
+    grouped = group_by_recipient(documents, config['NOTIFY_CLIENTS'])
+    recipients = User.objects.in_bulk(list(grouped))
+    clients = {document.client_id: document.client for document in documents}
+    # Önceki çalışmalarda gönderimi tamamlanmış (belge, alıcı) çiftleri
+    delivered = set(ExpiryNotice.objects.filter(
+        document__in=documents
+    ).values_list('document_id', 'recipient_id'))
+
+    pending = defaultdict(set)
+    emails = 0
+    for recipient_id, by_client in grouped.items():
+        recipient = recipients.get(recipient_id)
+        if recipient is None or not recipient.is_active:
+            continue
+        unsent = {}
+        for client_id, client_documents in by_client.items():
+            client_unsent = [
+                document for document in client_documents
+                if (document.id, recipient_id) not in delivered
+            ]
+            if client_unsent:
+                unsent[client_id] = client_unsent
+            for document in client_documents:
+                pending[document.id].add(recipient_id)
+        if not unsent:
+            continue
+        sent = [
+            (document.id, recipient_id)
+            for client_documents in unsent.values() for document in client_documents
+        ]
+        if dry_run:
+            emails += 1
+            delivered.update(sent)
+            continue
+        try:
+            _send_digest(recipient, unsent, clients, days, today)
+        except Exception as e:
+            # Bu alıcıya gönderilemeyen belgeler bir sonraki çalışmada tekrar denenir
+            logger.error(f"Belge süresi özeti gönderilemedi ({recipient.email}): {str(e)}")
+            continue
+        emails += 1
+        ExpiryNotice.objects.bulk_create([
+            ExpiryNotice(document_id=document_id, recipient_id=recipient_id)
+            for document_id, recipient_id in sent
+        ], ignore_conflicts=True)
+        delivered.update(sent)
+
+    # Hiç aktif alıcısı olmayan belge bildirilmiş sayılmaz
+    notified_ids = [
+        document_id for document_id, recipient_ids in pending.items()
+        if all((document_id, recipient_id) in delivered for recipient_id in recipient_ids)
+    ]
+    if not dry_run:
+        ClientDocument.objects.filter(id__in=notified_ids).update(expiry_notified_at=timezone.now())
+    return {'emails': emails, 'documents': len(notified_ids)}
+
+
+def _send_digest(recipient, by_client, clients, days, today):
+    groups = [
+        {'client': clients[client_id], 'documents': documents}
+        for client_id, documents in sorted(
+            by_client.items(), key=lambda item: item[1][0].expiry_date
+        )
+    ]
+    total_count = sum(len(group['documents']) for group in groups)
+    html_message = render_to_string('emails/expiring_documents.html', {
+        'user': recipient,
+        'groups': groups,
+        # Müşteriye giden özette müşteri başlığı gereksiz
+        'show_clients': recipient.user_type == 'accountant',
+        'total_count': total_count,
+        'days': days,
+        'today': today,
+        'frontend_url': settings.FRONTEND_URL,
+    })
+    send_email_via_smtp2go(
+        to_list=recipient.email,
+        subject=f"Çek Fişi - Süresi dolan {total_count} belge",
+        html_body=html_message,
+        text_body=strip_tags(html_message)
+    )
@@ -0,0 +1,203 @@
+import csv
+import io
+import logging
+import re
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .downloads import s3_client, storage_key
+from .receipts import parse_decimal
+from .zipstream import iter_zip, prefetch
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_HEADER = [
+    'dosya', 'kaynak', 'belge_turu', 'baslik_satici', 'tarih', 'tutar', 'kdv_orani', 'kdv_tutari', 'durum',
+]
+
+
+# Excel/LibreOffice bu karakterlerle başlayan hücreyi formül olarak çalıştırır
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    """
+    CSV hücresi. Metin, fiş analizinden veya kullanıcıdan gelebilir; formül olarak
+    yorumlanmasın diye başına ' eklenir. Sayılar (negatif tutarlar dahil) olduğu gibi kalır.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def _extension(name):
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else 'bin'
+
+
+def _safe(text):
+    return re.sub(r'[^\w\-]+', '_', text or '', flags=re.UNICODE).strip('_')[:60] or 'belge'
+
+
+def document_arcname(document):
+    return f"belgeler/{document.date}_{document.document_type}_{document.id}.{_extension(document.file.name)}"
+
+
+def client_document_arcname(document):
+    return f"musteri_belgeleri/{_safe(document.title)}_{document.id}.{_extension(document.file.name)}"
+
+
+def vat_amount(amount, vat_rate):
+    """vat_rate analizde KDV / toplam * 100 olarak hesaplanır"""
+    if amount is None or vat_rate is None:
+        return None
+    return (amount * vat_rate / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def iter_manifest(documents, client_documents):
+    """Tutar ve KDV bilgilerini içeren CSV'yi satır satır üretir (Excel için UTF-8 BOM ile)"""
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    output.write('\ufeff')
+    writer.writerow(MANIFEST_HEADER)
+
+    for document in documents.iterator(chunk_size=500):
+        seller = document.analyzed_data.get('seller_name') if isinstance(document.analyzed_data, dict) else ''
+        writer.writerow([csv_cell(value) for value in [
+            document_arcname(document),
+            'document',
+            document.get_document_type_display(),
+            seller or '',
+            document.date,
+            document.amount if document.amount is not None else '',
+            document.vat_rate if document.vat_rate is not None else '',
+            vat_amount(document.amount, document.vat_rate) or '',
+            document.get_status_display(),
+        ]])
+        if output.tell() > 64 * 1024:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+
+    for document in client_documents.iterator(chunk_size=500):
+        writer.writerow([csv_cell(value) for value in [
+            client_document_arcname(document),
+            'client_document',
+            document.get_document_type_display(),
+            document.title,
+            document.created_at.date(),
+            '', '', '',
+            'Geçerli' if document.is_active else 'Geçersiz',
+        ]])
+
+    yield output.getvalue().encode('utf-8')
+
+
+DOCUMENT_EXPORT_HEADER = [
+    'belge_id', 'musteri', 'musteri_eposta', 'tarih', 'belge_turu', 'durum', 'satici',
+    'tutar', 'kdv_orani', 'kdv_tutari',
+    'kalem', 'kalem_kategori', 'kalem_miktar', 'kalem_birim_fiyat', 'kalem_tutar',
+]
+
+
+def iter_document_rows(documents, chunk_size):
+    """
+    Muhasebe programlarına aktarım için satırlar: fişin her kalemi ayrı satır,
+    kalemi olmayan belge tek satır. Belgeler sunucu taraflı imleçle parça parça okunur.
+    """
+    documents = documents.select_related('uploaded_by').only(
+        'id', 'date', 'document_type', 'status', 'amount', 'vat_rate', 'analyzed_data',
+        'uploaded_by__first_name', 'uploaded_by__last_name', 'uploaded_by__email',
+    )
+    for document in documents.iterator(chunk_size=chunk_size):
+        data = document.analyzed_data if isinstance(document.analyzed_data, dict) else {}
+        client = document.uploaded_by
+        base = [
+            document.id,
+            client.get_full_name() or client.email,
+            client.email,
+            document.date,
+            document.get_document_type_display(),
+            document.get_status_display(),
+            str(data.get('seller_name') or ''),
+            document.amount,
+            document.vat_rate,
+            vat_amount(document.amount, document.vat_rate),
+        ]
+        items = [item for item in data.get('items') or [] if isinstance(item, dict) and item.get('name')]
+        if not items:
+            yield base + [None] * 5
+            continue
+        for item in items:
+            quantity = parse_decimal(item.get('quantity'), '0.001')
+            unit_price = parse_decimal(item.get('unit_price'))
+            total_price = parse_decimal(item.get('total_price'))
+            if total_price is None and quantity is not None and unit_price is not None:
+                total_price = (quantity * unit_price).quantize(Decimal('0.01'))
+            yield base + [str(item['name']), item.get('category'), quantity, unit_price, total_price]
+
+
+def iter_csv(header, rows, chunk_size=64 * 1024):
+    """Satırları ';' ayraçlı CSV olarak parça parça üretir (Excel için UTF-8 BOM ile)"""
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    output.write('\ufeff')
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([csv_cell(value) for value in row])
+        if output.tell() >= chunk_size:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue().encode('utf-8')
+
+
+def _open_object(entry):
+    _, name = entry
+    body = s3_client().get_object(Bucket=default_storage.bucket_name, Key=storage_key(name))['Body']
+    try:
+        yield from body.iter_chunks(settings.DOCUMENT_DOWNLOAD['CHUNK_SIZE'])
+    finally:
+        body.close()
+
+
+def iter_client_export(documents, client_documents):
+    """
+    Belgeleri ve manifest'i tek ZIP akışı olarak üretir. Dosyalar storage'dan sınırlı
+    sayıda eşzamanlı okunur ve parçaları doğrudan arşive yazılır; hiçbir dosya diske
+    veya bütünüyle belleğe alınmaz. Okunamayan dosyalar arşive eklenmez, okuması yarıda
+    kalan dosyalar kesik olarak kalır; ikisi de sonundaki listede belirtilir.
+    """
+    config = settings.DOCUMENT_EXPORT
+    missing = []
+
+    def files():
+        for document in documents.only('id', 'date', 'document_type', 'file').iterator(chunk_size=500):
+            yield document_arcname(document), document.file.name
+        for document in client_documents.only('id', 'title', 'file').iterator(chunk_size=500):
+            yield client_document_arcname(document), document.file.name
+
+    def guarded(arcname, chunks):
+        """Başlığı yazılmış girdide okuma hatası arşivin tamamını bozmasın"""
+        try:
+            yield from chunks
+        except Exception as e:
+            logger.error(f"Dışa aktarımda dosya yarıda kaldı: {arcname}: {str(e)}")
+            missing.append(f'{arcname} (eksik - okuma yarıda kaldı)')
+
+    def entries():
+        yield 'manifest.csv', iter_manifest(documents, client_documents), True
+        fetched = prefetch(files(), _open_object, config['PREFETCH_WORKERS'], config['PREFETCH_CHUNKS'])
+        for (arcname, _), chunks in fetched:
+            if isinstance(chunks, Exception):
+                logger.error(f"Dışa aktarımda dosya okunamadı: {arcname}: {str(chunks)}")
+                missing.append(arcname)
+                continue
+            yield arcname, guarded(arcname, chunks), False
+        if missing:
+            yield 'eksik_dosyalar.txt', iter(['\n'.join(missing).encode('utf-8')]), True
+
+    return iter_zip(entries())
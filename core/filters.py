@@ -0,0 +1,113 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+from .models import ClientDocument, Document
+
+
+def date_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Tarih YYYY-AA-GG formatında olmalı'})
+    return parsed
+
+
+def month_param(params, name, default=None):
+    """YYYY-AA biçimindeki ayı ayın ilk günü olarak döndürür"""
+    value = params.get(name)
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise ValidationError({name: 'Ay YYYY-AA formatında olmalı'})
+
+
+def _decimal_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Sayı olmalı'})
+
+
+def choice_params(params, name, choices):
+    """Virgülle ayrılmış çoklu değer (status=pending,processing)"""
+    value = params.get(name)
+    if not value:
+        return None
+    values = value.split(',')
+    valid = {choice for choice, _ in choices}
+    invalid = [v for v in values if v not in valid]
+    if invalid:
+        raise ValidationError({name: f"Geçersiz değer: {', '.join(invalid)}"})
+    return values
+
+
+def filter_documents(queryset, params):
+    """
+    Belge listeleri ve dışa aktarımlar için ortak filtreler.
+    Query: status, document_type, analysis_status, client, date_from, date_to, amount_min, amount_max
+    """
+    statuses = choice_params(params, 'status', Document.STATUS_CHOICES)
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    document_types = choice_params(params, 'document_type', Document.DOCUMENT_TYPES)
+    if document_types:
+        queryset = queryset.filter(document_type__in=document_types)
+    analysis_statuses = choice_params(params, 'analysis_status', Document.ANALYSIS_STATUS_CHOICES)
+    if analysis_statuses:
+        queryset = queryset.filter(analysis_status__in=analysis_statuses)
+
+    if params.get('client'):
+        if not params['client'].isdigit():
+            raise ValidationError({'client': 'Geçersiz müşteri'})
+        queryset = queryset.filter(uploaded_by_id=params['client'])
+
+    date_from = date_param(params, 'date_from')
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    date_to = date_param(params, 'date_to')
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+
+    amount_min = _decimal_param(params, 'amount_min')
+    if amount_min is not None:
+        queryset = queryset.filter(amount__gte=amount_min)
+    amount_max = _decimal_param(params, 'amount_max')
+    if amount_max is not None:
+        queryset = queryset.filter(amount__lte=amount_max)
+    return queryset
+
+
+def filter_client_documents(queryset, params):
+    """Query: document_type, is_active, created_from, created_to"""
+    document_types = choice_params(params, 'document_type', ClientDocument.DOCUMENT_TYPES)
+    if document_types:
+        queryset = queryset.filter(document_type__in=document_types)
+    if params.get('is_active') in ('true', 'false'):
+        queryset = queryset.filter(is_active=params['is_active'] == 'true')
+
+    # created_at__date yerine zaman aralığı; böylece created_at indeksi kullanılabilir
+    created_from = date_param(params, 'created_from')
+    if created_from:
+        queryset = queryset.filter(created_at__gte=_day_start(created_from))
+    created_to = date_param(params, 'created_to')
+    if created_to:
+        queryset = queryset.filter(created_at__lt=_day_start(created_to + timedelta(days=1)))
+    return queryset
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
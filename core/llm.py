@@ -0,0 +1,232 @@
+import json
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """Tekrar denenmemesi gereken model hatası (geçersiz istek, yetki vb.)"""
+
+
+class RetryableLLMError(LLMError):
+    """Geçici hata (429, 5xx, zaman aşımı, bağlantı)"""
+
+
+class CircuitOpenError(LLMError):
+    """Servis kesintisi sırasında çağrı yapılmadan hızlıca döner"""
+
+
+class CircuitBreaker:
+    """Art arda geçici hatalardan sonra belirli bir süre çağrıları keser"""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                raise CircuitOpenError('Analiz servisi geçici olarak devre dışı')
+            # Yarı açık: tek bir deneme çağrısına izin ver
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        """Deneme çağrısı sonucu kaydedilmeden (beklenmedik hata) bittiyse yeni denemeye izin ver"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"Analiz servisi devre kesici açıldı ({self._failures} hata)")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class OpenAIBackend:
+    def complete(self, messages, max_tokens, timeout):
+        import openai
+
+        try:
+            response = openai.ChatCompletion.create(
+                api_key=settings.OPENAI_API_KEY,
+                model=settings.RECEIPT_ANALYSIS_CLIENT['MODEL'],
+                messages=messages,
+                max_tokens=max_tokens,
+                request_timeout=timeout
+            )
+        except (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+            openai.error.TryAgain,
+        ) as e:
+            raise RetryableLLMError(str(e)) from e
+        except openai.error.APIError as e:
+            if e.http_status is None or e.http_status >= 500:
+                raise RetryableLLMError(str(e)) from e
+            raise LLMError(str(e)) from e
+        except openai.error.OpenAIError as e:
+            raise LLMError(str(e)) from e
+
+        usage = response.get('usage') or {}
+        return response.choices[0].message['content'], {
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+        }
+
+
+class FakeBackend:
+    """
+    Test ve benchmark için ağa çıkmadan sabit fiş verisi döndürür.
+    İstemde 'Receipt <id>' etiketleri varsa toplu yanıt (JSON dizi) üretir.
+    """
+
+    def complete(self, messages, max_tokens, timeout):
+        time.sleep(settings.RECEIPT_ANALYSIS_CLIENT['FAKE_LATENCY'])
+        texts = [
+            part['text']
+            for message in messages
+            for part in message['content']
+            if part.get('type') == 'text'
+        ]
+        receipt_ids = [
+            int(match.group(1))
+            for text in texts
+            for match in [re.fullmatch(r'Receipt (\d+)', text)]
+            if match
+        ]
+        if receipt_ids:
+            content = json.dumps([dict(self.receipt(), receipt_id=i) for i in receipt_ids])
+        else:
+            content = json.dumps(self.receipt())
+        return content, {'prompt_tokens': 0, 'completion_tokens': 0}
+
+    @staticmethod
+    def receipt():
+        return {
+            'seller_name': 'Test Market',
+            'date': '2024-01-01',
+            'total_amount': 118.0,
+            'vat_amount': 18.0,
+            'category': 'grocery',
+            'items': [{'name': 'Test Ürün', 'quantity': 1, 'unit_price': 118.0, 'category': 'grocery'}],
+        }
+
+
+ANALYSIS_BACKENDS = {
+    'openai': OpenAIBackend,
+    'fake': FakeBackend,
+}
+
+
+class AnalysisClient:
+    """
+    Süreç genelinde eşzamanlılığı sınırlayan ve kesinti sırasında devre kesiciyle
+    hızlıca hata dönen model istemcisi. Tekrar deneme yapmaz; geçici hatalar
+    (RetryableLLMError, CircuitOpenError) analiz kuyruğunda bekleme ile tekrar denenir.
+    """
+
+    def __init__(self, backend, config):
+        self.backend = backend
+        self.config = config
+        self.semaphore = threading.BoundedSemaphore(config['MAX_CONCURRENCY'])
+        self.breaker = CircuitBreaker(
+            config['CIRCUIT_FAILURE_THRESHOLD'], config['CIRCUIT_RESET_TIMEOUT']
+        )
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'failures': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'latency_ms': 0.0,
+        }
+
+    def complete(self, messages, max_tokens):
+        """
+        Returns:
+            str: Model yanıt metni
+        """
+        self.breaker.before_call()
+        started = time.monotonic()
+        try:
+            with self.semaphore:
+                text, usage = self.backend.complete(messages, max_tokens, self.config['TIMEOUT'])
+        except RetryableLLMError:
+            self.breaker.record_failure()
+            self._record(started, failed=True)
+            raise
+        except LLMError:
+            # İstemci hatası servis kesintisi sayılmaz
+            self.breaker.record_success()
+            self._record(started, failed=True)
+            raise
+        except Exception:
+            self._record(started, failed=True)
+            raise
+        finally:
+            # Yarı açık durumdaki deneme hangi hatayla biterse bitsin kilitli kalmasın
+            self.breaker.release_probe()
+        self.breaker.record_success()
+        self._record(started, usage=usage)
+        return text
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot['circuit'] = self.breaker.state
+        snapshot['avg_latency_ms'] = snapshot['latency_ms'] / snapshot['calls'] if snapshot['calls'] else 0
+        return snapshot
+
+    def _record(self, started, usage=None, failed=False):
+        with self._stats_lock:
+            self._stats['calls'] += 1
+            self._stats['latency_ms'] += (time.monotonic() - started) * 1000
+            if failed:
+                self._stats['failures'] += 1
+            if usage:
+                self._stats['prompt_tokens'] += usage['prompt_tokens']
+                self._stats['completion_tokens'] += usage['completion_tokens']
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_analysis_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = settings.RECEIPT_ANALYSIS_CLIENT
+            _client = AnalysisClient(ANALYSIS_BACKENDS[config['BACKEND']](), config)
+        return _client
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Document, ReceiptLineItem, ReceiptSeller
+from core.receipts import build_receipt_rows
+
+
+class Command(BaseCommand):
+    help = 'Mevcut analyzed_data kayıtlarından ReceiptSeller ve ReceiptLineItem tablolarını doldurur'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Tek seferde işlenecek belge sayısı')
+        parser.add_argument('--rebuild', action='store_true', help='Tabloya yazılmış belgeleri de yeniden oluştur')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(analyzed_data__isnull=False).only(
+            'id', 'uploaded_by_id', 'analyzed_data'
+        ).order_by('id')
+        if not options['rebuild']:
+            documents = documents.filter(receipt_seller__isnull=True)
+
+        last_id = 0
+        sellers_created = items_created = 0
+        while True:
+            batch = list(documents.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            rows = [build_receipt_rows(document) for document in batch]
+            rows = [(seller, items) for seller, items in rows if seller is not None]
+            with transaction.atomic():
+                if options['rebuild']:
+                    ReceiptSeller.objects.filter(document_id__in=[d.id for d in batch]).delete()
+                # PostgreSQL bulk_create sonrası birincil anahtarları döndürür
+                sellers = ReceiptSeller.objects.bulk_create([seller for seller, _ in rows])
+                line_items = []
+                for seller, (_, items) in zip(sellers, rows):
+                    for item in items:
+                        item.receipt = seller
+                        line_items.append(item)
+                ReceiptLineItem.objects.bulk_create(line_items)
+
+            sellers_created += len(sellers)
+            items_created += len(line_items)
+            self.stdout.write(f"id <= {last_id}: {sellers_created} fiş, {items_created} kalem")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{sellers_created} fiş ve {items_created} kalem satırı oluşturuldu"
+        ))
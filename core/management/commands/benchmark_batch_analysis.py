@@ -0,0 +1,89 @@
+import io
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from core.llm import get_analysis_client
+from core.models import Document, User
+from core.tasks import AnalysisJob, run_analysis_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Fiş analiz işlerini yerel model taklidine (fake backend) karşı tekil ve toplu '
+        'çalıştırıp toplam süreyi ölçer; oluşturulan kayıtlar geri alınır'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=100, help='Analiz edilecek fiş sayısı')
+        parser.add_argument('--batch-size', type=int, action='append', dest='batch_sizes',
+                            help='Karşılaştırılacak toplu iş boyutu (tekrarlanabilir; varsayılan: 1 ve ayar değeri)')
+
+    def handle(self, *args, **options):
+        if settings.RECEIPT_ANALYSIS_CLIENT['BACKEND'] != 'fake':
+            raise CommandError('Benchmark sadece fake backend ile çalışır: RECEIPT_ANALYSIS_BACKEND=fake')
+
+        receipts = options['receipts']
+        batch_sizes = options['batch_sizes'] or sorted({1, settings.RECEIPT_ANALYSIS['BATCH_SIZE']})
+        image_data = self.sample_receipt()
+        self.stdout.write(
+            f"{receipts} fiş, model gecikmesi {settings.RECEIPT_ANALYSIS_CLIENT['FAKE_LATENCY'] * 1000:.0f} ms, "
+            f"görsel {len(image_data)} bayt"
+        )
+        self.stdout.write(f"{'toplu boyut':<12}{'süre (s)':>10}{'ms/fiş':>10}{'model çağrısı':>15}{'tamamlanan':>12}")
+        for batch_size in batch_sizes:
+            result = self.measure(receipts, batch_size, image_data)
+            self.stdout.write(
+                f"{batch_size:<12}{result['elapsed']:>10.2f}{result['elapsed'] / receipts * 1000:>10.1f}"
+                f"{result['calls']:>15}{result['completed']:>12}"
+            )
+
+    def measure(self, receipts, batch_size, image_data):
+        """Kuyruk işçisinin yaptığı gibi run_analysis_jobs'u batch_size'lık gruplarla çağırır"""
+        client = get_analysis_client()
+        with transaction.atomic():
+            user = User.objects.create_user(f'benchmark-{uuid.uuid4().hex}@example.com', user_type='client')
+            documents = Document.objects.bulk_create([
+                Document(
+                    uploaded_by=user,
+                    document_type='receipt',
+                    file=f'benchmark/{index}.jpg',
+                    date=timezone.localdate(),
+                    analysis_status='pending',
+                )
+                for index in range(receipts)
+            ])
+            jobs = [AnalysisJob(document_id=document.id, image_data=image_data) for document in documents]
+
+            calls_before = client.stats()['calls']
+            with override_settings(RECEIPT_ANALYSIS={**settings.RECEIPT_ANALYSIS, 'BATCH_SIZE': batch_size}):
+                started = time.perf_counter()
+                for start in range(0, len(jobs), batch_size):
+                    run_analysis_jobs(jobs[start:start + batch_size])
+                elapsed = time.perf_counter() - started
+
+            result = {
+                'elapsed': elapsed,
+                'calls': client.stats()['calls'] - calls_before,
+                'completed': Document.objects.filter(
+                    id__in=[document.id for document in documents], analysis_status='completed'
+                ).count(),
+            }
+            transaction.set_rollback(True)
+        return result
+
+    def sample_receipt(self):
+        """Telefon fotoğrafı boyutlarında basit bir fiş görseli"""
+        image = Image.new('RGB', (1536, 2048), 'white')
+        draw = ImageDraw.Draw(image)
+        for line in range(60):
+            draw.text((120, 80 + line * 30), f'URUN {line:02d} ........ {line * 3.5:8.2f} TL', fill='black')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
@@ -0,0 +1,100 @@
+import asyncio
+import io
+import time
+import tracemalloc
+from unittest import mock
+
+from botocore.response import StreamingBody
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory
+
+from core import downloads
+
+
+class SlowObject(io.RawIOBase):
+    """Ağdan okunuyormuş gibi her okumada bekleyen S3 nesne gövdesi taklidi"""
+
+    def __init__(self, size, latency):
+        self.remaining = size
+        self.latency = latency
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.remaining:
+            return 0
+        time.sleep(self.latency)
+        count = min(len(buffer), self.remaining)
+        buffer[:count] = b'x' * count
+        self.remaining -= count
+        return count
+
+
+class LocalS3Client:
+    def __init__(self, size, latency):
+        self.size = size
+        self.latency = latency
+
+    def get_object(self, **params):
+        return {
+            'Body': StreamingBody(io.BufferedReader(SlowObject(self.size, self.latency)), self.size),
+            'ContentLength': self.size,
+            'ContentType': 'application/pdf',
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Belge indirmenin ASGI altında ilk bayta kadar geçen süresini (TTFB) ve en yüksek bellek '
+        'kullanımını yerel S3 taklidine karşı senkron ve async parça aktarımıyla karşılaştırır'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20, help='Nesne boyutu (MB)')
+        parser.add_argument('--latency', type=float, default=2, help='Parça başına okuma gecikmesi (ms)')
+
+    def handle(self, *args, **options):
+        size = options['size'] * 1024 * 1024
+        client = LocalS3Client(size, options['latency'] / 1000)
+        self.stdout.write(
+            f"{options['size']} MB nesne, {settings.DOCUMENT_DOWNLOAD['CHUNK_SIZE'] // 1024} KB parça, "
+            f"parça başına {options['latency']:g} ms"
+        )
+        self.stdout.write(f"{'aktarım':<10}{'TTFB (ms)':>12}{'toplam (ms)':>14}{'en yüksek bellek (MB)':>24}")
+        with mock.patch.object(downloads, 's3_client', return_value=client), \
+                mock.patch.object(downloads, 'storage_key', side_effect=lambda name: name), \
+                mock.patch.object(downloads, 'default_storage', mock.Mock(bucket_name='benchmark')):
+            for mode in ('senkron', 'async'):
+                result = asyncio.run(self.measure(mode, client))
+                self.stdout.write(
+                    f"{mode:<10}{result['ttfb'] * 1000:>12.0f}{result['elapsed'] * 1000:>14.0f}"
+                    f"{result['peak'] / 1024 / 1024:>24.1f}"
+                )
+
+    async def measure(self, mode, client):
+        """Yanıtı Django'nun ASGI işleyicisinin gönderdiği gibi gönderir"""
+        request = RequestFactory().get('/download/', {'mode': 'stream'})
+        if mode == 'async':
+            response = downloads.file_download_response(request, 'belge.pdf', 'belge.pdf')
+        else:
+            # Değişiklik öncesi davranış: senkron iteratör
+            body = client.get_object()['Body']
+            response = StreamingHttpResponse(downloads.iter_body(body, settings.DOCUMENT_DOWNLOAD['CHUNK_SIZE']))
+
+        result = {'ttfb': None}
+
+        async def send(message):
+            if message.get('body') and result['ttfb'] is None:
+                result['ttfb'] = time.perf_counter() - started
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        await ASGIHandler().send_response(response, send)
+        result['elapsed'] = time.perf_counter() - started
+        result['peak'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result
@@ -0,0 +1,70 @@
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw
+
+from core.analysis import image_content
+from core.receipt_images import preprocess_receipt
+
+
+class Command(BaseCommand):
+    help = (
+        'Fiş ön işlemenin modele gönderilen istek boyutuna ve süresine etkisini örnek dosyalarla '
+        'ölçer: ham dosya (önceki davranış) ile ön işlenmiş sayfalar karşılaştırılır'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Her örnek için tekrar sayısı')
+        parser.add_argument('--uplink-mbps', type=float, default=20,
+                            help='İstek gövdesinin yükleme süresi tahmini için bağlantı hızı (Mbit/s)')
+
+    def handle(self, *args, **options):
+        uplink = options['uplink_mbps'] * 1_000_000 / 8
+        # İlk çağrı işlem havuzunu başlatır; ölçüme dahil edilmez
+        preprocess_receipt(self.photo((400, 300)))
+
+        self.stdout.write(
+            f"{'örnek':<22}{'ham istek (KB)':>16}{'işlenmiş (KB)':>15}{'ön işleme (ms)':>16}"
+            f"{'yükleme önce (ms)':>19}{'sonra (ms)':>12}"
+        )
+        for name, data in self.samples():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                pages = preprocess_receipt(data)
+                timings.append(time.perf_counter() - started)
+            before = self.request_bytes([data])
+            after = self.request_bytes(pages)
+            self.stdout.write(
+                f"{name:<22}{before / 1024:>16.0f}{after / 1024:>15.0f}{min(timings) * 1000:>16.0f}"
+                f"{before / uplink * 1000:>19.0f}{(after / uplink + min(timings)) * 1000:>12.0f}"
+            )
+
+    def request_bytes(self, pages):
+        """Sayfaların model isteğindeki JSON (base64) boyutu"""
+        return len(json.dumps([image_content(page) for page in pages]).encode('utf-8'))
+
+    def samples(self):
+        yield 'telefon JPEG 4000x3000', self.photo((4000, 3000))
+        yield 'ekran PNG 1170x2532', self.photo((1170, 2532), image_format='PNG')
+        yield 'PDF 2 sayfa', self.pdf()
+
+    def photo(self, size, image_format='JPEG'):
+        image = Image.new('RGB', size, 'white')
+        draw = ImageDraw.Draw(image)
+        for line in range(size[1] // 40):
+            draw.text((size[0] // 10, 20 + line * 40), f'URUN {line:03d} ...... {line * 3.5:8.2f} TL', fill='black')
+        # Kamera gürültüsü olmadan JPEG gerçekçi olmayan ölçüde küçük kalır
+        noise = Image.effect_noise(size, 24).convert('RGB')
+        image = Image.blend(image, noise, 0.15)
+        output = io.BytesIO()
+        image.save(output, format=image_format, **({'quality': 95} if image_format == 'JPEG' else {}))
+        return output.getvalue()
+
+    def pdf(self):
+        pages = [Image.open(io.BytesIO(self.photo((1240, 1754)))) for _ in range(2)]
+        output = io.BytesIO()
+        pages[0].save(output, format='PDF', save_all=True, append_images=pages[1:], resolution=150)
+        return output.getvalue()
@@ -0,0 +1,137 @@
+import json
+import os
+from datetime import timedelta
+
+import boto3
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.deletions import delete_storage_keys, referenced_names
+from core.downloads import s3_client, storage_key, storage_name
+
+DEFAULT_PREFIXES = ['documents/', 'client_documents/', 'chat_files/', 'profile_images/']
+
+
+class Command(BaseCommand):
+    help = "Bucket'ta olup hiçbir kaydın kullanmadığı eski dosyaları bulur ve siler"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', action='append', dest='prefixes',
+                            help='Taranacak önek (tekrarlanabilir; varsayılan: belge, müşteri belgesi, sohbet ve profil dosyaları)')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Bu kadar saatten yeni dosyalara dokunma (yüklemesi süren kayıtlar için)')
+        parser.add_argument('--page-size', type=int, default=1000, help='ListObjectsV2 sayfa boyutu (en fazla 1000)')
+        parser.add_argument('--checkpoint', default='.collect_orphaned_files.checkpoint',
+                            help='İlerlemenin kaydedileceği dosya')
+        parser.add_argument('--restart', action='store_true', help='Checkpoint dosyasını yok say, baştan başla')
+        parser.add_argument('--dry-run', action='store_true', help='Silme, sadece raporla')
+        parser.add_argument('--bucket', help='Bucket adı (varsayılan: storage ayarı)')
+        parser.add_argument('--endpoint-url', help='S3 uyumlu başka bir uç nokta (örn. yerel test sunucusu)')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['page_size'] <= 1000:
+            raise CommandError('--page-size 1 ile 1000 arasında olmalı')
+
+        client = self.get_client(options['endpoint_url'])
+        bucket = options['bucket'] or default_storage.bucket_name
+        prefixes = options['prefixes'] or DEFAULT_PREFIXES
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+
+        checkpoint = {} if options['restart'] or dry_run else self.load_checkpoint(options['checkpoint'])
+        if checkpoint.get('prefix') in prefixes:
+            prefixes = prefixes[prefixes.index(checkpoint['prefix']):]
+            self.stdout.write(f"{checkpoint['prefix']} içinde {checkpoint['start_after']} sonrasından devam ediliyor")
+
+        totals = {'scanned': 0, 'referenced': 0, 'recent': 0, 'orphaned': 0, 'failed': 0}
+        for prefix in prefixes:
+            start_after = checkpoint.get('start_after') if checkpoint.get('prefix') == prefix else None
+            scanned = orphaned = 0
+            for page in self.iter_pages(client, bucket, prefix, start_after, options['page_size']):
+                result = self.process_page(client, bucket, page, cutoff, dry_run)
+                for key, value in result.items():
+                    totals[key] += value
+                scanned += result['scanned']
+                orphaned += result['orphaned']
+                if not dry_run:
+                    self.save_checkpoint(options['checkpoint'], prefix, page[-1]['Key'])
+            self.stdout.write(f"{prefix}: {scanned} nesne tarandı, {orphaned} sahipsiz")
+
+        if not dry_run and os.path.exists(options['checkpoint']):
+            # Tarama tamamlandı; sonraki çalıştırma baştan başlasın
+            os.remove(options['checkpoint'])
+
+        action = 'silinecek' if dry_run else 'silindi'
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['scanned']} nesne: {totals['referenced']} kullanımda, {totals['recent']} bekleme süresinde, "
+            f"{totals['orphaned']} sahipsiz {action}, {totals['failed']} silinemedi"
+        ))
+
+    def get_client(self, endpoint_url):
+        if not endpoint_url:
+            return s3_client()
+        return boto3.session.Session().client(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_S3_REGION_NAME,
+        )
+
+    def iter_pages(self, client, bucket, prefix, start_after, page_size):
+        """Öneki sayfa sayfa listeler; her sayfa en fazla page_size nesne"""
+        params = {'Bucket': bucket, 'Prefix': storage_key(prefix), 'PaginationConfig': {'PageSize': page_size}}
+        if start_after:
+            params['StartAfter'] = start_after
+        for response in client.get_paginator('list_objects_v2').paginate(**params):
+            if response.get('Contents'):
+                yield response['Contents']
+
+    def process_page(self, client, bucket, objects, cutoff, dry_run):
+        names = {storage_name(obj['Key']): obj for obj in objects}
+        # Bir sayfadaki anahtarlar her model için tek IN sorgusuyla karşılaştırılır
+        unreferenced = set(names) - referenced_names(list(names))
+        orphans = [names[name]['Key'] for name in unreferenced if names[name]['LastModified'] < cutoff]
+
+        result = {
+            'scanned': len(objects),
+            'referenced': len(names) - len(unreferenced),
+            'recent': len(unreferenced) - len(orphans),
+            'orphaned': len(orphans),
+            'failed': 0,
+        }
+        if not orphans:
+            return result
+
+        if dry_run:
+            if self.verbosity > 1:
+                for key in sorted(orphans):
+                    self.stdout.write(f"  {key}")
+            return result
+
+        errors = delete_storage_keys(orphans, client=client, bucket=bucket)
+        for key, message in errors.items():
+            self.stderr.write(f"Silinemedi: {key}: {message}")
+        result['orphaned'] -= len(errors)
+        result['failed'] = len(errors)
+        return result
+
+    def load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return {}
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+
+    def save_checkpoint(self, path, prefix, start_after):
+        # Yarıda kesilirse bozuk dosya kalmasın
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump({
+                'prefix': prefix,
+                'start_after': start_after,
+                'updated_at': timezone.now().isoformat(),
+            }, checkpoint)
+        os.replace(tmp_path, path)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.deletions import drain_file_deletions
+
+
+class Command(BaseCommand):
+    help = 'Silinmeyi bekleyen storage dosyalarını toplu DeleteObjects istekleriyle siler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Sürekli çalış (worker olarak)')
+        parser.add_argument('--interval', type=float, default=10, help='Kuyruk boşken bekleme aralığı (saniye)')
+
+    def handle(self, *args, **options):
+        while True:
+            result = drain_file_deletions()
+            if any(result.values()):
+                self.stdout.write(
+                    f"{result['deleted']} dosya silindi, {result['skipped']} kullanımda olduğu için atlandı, "
+                    f"{result['failed']} tekrar denenecek"
+                )
+            busy = result['deleted'] + result['skipped'] + result['failed'] > 0
+            if not options['loop']:
+                # Tek seferlik çalıştırmada kuyruk boşalana kadar devam et
+                if busy:
+                    continue
+                break
+            if not busy:
+                time.sleep(options['interval'])
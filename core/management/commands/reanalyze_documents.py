@@ -0,0 +1,112 @@
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        'Analiz sonucu olmayan fişleri yeniden analiz için işaretler. Analizler web sürecindeki '
+        'kuyrukta (büro bazında adil sıra ve eşzamanlılık sınırlarıyla, toplu öncelikte) çalışır; '
+        'olaylar kullanıcılara oradan gider. Kaldığı yerden devam edebilir.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Tek UPDATE ile işaretlenecek belge sayısı')
+        parser.add_argument('--limit', type=int, default=0, help='En fazla işaretlenecek belge (0: hepsi)')
+        parser.add_argument('--older-than', type=int, default=60,
+                            help='Sadece bu kadar dakikadan eski belgeler (yeni yüklemelerle çakışmamak için)')
+        parser.add_argument('--checkpoint', default='.reanalyze_documents.checkpoint',
+                            help='İlerlemenin kaydedileceği dosya')
+        parser.add_argument('--restart', action='store_true', help='Checkpoint dosyasını yok say, baştan başla')
+        parser.add_argument('--dry-run', action='store_true', help='Sadece aday belgeleri say, işaretleme')
+        parser.add_argument('--wait', action='store_true', help='İşaretlenen belgelerin analizi bitene kadar ilerlemeyi göster')
+        parser.add_argument('--interval', type=float, default=30, help='--wait ile ilerleme raporu aralığı (saniye)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size en az 1 olmalı')
+
+        last_id = 0 if options['restart'] else self.load_checkpoint(options['checkpoint'])
+        now = timezone.now()
+        candidates = Document.objects.filter(
+            document_type='receipt',
+            analyzed_data__isnull=True,
+            created_at__lt=now - timedelta(minutes=options['older_than'])
+        ).exclude(file='').exclude(
+            # Bir sürecin kuyruğunda canlı olarak bekleyenlere dokunma
+            Q(analysis_status__in=('pending', 'processing')) & Q(analysis_lease_until__gte=now)
+        ).order_by('id')
+
+        total = candidates.filter(id__gt=last_id).count()
+        if options['limit']:
+            total = min(total, options['limit'])
+        self.stdout.write(f"{total} aday belge (id > {last_id})")
+        if options['dry_run'] or not total:
+            return
+
+        first_id = last_id
+        marked = 0
+        for ids in self.iter_chunks(candidates, last_id, options['chunk_size'], total):
+            # Kirasız "pending" belgeler web sürecindeki requeue döngüsü tarafından
+            # REQUEUE_BATCH'lik gruplar halinde toplu öncelikle kuyruğa alınır
+            marked += Document.objects.filter(id__in=ids).update(
+                analysis_status='pending', analysis_lease_until=None
+            )
+            last_id = ids[-1]
+            self.save_checkpoint(options['checkpoint'], last_id)
+        self.stdout.write(self.style.SUCCESS(f"{marked} belge analiz için işaretlendi, son id {last_id}"))
+
+        if options['wait']:
+            self.wait_for(first_id, last_id, options['interval'])
+
+    def iter_chunks(self, candidates, last_id, chunk_size, total):
+        """Aday id'lerini OFFSET yerine id > son id ile sayfalayarak getir"""
+        yielded = 0
+        while yielded < total:
+            ids = list(
+                candidates.filter(id__gt=last_id).values_list('id', flat=True)[:min(chunk_size, total - yielded)]
+            )
+            if not ids:
+                return
+            last_id = ids[-1]
+            yielded += len(ids)
+            yield ids
+
+    def wait_for(self, first_id, last_id, interval):
+        """İşaretlenen aralıktaki analizlerin bitmesini izler (web süreci çalışıyor olmalı)"""
+        marked = Document.objects.filter(document_type='receipt', id__gt=first_id, id__lte=last_id)
+        while True:
+            counts = dict(
+                marked.filter(analysis_status__in=('pending', 'processing', 'failed'))
+                .values_list('analysis_status')
+                .annotate(count=Count('id'))
+                .order_by()
+            )
+            waiting = counts.get('pending', 0) + counts.get('processing', 0)
+            self.stdout.write(
+                f"{counts.get('pending', 0)} bekliyor, {counts.get('processing', 0)} işleniyor, "
+                f"{counts.get('failed', 0)} başarısız"
+            )
+            if not waiting:
+                return
+            time.sleep(interval)
+
+    def load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return json.load(checkpoint)['last_id']
+
+    def save_checkpoint(self, path, last_id):
+        # Yarıda kesilirse bozuk dosya kalmasın
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump({'last_id': last_id, 'updated_at': timezone.now().isoformat()}, checkpoint)
+        os.replace(tmp_path, path)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Aylık tutar/KDV toplamlarını belgelerden yeniden oluşturur'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, action='append', help='Sadece bu müşteri(ler) (tekrarlanabilir)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tek seferde yazılacak satır sayısı')
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups(options['client'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{rows} aylık toplam satırı oluşturuldu"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.models import UserDocumentStats
+from core.stats import reconcile_firm_stats, reconcile_stats
+
+
+class Command(BaseCommand):
+    help = 'Kullanıcı ve büro belge sayaçlarını belgelerden yeniden hesaplayıp sapmaları düzeltir'
+
+    def handle(self, *args, **options):
+        # Sinyalleri atlayan toplu güncellemeler (queryset.update) sayaçları kaydırabilir
+        users = reconcile_stats(UserDocumentStats, 'user_id', 'uploaded_by')
+        firms = reconcile_firm_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"{users} kullanıcı ve {firms} büro sayacı düzeltildi"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.expiry import send_expiry_digests
+
+
+class Command(BaseCommand):
+    help = 'Süresi yaklaşan müşteri belgeleri için muhasebeci ve müşterilere özet emaili gönderir'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Kaç gün içinde süresi dolacak belgeler (varsayılan: ayar)')
+        parser.add_argument('--dry-run', action='store_true', help='Email gönderme, sadece say')
+
+    def handle(self, *args, **options):
+        result = send_expiry_digests(days=options['days'], dry_run=options['dry_run'])
+        action = 'gönderilecek' if options['dry_run'] else 'gönderildi'
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['emails']} özet emaili {action} ({result['documents']} belge)"
+        ))
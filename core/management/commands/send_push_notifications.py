@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.push import send_pending_push_notifications
+
+
+class Command(BaseCommand):
+    help = 'Bekleyen push bildirimlerini FCM multicast istekleriyle gönderir'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Sürekli çalış (worker olarak)')
+        parser.add_argument('--interval', type=float, default=5, help='Döngü aralığı (saniye)')
+
+    def handle(self, *args, **options):
+        while True:
+            result = send_pending_push_notifications()
+            if result['notifications']:
+                self.stdout.write(
+                    f"{result['notifications']} bildirim: {result['sent']} gönderildi, "
+                    f"{result['failed']} başarısız, {result['pruned']} token silindi"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
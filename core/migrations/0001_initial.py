@@ -0,0 +1,394 @@
+# Generated by Django 5.0.2 on 2026-10-19 06:27
+
+import core.models
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('user_type', models.CharField(choices=[('accountant', 'Muhasebeci'), ('client', 'Mükellef')], max_length=20)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('username', models.CharField(blank=True, max_length=150, null=True)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('otp', models.CharField(blank=True, max_length=6, null=True)),
+                ('otp_created_at', models.DateTimeField(blank=True, null=True)),
+                ('address', models.TextField(blank=True, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('district', models.CharField(blank=True, max_length=100, null=True)),
+                ('about', models.TextField(blank=True, null=True)),
+                ('experience_years', models.IntegerField(default=0)),
+                ('title', models.CharField(blank=True, max_length=100, null=True)),
+                ('company_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('website', models.URLField(blank=True, null=True)),
+                ('profile_image', models.ImageField(blank=True, null=True, upload_to='profile_images/')),
+                ('specializations', models.JSONField(blank=True, default=list)),
+                ('is_featured', models.BooleanField(default=False)),
+                ('rating', models.FloatField(default=0.0)),
+                ('review_count', models.IntegerField(default=0)),
+                ('tax_number', models.CharField(blank=True, max_length=11, null=True)),
+                ('identity_number', models.CharField(blank=True, max_length=11, null=True)),
+                ('company_type', models.CharField(blank=True, choices=[('individual', 'Şahıs'), ('limited', 'Limited Şirket'), ('incorporated', 'Anonim Şirket'), ('other', 'Diğer')], max_length=20, null=True)),
+                ('company_title', models.CharField(blank=True, max_length=255, null=True)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'Kullanıcı',
+                'verbose_name_plural': 'Kullanıcılar',
+                'db_table': 'users',
+            },
+        ),
+        migrations.CreateModel(
+            name='AccountingFirm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('clients', models.ManyToManyField(related_name='accounting_firms', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owned_firm', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('plate_number', models.CharField(max_length=2, unique=True)),
+            ],
+            options={
+                'verbose_name': 'İl',
+                'verbose_name_plural': 'İller',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SubscriptionPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('plan_type', models.CharField(choices=[('free', 'Ücretsiz'), ('trial', 'Deneme'), ('paid', 'Ücretli')], default='paid', max_length=20)),
+                ('base_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('base_client_limit', models.IntegerField()),
+                ('price_per_extra_client', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('description', models.TextField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('trial_days', models.IntegerField(default=0)),
+                ('analysis_weight', models.PositiveIntegerField(default=1)),
+                ('analysis_concurrency', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Vendor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('normalized_name', models.CharField(max_length=255, unique=True)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+                ('category', models.CharField(blank=True, max_length=50, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserDocumentStats',
+            fields=[
+                ('total', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='FirmDocumentStats',
+            fields=[
+                ('total', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('firm', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document_stats', serialize=False, to='core.accountingfirm')),
+                ('recent_document_ids', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ClientDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('document_type', models.CharField(choices=[('identity', 'Kimlik Fotokopisi'), ('signature', 'İmza Sirküleri'), ('tax', 'Vergi Levhası'), ('statement', 'Beyanname'), ('other', 'Diğer')], max_length=20)),
+                ('file', models.FileField(upload_to='client_documents/')),
+                ('content_hash', models.CharField(blank=True, db_index=True, max_length=64, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('expiry_notified_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Müşteri Belgesi',
+                'verbose_name_plural': 'Müşteri Belgeleri',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeviceToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255, unique=True)),
+                ('platform', models.CharField(choices=[('android', 'Android'), ('ios', 'iOS'), ('web', 'Web')], default='android', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='device_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='District',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='districts', to='core.city')),
+            ],
+            options={
+                'verbose_name': 'İlçe',
+                'verbose_name_plural': 'İlçeler',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(choices=[('invoice', 'Fatura'), ('receipt', 'Fiş'), ('contract', 'Sözleşme'), ('other', 'Diğer')], max_length=20)),
+                ('file', models.FileField(upload_to=core.models.document_file_path)),
+                ('date', models.DateField()),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('vat_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Beklemede'), ('processing', 'İşleniyor'), ('completed', 'Tamamlandı'), ('rejected', 'Reddedildi')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('analyzed_data', models.JSONField(blank=True, null=True)),
+                ('analysis_status', models.CharField(blank=True, choices=[('pending', 'Analiz Bekliyor'), ('processing', 'Analiz Ediliyor'), ('completed', 'Analiz Tamamlandı'), ('failed', 'Analiz Başarısız')], max_length=20, null=True)),
+                ('analysis_lease_until', models.DateTimeField(blank=True, null=True)),
+                ('content_hash', models.CharField(blank=True, db_index=True, max_length=64, null=True)),
+                ('perceptual_hash', models.CharField(blank=True, max_length=16, null=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='core.document')),
+                ('processed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='processed_documents', to=settings.AUTH_USER_MODEL)),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploaded_documents', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpiryNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expiry_notices', to='core.clientdocument')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expiry_notices', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MonthlyDocumentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('document_type', models.CharField(choices=[('invoice', 'Fatura'), ('receipt', 'Fiş'), ('contract', 'Sözleşme'), ('other', 'Diğer')], max_length=20)),
+                ('vat_rate', models.DecimalField(decimal_places=2, default=Decimal('-1.00'), max_digits=5)),
+                ('document_count', models.IntegerField(default=0)),
+                ('amount_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vat_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PendingFileDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['next_attempt_at', 'id'], name='core_pendin_next_at_46fe6b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PushNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collapse_key', models.CharField(max_length=100)),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('count', models.IntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_push_notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReceiptSeller',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('normalized_name', models.CharField(max_length=255)),
+                ('category', models.CharField(blank=True, max_length=50, null=True)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('total_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('vat_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_sellers', to=settings.AUTH_USER_MODEL)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_seller', to='core.document')),
+                ('vendor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='receipts', to='core.vendor')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReceiptLineItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('category', models.CharField(blank=True, max_length=50, null=True)),
+                ('quantity', models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True)),
+                ('unit_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('total_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_line_items', to=settings.AUTH_USER_MODEL)),
+                ('receipt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='line_items', to='core.receiptseller')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AccountantSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_limit', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Beklemede'), ('active', 'Aktif'), ('cancelled', 'İptal Edildi'), ('expired', 'Süresi Doldu')], default='pending', max_length=20)),
+                ('start_date', models.DateTimeField(blank=True, null=True)),
+                ('end_date', models.DateTimeField(blank=True, null=True)),
+                ('paytr_subscription_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('is_special', models.BooleanField(default=False)),
+                ('special_note', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('accountant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to=settings.AUTH_USER_MODEL)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.subscriptionplan')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='clientdocument',
+            index=models.Index(fields=['client', '-created_at', '-id'], name='clientdoc_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientdocument',
+            index=models.Index(condition=models.Q(('expiry_date__isnull', False), ('expiry_notified_at__isnull', True), ('is_active', True)), fields=['expiry_date'], name='clientdoc_active_expiry_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='district',
+            unique_together={('city', 'name')},
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['uploaded_by', '-created_at', '-id'], name='document_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['uploaded_by', '-date', '-id'], name='document_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['uploaded_by', 'status', '-created_at', '-id'], name='document_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['status', '-created_at'], name='document_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['uploaded_by', '-updated_at'], name='document_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('analysis_status__in', ['pending', 'processing'])), fields=['analysis_lease_until'], name='document_analysis_lease_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='expirynotice',
+            constraint=models.UniqueConstraint(fields=('document', 'recipient'), name='expiry_notice_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlydocumentrollup',
+            index=models.Index(fields=['client', 'month'], name='core_monthl_client__9a20aa_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlydocumentrollup',
+            constraint=models.UniqueConstraint(fields=('client', 'month', 'document_type', 'vat_rate'), name='monthly_rollup_key'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pushnotification',
+            unique_together={('user', 'collapse_key')},
+        ),
+        migrations.AddIndex(
+            model_name='receiptlineitem',
+            index=models.Index(fields=['client', 'category'], name='core_receip_client__920471_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receiptlineitem',
+            index=models.Index(fields=['client', 'name'], name='core_receip_client__a5d6b7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receiptseller',
+            index=models.Index(fields=['client', 'normalized_name'], name='core_receip_client__d89bb6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receiptseller',
+            index=models.Index(fields=['client', 'date'], name='core_receip_client__c097cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receiptseller',
+            index=models.Index(fields=['normalized_name'], name='core_receip_normali_29199e_idx'),
+        ),
+    ]
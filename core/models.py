@@ -1,4 +1,6 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
 from django.core.files.storage import default_storage
@@ -70,15 +72,28 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Büro sayaçları sadece aktif müşterileri içerir; aktiflik değişimi kayıtta anlaşılsın
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        return instance
+
     def soft_delete(self):
+        from .scope import invalidate_scopes_for_client
+
         self.is_active = False
         self.deleted_at = timezone.now()
         self.save()
+        invalidate_scopes_for_client(self)
 
     def restore(self):
+        from .scope import invalidate_scopes_for_client
+
         self.is_active = True
         self.deleted_at = None
         self.save()
+        invalidate_scopes_for_client(self)
 
     def clean(self):
         if self.user_type == 'client':
@@ -105,6 +120,13 @@ def document_file_path(instance, filename):
     # Yolu oluştur: documents/user_id/yıl/ay/dosya
     return f"documents/{instance.uploaded_by.id}/{timezone.now().strftime('%Y/%m')}/{filename}"
 
+# Aylık toplamları etkileyen belge alanları
+ROLLUP_FIELDS = ('uploaded_by_id', 'date', 'document_type', 'amount', 'vat_rate')
+
+# KDV oranı olmayan belgelerin toplam satırı. NULL kullanılmaz: SQLite ve PostgreSQL < 15
+# benzersizlik kısıtında NULL'ları farklı sayar, aynı anahtar için birden çok satır oluşur
+NO_VAT_RATE = Decimal('-1.00')
+
 class Document(models.Model):
     DOCUMENT_TYPES = (
         ('invoice', 'Fatura'),
@@ -119,6 +141,13 @@ class Document(models.Model):
         ('completed', 'Tamamlandı'),
         ('rejected', 'Reddedildi'),
     )
+
+    ANALYSIS_STATUS_CHOICES = (
+        ('pending', 'Analiz Bekliyor'),
+        ('processing', 'Analiz Ediliyor'),
+        ('completed', 'Analiz Tamamlandı'),
+        ('failed', 'Analiz Başarısız'),
+    )
     
     document_type = models.CharField(max_length=20, choices=DOCUMENT_TYPES)
     file = models.FileField(upload_to=document_file_path)
@@ -131,12 +160,49 @@ class Document(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     analyzed_data = models.JSONField(null=True, blank=True)  # OpenAI analiz sonuçları için
+    # Fiş analizi durumu; muhasebecinin iş akışındaki status alanından ayrı tutulur
+    analysis_status = models.CharField(max_length=20, choices=ANALYSIS_STATUS_CHOICES, null=True, blank=True)
+    # Analiz işini kuyruğunda tutan sürecin kira süresi; süreç yeniden başlar veya çökerse
+    # süre dolar ve iş tekrar kuyruğa alınır
+    analysis_lease_until = models.DateTimeField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)  # Dosya içeriğinin SHA-256'sı
+    perceptual_hash = models.CharField(max_length=16, null=True, blank=True)  # Görsel benzerlik (dHash)
+    # Aynı veya çok benzer içerikli önceki belge; benzer olanlar inceleme için işaretlenir
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates')
 
     def __str__(self):
         return f"{self.get_document_type_display()} - {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # İstatistikler durum değişikliğini kayıt sırasında ek sorgu yapmadan anlayabilsin
+        instance._loaded_status = instance.__dict__.get('status')
+        # Aylık toplamlar için eski anahtar; alanlardan biri ertelenmişse pre_save'de okunur
+        if all(field in instance.__dict__ for field in ROLLUP_FIELDS):
+            instance._loaded_rollup = tuple(instance.__dict__[field] for field in ROLLUP_FIELDS)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Sayaçlar ve aylık toplamlar post_save'de güncellenir; belge yazımıyla aynı işlemde kalsınlar
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        # Listeleme sorguları (kullanıcı filtresi + imleçli sıralama) için
+        indexes = [
+            models.Index(fields=['uploaded_by', '-created_at', '-id'], name='document_user_created_idx'),
+            models.Index(fields=['uploaded_by', '-date', '-id'], name='document_user_date_idx'),
+            models.Index(fields=['uploaded_by', 'status', '-created_at', '-id'], name='document_user_status_idx'),
+            models.Index(fields=['status', '-created_at'], name='document_status_created_idx'),
+            models.Index(fields=['uploaded_by', '-updated_at'], name='document_user_updated_idx'),
+            # Kirası dolan analizleri toplayan tarama için; tamamlanmış belgeler indekste yer almaz
+            models.Index(
+                fields=['analysis_lease_until'], name='document_analysis_lease_idx',
+                condition=models.Q(analysis_status__in=['pending', 'processing'])
+            ),
+        ]
 
 class SubscriptionPlan(models.Model):
     PLAN_TYPE_CHOICES = (
@@ -153,6 +219,8 @@ class SubscriptionPlan(models.Model):
     description = models.TextField()
     is_active = models.BooleanField(default=True)
     trial_days = models.IntegerField(default=0)  # Deneme süresi (gün)
+    analysis_weight = models.PositiveIntegerField(default=1)  # Fiş analizi kuyruğundaki pay
+    analysis_concurrency = models.PositiveIntegerField(default=1)  # Büronun aynı anda işlenen analiz sayısı
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -210,7 +278,9 @@ class AccountantSubscription(models.Model):
         return True
 
     def get_remaining_client_slots(self):
-        current_clients = self.accountant.accounting_firms.first().clients.count()
+        from .scope import get_client_scope
+
+        current_clients = len(get_client_scope(self.accountant).client_ids)
         return self.client_limit - current_clients
 
 class City(models.Model):
@@ -251,9 +321,11 @@ class ClientDocument(models.Model):
     title = models.CharField(max_length=255)  # Kullanıcının verdiği başlık
     document_type = models.CharField(max_length=20, choices=DOCUMENT_TYPES)
     file = models.FileField(upload_to='client_documents/')
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)  # Dosya içeriğinin SHA-256'sı
     description = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)  # Belge hala geçerli mi
     expiry_date = models.DateField(null=True, blank=True)  # Varsa geçerlilik süresi
+    expiry_notified_at = models.DateTimeField(null=True, blank=True)  # Süre dolumu bildirimi gönderildiğinde dolar
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -261,6 +333,15 @@ class ClientDocument(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Müşteri Belgesi'
         verbose_name_plural = 'Müşteri Belgeleri'
+        indexes = [
+            models.Index(fields=['client', '-created_at', '-id'], name='clientdoc_client_created_idx'),
+            # Süresi yaklaşan belgeler taraması sadece aktif, süreli ve henüz bildirilmemiş belgeleri okur
+            models.Index(
+                fields=['expiry_date'],
+                name='clientdoc_active_expiry_idx',
+                condition=models.Q(is_active=True, expiry_date__isnull=False, expiry_notified_at__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.client.email} - {self.title}"
@@ -276,3 +357,180 @@ class ClientDocument(models.Model):
         if self.file:
             return self.file.name.split('/')[-1]
         return None
+
+class ExpiryNotice(models.Model):
+    """
+    Süre dolumu özetinin bir alıcıya gönderildiği belge. Belge, tüm alıcılarına
+    gönderildiğinde expiry_notified_at ile kapatılır; yarım kalan gönderimde
+    özeti almış alıcılara tekrar gönderilmez.
+    """
+    document = models.ForeignKey(ClientDocument, on_delete=models.CASCADE, related_name='expiry_notices')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expiry_notices')
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'recipient'], name='expiry_notice_unique'),
+        ]
+
+class DeviceToken(models.Model):
+    PLATFORM_CHOICES = (
+        ('android', 'Android'),
+        ('ios', 'iOS'),
+        ('web', 'Web'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='device_tokens')
+    token = models.CharField(max_length=255, unique=True)  # FCM kayıt token'ı
+    platform = models.CharField(max_length=20, choices=PLATFORM_CHOICES, default='android')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.email} - {self.platform}"
+
+class PushNotification(models.Model):
+    """Gönderilmeyi bekleyen push bildirimi; aynı anahtar için tek satırda birleşir"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_push_notifications')
+    collapse_key = models.CharField(max_length=100)  # örn. room_12, document_5
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    count = models.IntegerField(default=1)  # Birleştirilen bildirim sayısı
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        unique_together = ['user', 'collapse_key']
+
+    def __str__(self):
+        return f"{self.user.email} - {self.collapse_key}"
+
+class Vendor(models.Model):
+    """Satıcının kanonik kaydı; farklı yazımlar normalize edilmiş anahtar ve takma adlarla eşleşir"""
+    name = models.CharField(max_length=255)  # Raporlarda gösterilecek ad
+    normalized_name = models.CharField(max_length=255, unique=True)
+    aliases = models.JSONField(default=list, blank=True)  # Ek normalize edilmiş yazımlar
+    category = models.CharField(max_length=50, null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # İndeksin artımlı yenilenmesi için
+
+    def __str__(self):
+        return self.name
+
+class ReceiptSeller(models.Model):
+    """Analiz edilmiş fişin satıcı ve toplam bilgileri (analyzed_data'nın sorgulanabilir hali)"""
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='receipt_seller')
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='receipt_sellers')  # Belgeyi yükleyen
+    name = models.CharField(max_length=255)  # Modelin döndürdüğü satıcı adı
+    normalized_name = models.CharField(max_length=255)  # Gruplama için
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='receipts')
+    category = models.CharField(max_length=50, null=True, blank=True)
+    date = models.DateField(null=True, blank=True)  # Fiş üzerindeki tarih
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    vat_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'normalized_name']),
+            models.Index(fields=['client', 'date']),
+            models.Index(fields=['normalized_name']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} - {self.date}"
+
+class ReceiptLineItem(models.Model):
+    receipt = models.ForeignKey(ReceiptSeller, on_delete=models.CASCADE, related_name='line_items')
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='receipt_line_items')
+    name = models.CharField(max_length=255)
+    category = models.CharField(max_length=50, null=True, blank=True)
+    quantity = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'category']),
+            models.Index(fields=['client', 'name']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class DocumentStatsBase(models.Model):
+    """Belge sayaçları; belge kaydedildikçe güncellenir, reconcile_document_stats ile düzeltilir"""
+    total = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)  # completed + rejected
+    last_activity = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+class UserDocumentStats(DocumentStatsBase):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='document_stats')
+
+    def __str__(self):
+        return f"{self.user_id}: {self.total}"
+
+class FirmDocumentStats(DocumentStatsBase):
+    """Büronun aktif müşterilerinin belge sayaçları; pano tek satır okur"""
+    firm = models.OneToOneField(AccountingFirm, on_delete=models.CASCADE, primary_key=True, related_name='document_stats')
+    recent_document_ids = models.JSONField(default=list, blank=True)  # Son güncellenen belgeler, yeniden eskiye
+
+    def __str__(self):
+        return f"{self.firm_id}: {self.total}"
+
+class MonthlyDocumentRollup(models.Model):
+    """
+    Müşteri, ay, belge türü ve KDV oranı bazında tutar/KDV toplamları.
+    Belge kaydedildikçe güncellenir, rebuild_monthly_rollups ile yeniden oluşturulur.
+    """
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_rollups')
+    month = models.DateField()  # Ayın ilk günü
+    document_type = models.CharField(max_length=20, choices=Document.DOCUMENT_TYPES)
+    vat_rate = models.DecimalField(max_digits=5, decimal_places=2, default=NO_VAT_RATE)  # Oransızlar NO_VAT_RATE
+    document_count = models.IntegerField(default=0)
+    amount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vat_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['client', 'month', 'document_type', 'vat_rate'],
+                name='monthly_rollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['client', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.client_id} {self.month:%Y-%m} {self.document_type} {self.vat_rate}"
+
+
+class PendingFileDeletion(models.Model):
+    """
+    Storage'dan silinecek dosya; kaydı silen transaction içinde oluşturulur,
+    drain_file_deletions tarafından toplu DeleteObjects istekleriyle işlenir.
+    """
+    name = models.CharField(max_length=500)  # FileField adı (storage anahtarı değil)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id']),
+        ]
+
+    def __str__(self):
+        return self.name
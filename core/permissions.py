@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .scope import get_client_scope
+
 class IsAccountant(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.user_type == 'accountant'
@@ -7,5 +9,5 @@ class IsAccountant(permissions.BasePermission):
 class IsClientOrAccountant(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.user_type == 'accountant':
-            return obj.uploaded_by.accounting_firms.filter(owner=request.user).exists()
+            return obj.uploaded_by_id in get_client_scope(request.user, request)
         return obj.uploaded_by == request.user 
\ No newline at end of file
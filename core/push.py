@@ -0,0 +1,229 @@
+import json
+import logging
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DeviceToken, PushNotification
+
+logger = logging.getLogger(__name__)
+
+# FCM'in kalıcı olarak geçersiz saydığı token hataları.
+# INVALID_ARGUMENT mesajın kendisinden de kaynaklanabilir, token silinmez.
+INVALID_TOKEN_ERRORS = {'UNREGISTERED', 'SENDER_ID_MISMATCH'}
+
+
+def queue_push(user_ids, collapse_key, title, body, data=None):
+    """
+    Kullanıcılar için push bildirimi kuyruğa alır.
+    Aynı collapse_key ile bekleyen bildirim varsa yenisi onun üzerine yazılır.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    data = data or {}
+
+    with transaction.atomic():
+        existing = set(
+            PushNotification.objects.filter(user_id__in=user_ids, collapse_key=collapse_key)
+            .values_list('user_id', flat=True)
+        )
+        if existing:
+            PushNotification.objects.filter(
+                user_id__in=existing, collapse_key=collapse_key
+            ).update(title=title, body=body, data=data, count=F('count') + 1, updated_at=timezone.now())
+
+        missing = user_ids - existing
+        if missing:
+            try:
+                with transaction.atomic():
+                    PushNotification.objects.bulk_create([
+                        PushNotification(
+                            user_id=user_id,
+                            collapse_key=collapse_key,
+                            title=title,
+                            body=body,
+                            data=data
+                        )
+                        for user_id in missing
+                    ])
+            except IntegrityError:
+                # Eşzamanlı bir istek aynı satırı oluşturmuş olabilir, onun üzerine yaz
+                PushNotification.objects.filter(
+                    user_id__in=missing, collapse_key=collapse_key
+                ).update(title=title, body=body, data=data, count=F('count') + 1, updated_at=timezone.now())
+
+
+def send_pending_push_notifications():
+    """
+    Bekleyen bildirimleri aynı içeriğe sahip olanları gruplayarak
+    FCM multicast istekleri halinde gönderir, geçersiz token'ları siler.
+
+    Returns:
+        dict: gönderim istatistikleri
+    """
+    config = settings.PUSH_NOTIFICATIONS
+    loaded_at = timezone.now()
+    pending = list(PushNotification.objects.all()[:config['BATCH_SIZE']])
+    if not pending:
+        return {'notifications': 0, 'sent': 0, 'failed': 0, 'pruned': 0}
+
+    tokens_by_user = defaultdict(list)
+    for user_id, token in DeviceToken.objects.filter(
+        user_id__in={n.user_id for n in pending}
+    ).values_list('user_id', 'token'):
+        tokens_by_user[user_id].append(token)
+
+    # Aynı içerikli bildirimler tek multicast mesajında birleşir
+    groups = defaultdict(list)
+    for notification in pending:
+        groups[_payload_key(notification)].append(notification)
+
+    backend = get_push_backend()
+    sent = failed = 0
+    invalid_tokens = set()
+    retry_ids = set()
+    for payload_key, notifications in groups.items():
+        collapse_key, title, body, data_json = payload_key
+        for chunk_notifications, chunk in _token_chunks(
+            notifications, tokens_by_user, config['MULTICAST_LIMIT']
+        ):
+            try:
+                results = backend.send_multicast(
+                    chunk, collapse_key, title, body, json.loads(data_json)
+                )
+            except Exception as e:
+                logger.error(f"Push gönderimi başarısız ({collapse_key}): {str(e)}")
+                failed += len(chunk)
+                # Sadece bu parçanın bildirimleri tekrar denenir, diğer parçalar tamamlandı
+                retry_ids.update(n.id for n in chunk_notifications)
+                continue
+            for token, error in zip(chunk, results):
+                if error is None:
+                    sent += 1
+                else:
+                    failed += 1
+                    if error in INVALID_TOKEN_ERRORS:
+                        invalid_tokens.add(token)
+
+    pruned = 0
+    if invalid_tokens:
+        pruned = DeviceToken.objects.filter(token__in=invalid_tokens).delete()[0]
+
+    # Gönderim sırasında üzerine yazılanlar (updated_at yenilenir) ve servis hatası alanlar
+    # bir sonraki turda tekrar gider
+    delivered_ids = [n.id for n in pending if n.id not in retry_ids]
+    if delivered_ids:
+        PushNotification.objects.filter(id__in=delivered_ids, updated_at__lte=loaded_at).delete()
+
+    return {'notifications': len(pending), 'sent': sent, 'failed': failed, 'pruned': pruned}
+
+
+def _token_chunks(notifications, tokens_by_user, limit):
+    """
+    Bildirimlerin token'larını multicast sınırına göre parçalar.
+    Bir kullanıcının token'ları sınırı aşmadıkça aynı parçada kalır; böylece
+    başarısız bir parça yalnızca kendi bildirimlerinin tekrar gönderilmesine yol açar.
+
+    Yields:
+        tuple: (parçadaki bildirimler, token listesi)
+    """
+    chunk_notifications, chunk = [], []
+    for notification in notifications:
+        tokens = tokens_by_user.get(notification.user_id, [])
+        if chunk and len(chunk) + len(tokens) > limit:
+            yield chunk_notifications, chunk
+            chunk_notifications, chunk = [], []
+        chunk_notifications.append(notification)
+        chunk.extend(tokens)
+        while len(chunk) > limit:
+            yield [notification], chunk[:limit]
+            chunk = chunk[limit:]
+    if chunk:
+        yield chunk_notifications, chunk
+
+
+def _payload_key(notification):
+    data = dict(notification.data, collapse_key=notification.collapse_key)
+    if notification.count > 1:
+        data['count'] = notification.count
+    data_json = json.dumps({k: str(v) for k, v in data.items()}, sort_keys=True)
+    return notification.collapse_key, notification.title, notification.body, data_json
+
+
+class FirebasePushBackend:
+    """firebase-admin ile FCM'e multicast gönderir"""
+
+    def __init__(self):
+        import firebase_admin
+        from firebase_admin import credentials
+
+        if not firebase_admin._apps:
+            credentials_file = settings.PUSH_NOTIFICATIONS['CREDENTIALS_FILE']
+            cred = credentials.Certificate(credentials_file) if credentials_file else None
+            firebase_admin.initialize_app(cred)
+
+    def send_multicast(self, tokens, collapse_key, title, body, data):
+        from firebase_admin import messaging
+
+        message = messaging.MulticastMessage(
+            tokens=tokens,
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+            android=messaging.AndroidConfig(collapse_key=collapse_key),
+            apns=messaging.APNSConfig(headers={'apns-collapse-id': collapse_key}),
+        )
+        response = messaging.send_each_for_multicast(message)
+        return [
+            None if result.success else _firebase_error_code(result.exception)
+            for result in response.responses
+        ]
+
+
+def _firebase_error_code(exception):
+    from firebase_admin import messaging
+
+    if isinstance(exception, messaging.UnregisteredError):
+        return 'UNREGISTERED'
+    if isinstance(exception, messaging.SenderIdMismatchError):
+        return 'SENDER_ID_MISMATCH'
+    return getattr(exception, 'code', None) or 'UNKNOWN'
+
+
+class LocalPushBackend:
+    """
+    FCM yerine yerel bir HTTP sunucusuna gönderir (geliştirme ve testler için).
+    Sunucu {"responses": [{"success": true}, {"success": false, "error": "UNREGISTERED"}]}
+    formatında token sırasıyla yanıt vermelidir.
+    """
+
+    def send_multicast(self, tokens, collapse_key, title, body, data):
+        response = requests.post(
+            settings.PUSH_NOTIFICATIONS['LOCAL_ENDPOINT'],
+            json={
+                'tokens': tokens,
+                'collapse_key': collapse_key,
+                'notification': {'title': title, 'body': body},
+                'data': data,
+            },
+            timeout=10
+        )
+        response.raise_for_status()
+        return [
+            None if result.get('success') else result.get('error', 'UNKNOWN')
+            for result in response.json()['responses']
+        ]
+
+
+PUSH_BACKENDS = {
+    'firebase': FirebasePushBackend,
+    'local': LocalPushBackend,
+}
+
+
+def get_push_backend():
+    return PUSH_BACKENDS[settings.PUSH_NOTIFICATIONS['BACKEND']]()
@@ -0,0 +1,139 @@
+import io
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def detect_content_type(data):
+    """Dosya türünü uzantı yerine içeriğin ilk baytlarından belirle"""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith(b'%PDF'):
+        return 'application/pdf'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def prepare_receipt_images(data, max_side, jpeg_quality, pdf_dpi, pdf_max_pages):
+    """
+    Fişi modele gönderilecek JPEG sayfalarına dönüştürür: EXIF yönünü düzeltir,
+    gereğinden büyük görselleri küçültür, yeniden sıkıştırır, PDF sayfalarını rasterize eder.
+    İşlem havuzunda çalıştığı için Django'ya bağımlı olmamalı.
+
+    Returns:
+        list: JPEG bayt dizileri (her sayfa için bir tane)
+    """
+    from PIL import Image, ImageOps
+
+    content_type = detect_content_type(data)
+    if content_type == 'application/pdf':
+        import fitz  # PyMuPDF
+
+        pages = []
+        with fitz.open(stream=data, filetype='pdf') as pdf:
+            for page in list(pdf)[:pdf_max_pages]:
+                pixmap = page.get_pixmap(dpi=pdf_dpi)
+                image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+                pages.append(_encode_jpeg(image, max_side, jpeg_quality))
+        return pages
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Büyük JPEG'leri hedef boyuta yakın ölçekte çöz
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        return [_encode_jpeg(image, max_side, jpeg_quality)]
+
+
+def _encode_jpeg(image, max_side, jpeg_quality):
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side))
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=jpeg_quality, optimize=True)
+    return output.getvalue()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Thread'li süreçten fork güvenli değil, spawn kullan
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.RECEIPT_IMAGE_PROCESSING['PROCESS_WORKERS'],
+                mp_context=get_context('spawn')
+            )
+        return _executor
+
+
+def _reset_executor(executor):
+    """Çökmüş havuzu bırak; sonraki istek yeni havuz oluşturur"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_in_pool(fn, *args, timeout):
+    """
+    Bir işçi süreç ölürse (ör. bellek yetmezliği) havuz kalıcı olarak bozulur;
+    havuz yeniden oluşturulup bir kez daha denenir.
+    """
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            return executor.submit(fn, *args).result(timeout=timeout)
+        except BrokenProcessPool:
+            logger.warning("Fiş ön işleme havuzu çöktü, yeniden oluşturuluyor")
+            _reset_executor(executor)
+            if attempt:
+                raise
+
+
+def preprocess_receipt(data):
+    """
+    CPU yoğun ön işlemeyi işlem havuzunda çalıştırır ve boyut/süre bilgisini loglar.
+    İşlenemeyen dosyalar (ör. HEIC) önceki gibi olduğu gibi gönderilir.
+
+    Returns:
+        list: Modele gönderilecek sayfalar
+    """
+    config = settings.RECEIPT_IMAGE_PROCESSING
+    started = time.monotonic()
+    try:
+        pages = _run_in_pool(
+            prepare_receipt_images,
+            data,
+            config['MAX_SIDE'],
+            config['JPEG_QUALITY'],
+            config['PDF_DPI'],
+            config['PDF_MAX_PAGES'],
+            timeout=config['TIMEOUT'],
+        )
+    except Exception as e:
+        logger.warning(
+            f"Fiş ön işlenemedi, dosya olduğu gibi gönderiliyor: {detect_content_type(data)} "
+            f"{len(data)} bayt: {type(e).__name__}: {str(e)}"
+        )
+        return [data]
+    logger.info(
+        f"Fiş ön işleme: {detect_content_type(data)} {len(data)} bayt -> "
+        f"{len(pages)} sayfa {sum(len(page) for page in pages)} bayt "
+        f"({(time.monotonic() - started) * 1000:.0f} ms)"
+    )
+    return pages
@@ -0,0 +1,138 @@
+import logging
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .vendors import resolve_vendor, vendor_key
+
+logger = logging.getLogger(__name__)
+
+# Modelden istenen harcama kategorileri
+RECEIPT_CATEGORIES = (
+    'food', 'grocery', 'fuel', 'transport', 'accommodation', 'office',
+    'electronics', 'clothing', 'health', 'utilities', 'services', 'other',
+)
+
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%y')
+
+# ReceiptSeller/ReceiptLineItem tutar sütunlarının max_digits değeri
+AMOUNT_DIGITS = 12
+
+
+def fit_digits(number, max_digits):
+    """Sütuna (max_digits) sığmayan değer için None döndür; kayıt DataError ile bozulmasın"""
+    if number is None or max_digits is None:
+        return number
+    if not number.is_finite() or len(number.as_tuple().digits) > max_digits:
+        logger.warning(f"Sayı sütuna sığmıyor, yok sayıldı: {number}")
+        return None
+    return number
+
+
+def parse_decimal(value, places='0.01', max_digits=None):
+    """
+    Model çıktısındaki sayıyı Decimal'e çevir ('1.234,56', '118 TL' gibi yazımlar dahil).
+    max_digits verilirse bu kadar basamağa sığmayan değerler için None döner.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        number = str(value)
+    else:
+        number = re.sub(r'[^\d,.\-]', '', str(value))
+        if ',' in number and '.' in number:
+            # Son görülen ayraç ondalık ayracıdır
+            if number.rfind(',') > number.rfind('.'):
+                number = number.replace('.', '').replace(',', '.')
+            else:
+                number = number.replace(',', '')
+        else:
+            number = number.replace(',', '.')
+    try:
+        number = Decimal(number).quantize(Decimal(places))
+    except (InvalidOperation, ValueError):
+        return None
+    return fit_digits(number, max_digits)
+
+
+def parse_receipt_date(value):
+    if not value or not isinstance(value, str):
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_category(value):
+    category = (value or '').strip().lower() if isinstance(value, str) else ''
+    return category if category in RECEIPT_CATEGORIES else None
+
+
+def build_receipt_rows(document):
+    """
+    Belgenin analyzed_data'sından kaydedilmemiş ReceiptSeller ve ReceiptLineItem nesneleri üret.
+
+    Returns:
+        tuple: (ReceiptSeller veya None, ReceiptLineItem listesi)
+    """
+    from .models import ReceiptLineItem, ReceiptSeller
+
+    data = document.analyzed_data
+    if not isinstance(data, dict):
+        return None, []
+
+    name = str(data.get('seller_name') or '').strip()[:255]
+    category = parse_category(data.get('category'))
+    vendor = resolve_vendor(name, category) if name else None
+    seller = ReceiptSeller(
+        document_id=document.id,
+        client_id=document.uploaded_by_id,
+        name=name,
+        # Farklı yazımlar kanonik satıcı altında gruplanır; bilinen satıcının kategorisi esas alınır
+        normalized_name=vendor_key(vendor[2] if vendor else name)[:255],
+        vendor_id=vendor[0] if vendor else None,
+        category=(vendor[3] if vendor else None) or category,
+        date=parse_receipt_date(data.get('date')),
+        total_amount=parse_decimal(data.get('total_amount'), max_digits=AMOUNT_DIGITS),
+        vat_amount=parse_decimal(data.get('vat_amount'), max_digits=AMOUNT_DIGITS),
+    )
+
+    items = []
+    for item in data.get('items') or []:
+        if not isinstance(item, dict) or not item.get('name'):
+            continue
+        quantity = parse_decimal(item.get('quantity'), '0.001', max_digits=AMOUNT_DIGITS)
+        unit_price = parse_decimal(item.get('unit_price'), max_digits=AMOUNT_DIGITS)
+        total_price = parse_decimal(item.get('total_price'), max_digits=AMOUNT_DIGITS)
+        if total_price is None and quantity is not None and unit_price is not None:
+            total_price = fit_digits((quantity * unit_price).quantize(Decimal('0.01')), AMOUNT_DIGITS)
+        items.append(ReceiptLineItem(
+            client_id=document.uploaded_by_id,
+            name=str(item['name']).strip()[:255],
+            category=parse_category(item.get('category')) or seller.category,
+            quantity=quantity,
+            unit_price=unit_price,
+            total_price=total_price,
+        ))
+    return seller, items
+
+
+def store_receipt_rows(document):
+    """Analiz sonucunu satıcı/kalem tablolarına yazar; önceki kayıtların yerine geçer"""
+    from .models import ReceiptLineItem, ReceiptSeller
+
+    seller, items = build_receipt_rows(document)
+    with transaction.atomic():
+        ReceiptSeller.objects.filter(document_id=document.id).delete()
+        if seller is None:
+            return None
+        seller.save()
+        for item in items:
+            item.receipt = seller
+        ReceiptLineItem.objects.bulk_create(items)
+    return seller
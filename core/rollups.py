@@ -0,0 +1,195 @@
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, Round, TruncMonth
+
+from .exports import vat_amount
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+RATE = DecimalField(max_digits=5, decimal_places=2)
+
+
+def _decimal(value):
+    # Analiz sonrası alanlar float olarak atanmış olabilir
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def rollup_values(document):
+    from .models import ROLLUP_FIELDS
+
+    return tuple(getattr(document, field) for field in ROLLUP_FIELDS)
+
+
+def contribution(values):
+    """
+    Belge alanlarından (anahtar, tutar, kdv) üretir.
+    Anahtar: (müşteri, ayın ilk günü, belge türü, KDV oranı)
+    """
+    if values is None:
+        return None
+    client_id, day, document_type, amount, vat_rate = values
+    if client_id is None or not isinstance(day, date):
+        return None
+    from .models import NO_VAT_RATE
+
+    amount = _decimal(amount)
+    vat_rate = _decimal(vat_rate)
+    key = (client_id, day.replace(day=1), document_type, NO_VAT_RATE if vat_rate is None else vat_rate)
+    return key, amount or ZERO, vat_amount(amount, vat_rate) or ZERO
+
+
+def apply_rollup_delta(key, count, amount, vat):
+    """Satırı kilitleyip deltayı uygular; sayısı sıfıra inen satır silinir"""
+    from .models import MonthlyDocumentRollup
+
+    client_id, month, document_type, vat_rate = key
+    lookup = {'client_id': client_id, 'month': month, 'document_type': document_type, 'vat_rate': vat_rate}
+    with transaction.atomic():
+        if count > 0:
+            MonthlyDocumentRollup.objects.bulk_create([MonthlyDocumentRollup(**lookup)], ignore_conflicts=True)
+        row_id = MonthlyDocumentRollup.objects.select_for_update().filter(**lookup).values_list('id', flat=True).first()
+        if row_id is None:
+            return
+        row = MonthlyDocumentRollup.objects.filter(pk=row_id)
+        row.update(
+            document_count=F('document_count') + count,
+            amount_total=F('amount_total') + amount,
+            vat_total=F('vat_total') + vat,
+        )
+        if count < 0:
+            row.filter(document_count__lte=0).delete()
+
+
+def load_previous_rollup(document):
+    """Alanları ertelenmiş yüklenen belgeler için eski değerleri kayıttan önce oku"""
+    from .models import ROLLUP_FIELDS, Document
+
+    if document._state.adding or hasattr(document, '_loaded_rollup'):
+        return
+    document._loaded_rollup = Document.objects.filter(pk=document.pk).values_list(*ROLLUP_FIELDS).first()
+
+
+def record_document_rollup(document, created):
+    old = None if created else contribution(getattr(document, '_loaded_rollup', None))
+    new = contribution(rollup_values(document))
+    document._loaded_rollup = rollup_values(document)
+    if old == new:
+        return
+
+    if old and new and old[0] == new[0]:
+        # Aynı satır; sadece tutar farkı
+        apply_rollup_delta(new[0], 0, new[1] - old[1], new[2] - old[2])
+        return
+    if old:
+        apply_rollup_delta(old[0], -1, -old[1], -old[2])
+    if new:
+        apply_rollup_delta(new[0], 1, new[1], new[2])
+
+
+def record_document_rollup_deleted(document):
+    old = contribution(getattr(document, '_loaded_rollup', None) or rollup_values(document))
+    if old:
+        apply_rollup_delta(old[0], -1, -old[1], -old[2])
+
+
+def rebuild_rollups(client_ids=None, batch_size=1000):
+    """
+    Toplam tablosunu belgelerden baştan oluşturur.
+
+    Args:
+        client_ids: Sadece bu müşteriler (None ise tümü)
+
+    Returns:
+        int: Oluşturulan satır sayısı
+    """
+    from .models import NO_VAT_RATE, Document, MonthlyDocumentRollup
+
+    documents = Document.objects.filter(date__isnull=False)
+    rollups = MonthlyDocumentRollup.objects.all()
+    if client_ids is not None:
+        documents = documents.filter(uploaded_by_id__in=client_ids)
+        rollups = rollups.filter(client_id__in=client_ids)
+
+    rows = (
+        documents.annotate(
+            month=TruncMonth('date'),
+            rate=Coalesce('vat_rate', Value(NO_VAT_RATE), output_field=RATE),
+        )
+        .values('uploaded_by_id', 'month', 'document_type', 'rate')
+        .annotate(
+            document_count=Count('id'),
+            amount_total=Coalesce(Sum('amount'), Value(ZERO), output_field=MONEY),
+            # Artımlı güncellemeyle aynı sonucu vermesi için KDV belge bazında yuvarlanır
+            vat_total=Coalesce(
+                Sum(Round(F('amount') * F('vat_rate') / 100, 2), output_field=MONEY),
+                Value(ZERO),
+                output_field=MONEY,
+            ),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        rollups.delete()
+        created = MonthlyDocumentRollup.objects.bulk_create(
+            (
+                MonthlyDocumentRollup(
+                    client_id=row['uploaded_by_id'],
+                    month=row['month'],
+                    document_type=row['document_type'],
+                    vat_rate=row['rate'],
+                    document_count=row['document_count'],
+                    amount_total=row['amount_total'],
+                    vat_total=row['vat_total'],
+                )
+                for row in rows.iterator(chunk_size=batch_size)
+            ),
+            batch_size=batch_size,
+        )
+    return len(created)
+
+
+def monthly_series(client_ids, start, end, document_types=None, group_by=None):
+    """
+    Aylık tutar/KDV serisi. group_by: None, 'document_type' veya 'vat_rate'.
+    Gruplama yoksa boş aylar sıfırla doldurulur; oranı olmayan belgelerin vat_rate'i None döner.
+    """
+    from .models import NO_VAT_RATE, MonthlyDocumentRollup
+
+    rollups = MonthlyDocumentRollup.objects.filter(
+        client_id__in=client_ids, month__gte=start, month__lte=end
+    )
+    if document_types:
+        rollups = rollups.filter(document_type__in=document_types)
+
+    group_fields = ['month', group_by] if group_by else ['month']
+    rows = [
+        {
+            'month': row['month'].strftime('%Y-%m'),
+            **({group_by: None if group_by == 'vat_rate' and row[group_by] == NO_VAT_RATE else row[group_by]}
+               if group_by else {}),
+            'count': row['count'],
+            'amount': row['amount'],
+            'vat': row['vat'],
+        }
+        for row in rollups.values(*group_fields).annotate(
+            count=Sum('document_count'), amount=Sum('amount_total'), vat=Sum('vat_total')
+        ).order_by(*group_fields)
+    ]
+    if group_by:
+        return rows
+
+    by_month = {row['month']: row for row in rows}
+    series = []
+    month = start
+    while month <= end:
+        label = month.strftime('%Y-%m')
+        series.append(by_month.get(label, {'month': label, 'count': 0, 'amount': ZERO, 'vat': ZERO}))
+        month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return series
@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+# Geçersiz kılma sinyalleri hangi süreçte çalışırsa çalışsın tüm süreçler aynı önbelleği görmeli
+cache = ConnectionProxy(caches, 'shared')
+
+
+@dataclass(frozen=True)
+class ClientScope:
+    """Kullanıcının erişebildiği bürolar ve müşteriler"""
+    firm_ids: frozenset
+    client_ids: frozenset
+
+    @property
+    def firm_id(self):
+        """Muhasebecinin (ilk) bürosu"""
+        return min(self.firm_ids) if self.firm_ids else None
+
+    def __contains__(self, client_id):
+        return client_id in self.client_ids
+
+
+def _cache_key(user_id):
+    return f'client_scope_{user_id}'
+
+
+def get_client_scope(user, request=None):
+    """
+    Muhasebeci için sahip olduğu büroların aktif müşterilerini, müşteri için kendisini döndürür.
+    Sonuç istek boyunca request üzerinde, istekler arasında cache'te tutulur.
+    """
+    if request is not None:
+        scope = getattr(request, '_client_scope', None)
+        if scope is not None:
+            return scope
+
+    key = _cache_key(user.id)
+    scope = cache.get(key)
+    if scope is None:
+        scope = _resolve(user)
+        cache.set(key, scope, settings.CLIENT_SCOPE['CACHE_TIMEOUT'])
+
+    if request is not None:
+        request._client_scope = scope
+    return scope
+
+
+def _resolve(user):
+    from .models import AccountingFirm, User
+
+    if user.user_type == 'accountant':
+        firm_ids = frozenset(AccountingFirm.objects.filter(owner=user).values_list('id', flat=True))
+        client_ids = frozenset(
+            User.objects.filter(accounting_firms__in=firm_ids, is_active=True).values_list('id', flat=True)
+        ) if firm_ids else frozenset()
+        return ClientScope(firm_ids=firm_ids, client_ids=client_ids)
+
+    firm_ids = frozenset(user.accounting_firms.values_list('id', flat=True))
+    return ClientScope(firm_ids=firm_ids, client_ids=frozenset([user.id]))
+
+
+def invalidate_client_scope(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def invalidate_scopes_for_client(user):
+    """Müşterinin kendisi ve bağlı olduğu büroların sahipleri için önbelleği temizle"""
+    from .models import AccountingFirm
+
+    owner_ids = AccountingFirm.objects.filter(clients=user).values_list('owner_id', flat=True)
+    invalidate_client_scope([user.id, *owner_ids])
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from dj_rest_auth.registration.serializers import RegisterSerializer
-from .models import User, AccountingFirm, Document, SubscriptionPlan, AccountantSubscription, ClientDocument
+from .models import User, AccountingFirm, Document, SubscriptionPlan, AccountantSubscription, ClientDocument, DeviceToken
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
@@ -11,7 +11,11 @@ from django.contrib.auth import get_user_model
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
+from django.db.models import F
 from .utils import send_email_via_smtp2go  # Utils fonksiyonumuzu import edelim
+from .tasks import PRIORITY_INTERACTIVE, analysis_lease, enqueue_receipt_analysis
+from .analysis import apply_analysis
+from .dedup import compute_content_hash, find_stored_copy
 from django.utils.crypto import get_random_string
 from django.utils import timezone
 from cities_light.models import City, Region, SubRegion
@@ -146,6 +150,13 @@ class ClientDocumentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'file_url', 'file_name']
 
+    def update(self, instance, validated_data):
+        # Geçerlilik tarihi değiştiyse (yenilenen belge) yeni tarih için tekrar bildirilsin
+        if 'expiry_date' in validated_data and validated_data['expiry_date'] != instance.expiry_date:
+            instance.expiry_notified_at = None
+            instance.expiry_notices.all().delete()
+        return super().update(instance, validated_data)
+
 class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -236,10 +247,15 @@ class AccountingFirmSerializer(serializers.ModelSerializer):
         validated_data['owner'] = self.context['request'].user
         return super().create(validated_data)
 
+def with_duplicate_owner(queryset):
+    """Belge listesini DocumentSerializer için hazırla: duplicate_of kontrolü belge başına sorgu yapmaz"""
+    return queryset.annotate(duplicate_owner_id=F('duplicate_of__uploaded_by_id'))
+
 class DocumentSerializer(serializers.ModelSerializer):
     receipt_details = serializers.SerializerMethodField(read_only=True)
     file_url = serializers.SerializerMethodField(read_only=True)
     file_name = serializers.SerializerMethodField(read_only=True)
+    duplicate_of = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Document
@@ -247,9 +263,10 @@ class DocumentSerializer(serializers.ModelSerializer):
             'id', 'document_type', 'file', 'date', 
             'amount', 'vat_rate', 'status', 'uploaded_by',
             'processed_by', 'created_at', 'updated_at',
-            'receipt_details', 'file_url', 'file_name'
+            'receipt_details', 'file_url', 'file_name', 'analysis_status',
+            'duplicate_of'
         ]
-        read_only_fields = ['uploaded_by', 'processed_by', 'status', 'receipt_details', 'file_url', 'file_name']
+        read_only_fields = ['uploaded_by', 'processed_by', 'status', 'receipt_details', 'file_url', 'file_name', 'analysis_status', 'duplicate_of']
 
     def get_receipt_details(self, obj):
         if obj.analyzed_data and isinstance(obj.analyzed_data, dict):
@@ -258,6 +275,7 @@ class DocumentSerializer(serializers.ModelSerializer):
                 'date': obj.analyzed_data.get('date'),
                 'total_amount': obj.analyzed_data.get('total_amount'),
                 'vat_amount': obj.analyzed_data.get('vat_amount'),
+                'category': obj.analyzed_data.get('category'),
                 'items': obj.analyzed_data.get('items', [])
             }
         return None
@@ -272,84 +290,57 @@ class DocumentSerializer(serializers.ModelSerializer):
             return obj.file.name.split('/')[-1]
         return None
 
+    def get_duplicate_of(self, obj):
+        """Sadece aynı kullanıcının belgesine işaret eden eşleşmeyi göster"""
+        if obj.duplicate_of_id is None:
+            return None
+        # Listelemede sorguya eklenir (duplicate_owner_id); yoksa tek sorguyla okunur
+        owner_id = getattr(obj, 'duplicate_owner_id', None)
+        if owner_id is None:
+            owner_id = (
+                Document.objects.filter(id=obj.duplicate_of_id)
+                .values_list('uploaded_by_id', flat=True).first()
+            )
+        return obj.duplicate_of_id if owner_id == obj.uploaded_by_id else None
+
     def create(self, validated_data):
+        uploaded_file = validated_data.get('file')
+        stored_copy = None
+        image_data = None
+
+        if uploaded_file:
+            validated_data['content_hash'] = compute_content_hash(uploaded_file)
+            stored_copy = find_stored_copy(
+                Document.objects.filter(uploaded_by=validated_data['uploaded_by']),
+                validated_data['content_hash']
+            )
+            if stored_copy:
+                # Aynı içerik zaten storage'da; tekrar yüklemek yerine mevcut nesneyi kullan
+                validated_data['file'] = stored_copy.file.name
+                validated_data['duplicate_of'] = stored_copy
+
+        # Eğer belge tipi fiş ise OpenAI analizini arka planda yap
+        reuse_analysis = stored_copy is not None and stored_copy.analyzed_data is not None
+        if validated_data.get('document_type') == 'receipt' and uploaded_file and not reuse_analysis:
+            # Analiz işi dosyayı storage'dan tekrar okumasın diye içeriği bellekte tut
+            image_data = uploaded_file.read()
+            uploaded_file.seek(0)
+            validated_data['analysis_status'] = 'pending'
+            validated_data['analysis_lease_until'] = analysis_lease()
+
         instance = super().create(validated_data)
-        
-        # Eğer belge tipi fiş ise OpenAI analizi yapmayı dene
-        if instance.document_type == 'receipt' and instance.file:
-            self.analyze_receipt(instance)
-        
-        return instance
 
-    def analyze_receipt(self, instance):
-        try:
-            import openai
-            import base64
-            import json
-            
-            # API key'i direkt olarak ayarla
-            openai.api_key = settings.OPENAI_API_KEY
-            
-            # Dosyayı oku ve base64'e çevir
-            with instance.file.open('rb') as image_file:
-                image_data = image_file.read()
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-                base64_url = f"data:image/jpeg;base64,{base64_image}"
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-4-turbo",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Could you extract the following seller pricing information from this image and return ONLY the JSON data without any explanation? Include: seller_name, date, total_amount, vat_amount, items (array of items with name, quantity, unit_price)"
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": base64_url
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=1000
+        if validated_data.get('document_type') == 'receipt' and reuse_analysis:
+            instance = apply_analysis(instance, stored_copy.analyzed_data) or instance
+        elif image_data is not None:
+            # Çoklu yüklemeler context ile toplu önceliğe alınır
+            enqueue_receipt_analysis(
+                instance,
+                image_data=image_data,
+                priority=self.context.get('analysis_priority', PRIORITY_INTERACTIVE)
             )
-            
-            # OpenAI yanıtından JSON string'i çıkar ve parse et
-            response_text = response.choices[0].message['content']
-            json_str = response_text.strip()
-            if json_str.startswith('```json'):
-                json_str = json_str[7:]
-            if json_str.endswith('```'):
-                json_str = json_str[:-3]
-            
-            # JSON'ı parse et
-            analyzed_data = json.loads(json_str.strip())
-            
-            # Analiz sonucunu kaydet
-            instance.analyzed_data = analyzed_data
-            
-            # Analiz edilen değerleri ilgili alanlara kaydet
-            if 'total_amount' in analyzed_data:
-                instance.amount = analyzed_data['total_amount']
-            
-            if 'vat_amount' in analyzed_data and analyzed_data['total_amount']:
-                # KDV oranını hesapla: (KDV tutarı / Toplam tutar) * 100
-                try:
-                    vat_rate = (analyzed_data['vat_amount'] / analyzed_data['total_amount']) * 100
-                    instance.vat_rate = round(vat_rate, 2)  # 2 decimal places
-                except (ZeroDivisionError, TypeError):
-                    pass
-
-            instance.save()
-            
-        except Exception as e:
-            import traceback
-            print(f"Fiş analizi sırasında hata oluştu: {str(e)}")
-            print(traceback.format_exc())
+
+        return instance
 
     def update(self, instance, validated_data):
         # Sadece amount ve vat_rate alanlarının güncellenmesine izin ver
@@ -363,6 +354,15 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
         model = Document
         fields = ['document_type', 'file', 'date', 'amount', 'vat_rate']
 
+class DeviceTokenSerializer(serializers.ModelSerializer):
+    # Unique kontrolü view'da update_or_create ile yapılıyor
+    token = serializers.CharField(max_length=255)
+
+    class Meta:
+        model = DeviceToken
+        fields = ['id', 'token', 'platform', 'created_at']
+        read_only_fields = ['created_at']
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = 'email'
 
@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .deletions import schedule_file_deletion
+from .models import AccountingFirm, ClientDocument, Document, User, Vendor
+from .rollups import load_previous_rollup, record_document_rollup, record_document_rollup_deleted
+from .scope import invalidate_client_scope
+from .stats import record_document_deleted, record_document_saved, refresh_firm_stats
+from .vendors import vendor_index
+
+
+@receiver(m2m_changed, sender=AccountingFirm.clients.through)
+def invalidate_scope_on_clients_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+
+    if not reverse:
+        # firm.clients.add/remove/clear
+        client_ids = pk_set or []
+        if action == 'pre_clear':
+            client_ids = list(instance.clients.values_list('id', flat=True))
+        invalidate_client_scope([instance.owner_id, *client_ids])
+        if action != 'pre_clear':
+            refresh_firm_stats([instance.id])
+        return
+
+    # user.accounting_firms.add/remove/clear; clear için firmalar silinmeden önce okunur
+    if action == 'pre_clear':
+        firm_ids = list(instance.accounting_firms.values_list('id', flat=True))
+    else:
+        firm_ids = pk_set or []
+    owner_ids = AccountingFirm.objects.filter(id__in=firm_ids).values_list('owner_id', flat=True)
+    invalidate_client_scope([instance.id, *owner_ids])
+    if action == 'pre_clear':
+        # post_clear'da pk_set gelmediği için büroları sonraya sakla
+        instance._cleared_firm_ids = firm_ids
+    elif action == 'post_clear':
+        refresh_firm_stats(getattr(instance, '_cleared_firm_ids', []))
+    else:
+        refresh_firm_stats(firm_ids)
+
+
+@receiver(post_save, sender=AccountingFirm)
+@receiver(post_delete, sender=AccountingFirm)
+def invalidate_scope_on_firm_change(sender, instance, **kwargs):
+    invalidate_client_scope([instance.owner_id])
+
+
+@receiver(pre_delete, sender=User)
+def capture_client_firms(sender, instance, **kwargs):
+    # Büro bağlantıları m2m sinyali olmadan silinir; bürolar silinmeden önce okunur
+    instance._deleted_firm_ids = list(instance.accounting_firms.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def refresh_firms_on_client_delete(sender, instance, **kwargs):
+    firm_ids = getattr(instance, '_deleted_firm_ids', [])
+    if firm_ids:
+        owner_ids = AccountingFirm.objects.filter(id__in=firm_ids).values_list('owner_id', flat=True)
+        invalidate_client_scope(owner_ids)
+        refresh_firm_stats(firm_ids)
+
+
+@receiver(post_save, sender=User)
+def refresh_firms_on_client_activation(sender, instance, created, raw=False, **kwargs):
+    loaded = getattr(instance, '_loaded_is_active', None)
+    instance._loaded_is_active = instance.is_active
+    if raw or created or loaded is None or loaded == instance.is_active:
+        return
+    firm_ids = list(instance.accounting_firms.values_list('id', flat=True))
+    if firm_ids:
+        refresh_firm_stats(firm_ids)
+
+
+@receiver(pre_save, sender=Document)
+def capture_document_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    load_previous_rollup(instance)
+
+
+@receiver(post_save, sender=Document)
+def update_aggregates_on_document_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    record_document_saved(instance, created)
+    record_document_rollup(instance, created)
+
+
+@receiver(post_delete, sender=Document)
+def update_aggregates_on_document_delete(sender, instance, **kwargs):
+    record_document_deleted(instance)
+    record_document_rollup_deleted(instance)
+
+
+@receiver(post_delete, sender=Document)
+@receiver(post_delete, sender=ClientDocument)
+@receiver(post_delete, sender='chat.Message')
+def schedule_file_deletion_on_delete(sender, instance, **kwargs):
+    # Storage isteği yapılmaz; dosya silme kuyruğuna kaydı silen transaction içinde eklenir
+    if instance.file:
+        schedule_file_deletion([instance.file.name])
+
+
+@receiver(post_save, sender=Vendor)
+def update_vendor_index(sender, instance, **kwargs):
+    # Geri alınan bir transaction'daki satıcı indekste kalırsa fişler olmayan kayda bağlanır
+    transaction.on_commit(lambda: vendor_index.add(instance))
+
+
+@receiver(post_delete, sender=Vendor)
+def evict_deleted_vendor(sender, instance, **kwargs):
+    vendor_id = instance.id
+    transaction.on_commit(lambda: vendor_index.discard(vendor_id))
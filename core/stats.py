@@ -0,0 +1,289 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+PROCESSED_STATUSES = ('completed', 'rejected')
+
+# Büro panosundaki son aktiviteler için saklanan belge sayısı
+RECENT_DOCUMENTS = 5
+
+
+def status_delta(status, sign=1):
+    """Bir belgenin sayaçlara katkısı"""
+    return {
+        'pending': sign if status == 'pending' else 0,
+        'processed': sign if status in PROCESSED_STATUSES else 0,
+    }
+
+
+def apply_stats_delta(user_ids, total=0, pending=0, processed=0, activity_at=None, recent=()):
+    """
+    Kullanıcı(lar)ın ve bağlı oldukları büroların sayaçlarını tek UPDATE ile artırır/azaltır.
+    Eksik sayaç satırı sadece artışta oluşturulur; azaltma (ör. kullanıcı silinirken belgelerinin
+    silinmesi) satır yaratmaz, aksi halde silinmekte olan kullanıcıya bağlı satır FK hatası verir.
+    Büro sayaçları sadece aktif müşterilerin belgelerini içerir (panodaki müşteri kapsamı gibi).
+
+    Args:
+        user_ids: Belgeleri değişen kullanıcılar (aynı delta hepsine uygulanır)
+        recent: Büroların son aktivite listesine eklenecek (belge id, kullanıcı id) çiftleri, yeniden eskiye
+    """
+    from .models import AccountingFirm, FirmDocumentStats, UserDocumentStats
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    updates = {}
+    if total:
+        updates['total'] = F('total') + total
+    if pending:
+        updates['pending'] = F('pending') + pending
+    if processed:
+        updates['processed'] = F('processed') + processed
+    if activity_at is not None:
+        # GREATEST PostgreSQL'de NULL'ı yok sayar, SQLite'ta NULL döner
+        updates['last_activity'] = Greatest(Coalesce(F('last_activity'), Value(activity_at)), Value(activity_at))
+    if not updates:
+        return
+
+    creates = total > 0 or pending > 0 or processed > 0
+
+    firm_clients = {}
+    for firm_id, client_id in AccountingFirm.clients.through.objects.filter(
+        user_id__in=user_ids, user__is_active=True
+    ).values_list('accountingfirm_id', 'user_id'):
+        firm_clients.setdefault(firm_id, set()).add(client_id)
+
+    with transaction.atomic():
+        if creates:
+            _ensure_rows(UserDocumentStats, 'user_id', user_ids)
+        UserDocumentStats.objects.filter(user_id__in=user_ids).update(**updates)
+        if not firm_clients:
+            return
+        if creates:
+            _ensure_rows(FirmDocumentStats, 'firm_id', firm_clients)
+        recent_lists = _recent_lists(firm_clients, recent) if recent else {}
+        # Büroda birden fazla kullanıcı değiştiyse delta kullanıcı sayısı kadar uygulanmalı
+        per_firm = {}
+        for firm_id, clients in firm_clients.items():
+            if firm_id in recent_lists:
+                # Listesi değişen büro kendi UPDATE'ini alır
+                per_firm[(len(clients), firm_id)] = [firm_id]
+            else:
+                per_firm.setdefault((len(clients), None), []).append(firm_id)
+        for (count, firm_id), ids in per_firm.items():
+            firm_updates = _scale(updates, count, total, pending, processed)
+            if firm_id is not None:
+                firm_updates = {**firm_updates, 'recent_document_ids': recent_lists[firm_id]}
+            FirmDocumentStats.objects.filter(firm_id__in=ids).update(**firm_updates)
+
+
+def _ensure_rows(model, key, ids):
+    model.objects.bulk_create([model(**{key: id_}) for id_ in ids], ignore_conflicts=True)
+
+
+def _recent_lists(firm_clients, recent):
+    """Büro satırlarını kilitleyip son aktivite listelerine yeni belgeleri öne ekler"""
+    from .models import FirmDocumentStats
+
+    lists = {}
+    for firm_id, current in (
+        FirmDocumentStats.objects.select_for_update().filter(firm_id__in=firm_clients)
+        .order_by('firm_id').values_list('firm_id', 'recent_document_ids')
+    ):
+        added = [document_id for document_id, user_id in recent if user_id in firm_clients[firm_id]]
+        if not added:
+            continue
+        merged = list(dict.fromkeys(added + list(current or [])))[:RECENT_DOCUMENTS]
+        if merged != current:
+            lists[firm_id] = merged
+    return lists
+
+
+def _scale(updates, count, total, pending, processed):
+    if count == 1:
+        return updates
+    scaled = dict(updates)
+    if total:
+        scaled['total'] = F('total') + total * count
+    if pending:
+        scaled['pending'] = F('pending') + pending * count
+    if processed:
+        scaled['processed'] = F('processed') + processed * count
+    return scaled
+
+
+def record_document_saved(document, created):
+    old_status = None if created else getattr(document, '_loaded_status', document.status)
+    delta = {'pending': 0, 'processed': 0}
+    if created:
+        delta = status_delta(document.status)
+    elif old_status != document.status:
+        before = status_delta(old_status, -1)
+        after = status_delta(document.status)
+        delta = {key: before[key] + after[key] for key in delta}
+    apply_stats_delta(
+        [document.uploaded_by_id],
+        total=1 if created else 0,
+        activity_at=document.updated_at,
+        recent=[(document.id, document.uploaded_by_id)],
+        **delta
+    )
+    document._loaded_status = document.status
+
+
+def record_document_deleted(document):
+    apply_stats_delta(
+        [document.uploaded_by_id],
+        total=-1,
+        **status_delta(getattr(document, '_loaded_status', document.status), -1)
+    )
+
+
+def record_status_changes(changes, new_status, activity_at):
+    """
+    Toplu durum güncellemesi (queryset.update sinyal tetiklemez) sonrası sayaçları düzelt.
+    Aynı deltaya sahip kullanıcılar tek UPDATE ile güncellenir.
+
+    Args:
+        changes: (belge id, user_id, eski durum) listesi
+    """
+    deltas = {}
+    documents = {}
+    for document_id, user_id, old_status in changes:
+        documents.setdefault(user_id, []).append(document_id)
+        delta = deltas.setdefault(user_id, {'pending': 0, 'processed': 0})
+        before = status_delta(old_status, -1)
+        after = status_delta(new_status)
+        for key in delta:
+            delta[key] += before[key] + after[key]
+
+    groups = {}
+    for user_id, delta in deltas.items():
+        groups.setdefault((delta['pending'], delta['processed']), []).append(user_id)
+    for (pending, processed), user_ids in groups.items():
+        # Aynı anda güncellenen belgeler panoda id sırasıyla (-updated_at, -id) görünür
+        recent = sorted(
+            ((document_id, user_id) for user_id in user_ids for document_id in documents[user_id]), reverse=True
+        )[:RECENT_DOCUMENTS]
+        apply_stats_delta(user_ids, pending=pending, processed=processed, activity_at=activity_at, recent=recent)
+
+
+def document_aggregates(group_field, queryset=None):
+    """Belgelerden sayaçları baştan hesapla (mutabakat için)"""
+    from .models import Document
+
+    queryset = Document.objects.all() if queryset is None else queryset
+    return {
+        row[group_field]: row
+        for row in queryset.values(group_field).annotate(
+            total=Count('id', distinct=True),
+            pending=Count('id', filter=Q(status='pending'), distinct=True),
+            processed=Count('id', filter=Q(status__in=PROCESSED_STATUSES), distinct=True),
+            last_activity=Max('updated_at'),
+        ).order_by()
+        if row[group_field] is not None
+    }
+
+
+STAT_FIELDS = ('total', 'pending', 'processed', 'last_activity')
+
+
+def reconcile_stats(model, key, group_field, ids=None, chunk_size=1000, documents=None):
+    """
+    Sayaç tablosunu belgelerden hesaplanan değerlerle eşitle.
+
+    Args:
+        group_field: Belgelerin gruplanacağı alan (ör. 'uploaded_by')
+        ids: Sadece bu kayıtları düzelt (None ise sayacı veya belgesi olan tümü)
+        documents: Sayılacak belgeler (None ise tümü)
+
+    Returns:
+        int: Düzeltilen satır sayısı
+    """
+    from .models import Document
+
+    documents = Document.objects.all() if documents is None else documents
+    if ids is None:
+        ids = set(model.objects.values_list(key, flat=True)) | set(
+            documents.filter(**{f'{group_field}__isnull': False})
+            .values_list(group_field, flat=True).distinct().order_by()
+        )
+    ids = sorted(ids)
+    fixed = 0
+    for start in range(0, len(ids), chunk_size):
+        fixed += _reconcile_chunk(model, key, group_field, ids[start:start + chunk_size], documents)
+    return fixed
+
+
+def _reconcile_chunk(model, key, group_field, ids, documents):
+    empty = {'total': 0, 'pending': 0, 'processed': 0, 'last_activity': None}
+    with transaction.atomic():
+        # Satırlar kilitlendikten sonra sayılır: eşzamanlı belge yazımının deltası ya sayıma
+        # girer ya da kilit bırakılınca düzeltilmiş değerin üzerine uygulanır, kaybolmaz
+        current = {
+            getattr(stats, key): stats
+            for stats in model.objects.select_for_update().filter(**{f'{key}__in': ids}).order_by(key)
+        }
+        aggregates = document_aggregates(group_field, documents.filter(**{f'{group_field}__in': ids}))
+
+        drifted = []
+        for id_ in ids:
+            expected = aggregates.get(id_, empty)
+            stats = current.get(id_)
+            if stats is not None and all(getattr(stats, field) == expected[field] for field in STAT_FIELDS):
+                continue
+            drifted.append(model(**{key: id_}, **{field: expected[field] for field in STAT_FIELDS}))
+
+        if drifted:
+            model.objects.bulk_create(
+                drifted,
+                update_conflicts=True,
+                unique_fields=[key.removesuffix('_id')],
+                update_fields=list(STAT_FIELDS),
+            )
+    return len(drifted)
+
+
+FIRM_GROUP_FIELD = 'uploaded_by__accounting_firms'
+
+
+def reconcile_firm_stats(firm_ids=None):
+    """
+    Büro sayaçlarını ve son aktivite listelerini aktif müşterilerin belgelerinden yeniden hesapla.
+
+    Returns:
+        int: Düzeltilen satır sayısı
+    """
+    from .models import Document, FirmDocumentStats
+
+    fixed = reconcile_stats(
+        FirmDocumentStats, 'firm_id', FIRM_GROUP_FIELD, ids=firm_ids,
+        documents=Document.objects.filter(uploaded_by__is_active=True)
+    )
+    if firm_ids is None:
+        firm_ids = FirmDocumentStats.objects.values_list('firm_id', flat=True)
+    return fixed + _reconcile_recent(sorted(firm_ids))
+
+
+def _reconcile_recent(firm_ids):
+    from .models import Document, FirmDocumentStats
+
+    fixed = 0
+    for firm_id in firm_ids:
+        with transaction.atomic():
+            stats = FirmDocumentStats.objects.select_for_update().filter(firm_id=firm_id).first()
+            if stats is None:
+                continue
+            expected = list(
+                Document.objects.filter(uploaded_by__accounting_firms=firm_id, uploaded_by__is_active=True)
+                .order_by('-updated_at', '-id').values_list('id', flat=True)[:RECENT_DOCUMENTS]
+            )
+            if stats.recent_document_ids != expected:
+                FirmDocumentStats.objects.filter(firm_id=firm_id).update(recent_document_ids=expected)
+                fixed += 1
+    return fixed
+
+
+def refresh_firm_stats(firm_ids):
+    """Müşteri listesi veya müşterilerinin aktifliği değişen büroların sayaçlarını yeniden hesapla"""
+    return reconcile_firm_stats(firm_ids)
@@ -0,0 +1,389 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .events import notify_document_event
+from .llm import CircuitOpenError, LLMError, RetryableLLMError
+
+logger = logging.getLogger(__name__)
+
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BULK = 'bulk'
+
+
+@dataclass
+class AnalysisJob:
+    document_id: int
+    image_data: bytes = None  # Yükleme sırasında bellekte olan içerik
+    attempt: int = 0
+    tenant_id: int = None  # Yükleyenin bağlı olduğu AccountingFirm
+    weight: int = 1
+    concurrency: int = 1
+    priority: str = PRIORITY_INTERACTIVE
+    enqueued_at: float = field(default_factory=time.monotonic)
+    queued_at: float = field(default_factory=time.monotonic)  # Kuyruğa son giriş (tekrar denemede yenilenir)
+
+
+class TenantQueue:
+    """Tek bir büronun bekleyen işleri ve zamanlama durumu"""
+
+    def __init__(self, tenant_id):
+        self.tenant_id = tenant_id
+        self.jobs = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BULK: deque()}
+        self.weight = 1
+        self.concurrency = 1
+        self.active = 0
+        self.virtual_time = 0.0
+        self.dispatched = 0
+        self.avg_wait = 0.0
+
+    def depth(self):
+        return sum(len(jobs) for jobs in self.jobs.values())
+
+
+class AnalysisQueue:
+    """
+    Fiş analizlerini istek dışında çalıştıran süreç içi iş kuyruğu.
+    İşçi thread'leri ilk iş geldiğinde başlatılır.
+
+    İşler büro bazında ağırlıklı adil sırayla dağıtılır: her büronun sanal zamanı
+    aldığı iş başına 1/ağırlık kadar ilerler ve sıradaki iş sanal zamanı en geride
+    olan bürodan alınır. Bir büronun aynı anda işlenen toplu işi abonelik planındaki
+    eşzamanlılık sınırını aşamaz. Tekil yüklemeler toplu yeniden analizlerden önce gelir.
+
+    İşler sadece bu süreçte tutulduğu için belgelerde bir kira süresi saklanır; kuyruktaki
+    işlerin kirası düzenli yenilenir, süreç yeniden başlarsa kirası dolan belgeler
+    requeue_stale_analyses ile tekrar kuyruğa alınır.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._tenants = {}
+        self._virtual_time = 0.0
+        self._workers = []
+        self._tracked = set()  # Kuyrukta bekleyen veya işlenen belge id'leri
+        self._requeue_thread = None
+
+    def submit(self, job):
+        self._ensure_workers()
+        with self._cond:
+            self._tracked.add(job.document_id)
+            tenant = self._tenants.get(job.tenant_id)
+            if tenant is None:
+                tenant = self._tenants[job.tenant_id] = TenantQueue(job.tenant_id)
+            if not tenant.depth() and not tenant.active:
+                # Boşta kalan büro geçmişe dönük pay biriktirmesin
+                tenant.virtual_time = max(tenant.virtual_time, self._virtual_time)
+            tenant.weight = max(job.weight, 1)
+            tenant.concurrency = max(job.concurrency, 1)
+            job.queued_at = time.monotonic()
+            tenant.jobs[job.priority].append(job)
+            self._cond.notify()
+
+    def retry_later(self, job, delay):
+        timer = threading.Timer(delay, self.submit, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def qsize(self):
+        with self._cond:
+            return sum(tenant.depth() for tenant in self._tenants.values())
+
+    def tracked_ids(self):
+        with self._cond:
+            return set(self._tracked)
+
+    def start_requeue_loop(self):
+        """Kirası dolan analizleri düzenli olarak kuyruğa alan thread'i başlat (web sürecinde)"""
+        with self._cond:
+            if self._requeue_thread is not None:
+                return
+            self._requeue_thread = threading.Thread(
+                target=self._requeue_loop, name='receipt-analysis-requeue', daemon=True
+            )
+            self._requeue_thread.start()
+
+    def _requeue_loop(self):
+        while True:
+            close_old_connections()
+            try:
+                requeue_stale_analyses()
+            except Exception as e:
+                logger.exception(f"Bekleyen analizler kuyruğa alınamadı: {str(e)}")
+            finally:
+                close_old_connections()
+            time.sleep(settings.RECEIPT_ANALYSIS['REQUEUE_INTERVAL'])
+
+    def stats(self):
+        """Büro bazında kuyruk derinliği ve bekleme süreleri (bu süreç için)"""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                tenant_id: {
+                    'interactive': len(tenant.jobs[PRIORITY_INTERACTIVE]),
+                    'bulk': len(tenant.jobs[PRIORITY_BULK]),
+                    'active': tenant.active,
+                    'weight': tenant.weight,
+                    'concurrency': tenant.concurrency,
+                    'oldest_wait': max(
+                        (now - jobs[0].queued_at for jobs in tenant.jobs.values() if jobs),
+                        default=0.0
+                    ),
+                    'avg_wait': tenant.avg_wait,
+                    'dispatched': tenant.dispatched,
+                }
+                for tenant_id, tenant in self._tenants.items()
+            }
+
+    def _ensure_workers(self):
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(settings.RECEIPT_ANALYSIS['WORKERS']):
+                worker = threading.Thread(
+                    target=self._work, name=f'receipt-analysis-{i}', daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _next_batch(self):
+        """Sıradaki büroyu seç ve işlerinden bir toplu iş çıkar (kilit altında çağrılır)"""
+        for priority in (PRIORITY_INTERACTIVE, PRIORITY_BULK):
+            eligible = [
+                tenant for tenant in self._tenants.values()
+                if tenant.jobs[priority] and tenant.active < tenant.concurrency
+            ]
+            if not eligible:
+                continue
+            tenant = min(eligible, key=lambda t: t.virtual_time)
+            jobs = tenant.jobs[priority]
+            batch = [jobs.popleft()]
+            # Aynı büronun bekleyen işleri (toplu yükleme) tek model çağrısında birleştirilir
+            while jobs and len(batch) < settings.RECEIPT_ANALYSIS['BATCH_SIZE']:
+                batch.append(jobs.popleft())
+
+            now = time.monotonic()
+            for job in batch:
+                tenant.avg_wait = 0.8 * tenant.avg_wait + 0.2 * (now - job.queued_at)
+            tenant.dispatched += len(batch)
+            tenant.active += 1
+            tenant.virtual_time += len(batch) / tenant.weight
+            self._virtual_time = tenant.virtual_time
+            return tenant, batch
+        return None, None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                tenant, jobs = self._next_batch()
+                while jobs is None:
+                    self._cond.wait()
+                    tenant, jobs = self._next_batch()
+
+            close_old_connections()
+            try:
+                run_analysis_jobs(jobs)
+            except Exception as e:
+                logger.exception(f"Analiz işi beklenmedik şekilde sonlandı ({[j.document_id for j in jobs]}): {str(e)}")
+            finally:
+                close_old_connections()
+                with self._cond:
+                    # Tekrar denenecek işlerin kirası _handle_failure'da bekleme süresi kadar uzatıldı
+                    self._tracked.difference_update(job.document_id for job in jobs)
+                    tenant.active -= 1
+                    if not tenant.depth() and not tenant.active:
+                        del self._tenants[tenant.tenant_id]
+                    # Sınıra takılan büronun işleri artık alınabilir
+                    self._cond.notify_all()
+
+
+analysis_queue = AnalysisQueue()
+
+
+def resolve_analysis_tenant(user):
+    """
+    Kullanıcının bağlı olduğu büroyu ve abonelik planından gelen zamanlama ayarlarını döndür.
+
+    Returns:
+        tuple: (firm_id, weight, concurrency)
+    """
+    from .models import AccountantSubscription, AccountingFirm
+
+    config = settings.RECEIPT_ANALYSIS
+    firm_id = (
+        AccountingFirm.objects.filter(Q(clients=user) | Q(owner=user))
+        .order_by('id').values_list('id', flat=True).first()
+    )
+    if firm_id is None:
+        return None, config['DEFAULT_TENANT_WEIGHT'], config['DEFAULT_TENANT_CONCURRENCY']
+
+    subscription = (
+        AccountantSubscription.objects.filter(accountant__owned_firm=firm_id, status='active')
+        .filter(Q(end_date__isnull=True) | Q(end_date__gt=timezone.now()))
+        .select_related('plan')
+        .first()
+    )
+    if subscription is None:
+        return firm_id, config['DEFAULT_TENANT_WEIGHT'], config['DEFAULT_TENANT_CONCURRENCY']
+    return firm_id, subscription.plan.analysis_weight, subscription.plan.analysis_concurrency
+
+
+def analysis_lease(extra_seconds=0):
+    """Şu andan itibaren geçerli kira bitiş zamanı"""
+    return timezone.now() + timedelta(seconds=settings.RECEIPT_ANALYSIS['LEASE_SECONDS'] + extra_seconds)
+
+
+def enqueue_receipt_analysis(document, image_data=None, priority=PRIORITY_INTERACTIVE):
+    """Belgeyi analiz bekliyor olarak işaretle, transaction commit olunca kuyruğa al"""
+    if document.analysis_status != 'pending' or document.analysis_lease_until is None:
+        document.analysis_status = 'pending'
+        document.analysis_lease_until = analysis_lease()
+        document.save(update_fields=['analysis_status', 'analysis_lease_until'])
+
+    tenant_id, weight, concurrency = resolve_analysis_tenant(document.uploaded_by)
+    job = AnalysisJob(
+        document_id=document.id,
+        image_data=image_data,
+        tenant_id=tenant_id,
+        weight=weight,
+        concurrency=concurrency,
+        priority=priority,
+    )
+    transaction.on_commit(lambda: analysis_queue.submit(job))
+
+
+def requeue_stale_analyses(limit=None):
+    """
+    Bu sürecin kuyruğundaki işlerin kirasını yeniler; kirası dolmuş (süreç yeniden başlamış
+    veya çökmüş) ya da hiç kuyruğa alınmamış bekleyen analizleri toplu öncelikle kuyruğa alır.
+    Kuyruk doluysa yeni belge toplanmaz.
+
+    Returns:
+        int: Kuyruğa alınan belge sayısı
+    """
+    from .models import Document
+
+    config = settings.RECEIPT_ANALYSIS
+    tracked = analysis_queue.tracked_ids()
+    if tracked:
+        Document.objects.filter(
+            id__in=tracked, analysis_status__in=('pending', 'processing')
+        ).update(analysis_lease_until=analysis_lease())
+
+    limit = config['REQUEUE_BATCH'] if limit is None else limit
+    limit = min(limit, config['REQUEUE_MAX_QUEUED'] - analysis_queue.qsize())
+    if limit <= 0:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Aynı anda çalışan başka bir süreç aynı belgeleri almasın
+        ids = list(
+            Document.objects.filter(analysis_status__in=('pending', 'processing'))
+            .filter(Q(analysis_lease_until__isnull=True) | Q(analysis_lease_until__lt=now))
+            .exclude(id__in=tracked)
+            .order_by('analysis_lease_until', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return 0
+        Document.objects.filter(id__in=ids).update(
+            analysis_status='pending', analysis_lease_until=analysis_lease()
+        )
+
+    tenants = {}
+    for document_id, user_id in Document.objects.filter(id__in=ids).values_list('id', 'uploaded_by_id'):
+        if user_id not in tenants:
+            tenants[user_id] = resolve_analysis_tenant(user_id)
+        tenant_id, weight, concurrency = tenants[user_id]
+        analysis_queue.submit(AnalysisJob(
+            document_id=document_id,
+            tenant_id=tenant_id,
+            weight=weight,
+            concurrency=concurrency,
+            priority=PRIORITY_BULK,
+        ))
+    logger.info(f"{len(ids)} bekleyen analiz tekrar kuyruğa alındı")
+    return len(ids)
+
+
+def run_analysis_jobs(jobs):
+    from .analysis import analyze_receipts_batch
+    from .dedup import flag_near_duplicate
+    from .models import Document
+
+    jobs_by_id = {job.document_id: job for job in jobs}
+    Document.objects.filter(
+        id__in=jobs_by_id
+    ).exclude(analysis_status='completed').update(
+        analysis_status='processing', analysis_lease_until=analysis_lease(), updated_at=timezone.now()
+    )
+    # Silinmiş veya başka bir iş tarafından tamamlanmış belgeler atlanır
+    documents = Document.objects.filter(id__in=jobs_by_id, analysis_status='processing').in_bulk()
+
+    items = []
+    for document_id, document in documents.items():
+        job = jobs_by_id[document_id]
+        try:
+            if job.image_data is None:
+                with document.file.open('rb') as image_file:
+                    job.image_data = image_file.read()
+            if document.perceptual_hash is None:
+                flag_near_duplicate(document, job.image_data)
+        except Exception as e:
+            _handle_failure(job, e)
+            continue
+        items.append((document, job.image_data))
+
+    try:
+        results = analyze_receipts_batch(items)
+    except Exception as e:
+        # Beklenmedik hata tüm toplu işi "processing"te bırakmasın; her belge kendi denemesine döner
+        logger.exception(f"Toplu analiz beklenmedik şekilde başarısız: {str(e)}")
+        results = {document.id: e for document, _ in items}
+    for document, _ in items:
+        # Sonucu dönmeyen belge de başarısız sayılır
+        results.setdefault(document.id, RuntimeError('Analiz sonucu alınamadı'))
+    for document_id, error in results.items():
+        job = jobs_by_id[document_id]
+        if error is None:
+            logger.info(
+                f"Fiş analizi tamamlandı: {document_id} "
+                f"({time.monotonic() - job.enqueued_at:.1f}s, deneme {job.attempt + 1})"
+            )
+        else:
+            _handle_failure(job, error)
+
+
+def _handle_failure(job, error):
+    from .models import Document
+
+    config = settings.RECEIPT_ANALYSIS
+    # Geçersiz istek/yetki gibi model hataları tekrar denemeyle düzelmez
+    permanent = isinstance(error, LLMError) and not isinstance(error, (RetryableLLMError, CircuitOpenError))
+    if job.attempt < config['MAX_RETRIES'] and not permanent:
+        # Model istemcisi tekrar denemez; tek tekrar deneme katmanı burasıdır
+        delay = config['RETRY_BACKOFF'] * (2 ** job.attempt) * (1 + random.random() / 2)
+        logger.warning(f"Fiş analizi başarısız, {delay:.1f}s sonra tekrar denenecek ({job.document_id}): {str(error)}")
+        Document.objects.filter(id=job.document_id).update(
+            analysis_status='pending', analysis_lease_until=analysis_lease(delay)
+        )
+        job.attempt += 1
+        analysis_queue.retry_later(job, delay)
+    else:
+        logger.error(f"Fiş analizi {job.attempt + 1} denemede başarısız ({job.document_id}): {str(error)}")
+        Document.objects.filter(id=job.document_id).update(analysis_status='failed')
+        document = Document.objects.filter(id=job.document_id).first()
+        if document:
+            notify_document_event(document, 'document.analysis_failed')
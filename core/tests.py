@@ -1,3 +1,1271 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from asgiref.sync import async_to_sync
+from botocore.response import StreamingBody
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chat.models import Message, Room
+from core import downloads, receipt_images
+from core.consumers import UserEventConsumer
+from core.analysis import MalformedBatchResponse, analyze_receipts_batch, apply_analysis, image_content, map_batch_response
+from core.dedup import find_cached_analysis
+from core.deletions import drain_file_deletions, schedule_file_deletion, url_key_candidates
+from core.events import notify_document_event
+from core.expiry import send_expiry_digests
+from core.llm import AnalysisClient, CircuitBreaker, FakeBackend, CircuitOpenError, LLMError, RetryableLLMError
+from core.models import (
+    NO_VAT_RATE, AccountingFirm, ClientDocument, DeviceToken, Document, ExpiryNotice, FirmDocumentStats,
+    MonthlyDocumentRollup, PendingFileDeletion, PushNotification, ReceiptSeller, User, UserDocumentStats, Vendor
+)
+from core.rollups import monthly_series
+from core.scope import get_client_scope
+from core.vendors import VendorIndex, fold_turkish, vendor_key
+from core.push import LocalPushBackend, queue_push, send_pending_push_notifications
+from core.serializers import DocumentSerializer
+from core.tasks import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, AnalysisJob, _handle_failure, requeue_stale_analyses,
+    run_analysis_jobs
+)
+from rest_framework.test import APIClient
+
+
+class LocalPushServer:
+    """
+    FCM yerine çalışan yerel HTTP sunucusu (LocalPushBackend için).
+    respond(tokens) her token için None (başarılı) veya hata kodu döner;
+    istisna fırlatırsa sunucu 500 yanıt verir.
+    """
+
+    def __init__(self, respond):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                server.requests.append(payload)
+                try:
+                    errors = respond(payload['tokens'])
+                except Exception:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                body = json.dumps({'responses': [
+                    {'success': True} if error is None else {'success': False, 'error': error}
+                    for error in errors
+                ]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/fcm/send'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def sent_tokens(self):
+        return [token for payload in self.requests for token in payload['tokens']]
+
+
+def push_settings(server, **overrides):
+    return override_settings(PUSH_NOTIFICATIONS={
+        **settings.PUSH_NOTIFICATIONS, 'BACKEND': 'local', 'LOCAL_ENDPOINT': server.url, **overrides
+    })
+
+
+class PushNotificationTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(f'mukellef{index}@example.com', user_type='client')
+            for index in range(3)
+        ]
+        for user in self.users:
+            DeviceToken.objects.create(user=user, token=f'token-{user.email}')
+        queue_push([user.id for user in self.users], 'document_1', 'Belge', 'Belgeniz işlendi')
+
+    def test_same_payload_is_sent_as_one_multicast(self):
+        with LocalPushServer(lambda tokens: [None] * len(tokens)) as server, push_settings(server):
+            result = send_pending_push_notifications()
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(result, {'notifications': 3, 'sent': 3, 'failed': 0, 'pruned': 0})
+        self.assertFalse(PushNotification.objects.exists())
+
+    def test_only_failed_chunk_is_retried(self):
+        calls = []
+
+        def respond(tokens):
+            calls.append(tokens)
+            if len(calls) == 2:
+                raise RuntimeError('servis hatası')
+            return [None] * len(tokens)
+
+        with LocalPushServer(respond) as server, push_settings(server, MULTICAST_LIMIT=2):
+            first = send_pending_push_notifications()
+            second = send_pending_push_notifications()
+
+        self.assertEqual(first['sent'], 2)
+        self.assertEqual(first['failed'], 1)
+        # İkinci turda sadece başarısız parçanın token'ı tekrar gider
+        self.assertEqual(calls[2], calls[1])
+        self.assertEqual(second['sent'], 1)
+        self.assertEqual(len(server.sent_tokens()), 4)
+        self.assertFalse(PushNotification.objects.exists())
+
+    def test_only_permanent_token_errors_are_pruned(self):
+        errors = {
+            'token-mukellef0@example.com': 'UNREGISTERED',
+            'token-mukellef1@example.com': 'INVALID_ARGUMENT',
+        }
+        with LocalPushServer(lambda tokens: [errors.get(token) for token in tokens]) as server, \
+                push_settings(server):
+            result = send_pending_push_notifications()
+
+        self.assertEqual(result['pruned'], 1)
+        self.assertEqual(
+            set(DeviceToken.objects.values_list('token', flat=True)),
+            {'token-mukellef1@example.com', 'token-mukellef2@example.com'}
+        )
+
+    def test_notification_overwritten_after_load_is_kept(self):
+        test = self
+
+        class OverwritingBackend(LocalPushBackend):
+            def send_multicast(self, *args):
+                # Gönderim sürerken aynı anahtarla yeni bildirim gelir
+                queue_push([test.users[0].id], 'document_1', 'Belge', 'Belgeniz tekrar işlendi')
+                return super().send_multicast(*args)
+
+        with LocalPushServer(lambda tokens: [None] * len(tokens)) as server, push_settings(server), \
+                mock.patch('core.push.get_push_backend', OverwritingBackend):
+            send_pending_push_notifications()
+
+        pending = PushNotification.objects.get()
+        self.assertEqual(pending.user_id, self.users[0].id)
+        self.assertEqual(pending.body, 'Belgeniz tekrar işlendi')
+
+
+def create_document(user, **fields):
+    fields.setdefault('document_type', 'receipt')
+    fields.setdefault('file', f'documents/{user.id}/fis.jpg')
+    fields.setdefault('date', date(2026, 3, 15))
+    return Document.objects.create(uploaded_by=user, **fields)
+
+
+class ReceiptAnalysisTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+
+    def test_apply_analysis_keeps_concurrent_status_change(self):
+        document = create_document(self.user, analysis_status='processing')
+        other = Document.objects.get(pk=document.pk)
+        other.status = 'completed'
+        other.save()
+
+        updated = apply_analysis(document, {'total_amount': 120, 'vat_amount': 20, 'items': []})
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'completed')
+        self.assertEqual(document.analysis_status, 'completed')
+        self.assertEqual(document.amount, Decimal('120.00'))
+        self.assertIsNone(document.analysis_lease_until)
+        self.assertEqual(updated.status, 'completed')
+
+    def test_unexpected_batch_error_returns_jobs_to_retry(self):
+        documents = [create_document(self.user, analysis_status='pending') for _ in range(3)]
+        jobs = [AnalysisJob(document_id=document.id, image_data=b'fis') for document in documents]
+
+        with mock.patch('core.dedup.flag_near_duplicate'), \
+                mock.patch('core.analysis.analyze_receipts_batch', side_effect=KeyError('beklenmedik')), \
+                mock.patch('core.tasks.analysis_queue.retry_later') as retry_later:
+            run_analysis_jobs(jobs)
+
+        self.assertEqual(retry_later.call_count, 3)
+        self.assertEqual(
+            set(Document.objects.values_list('analysis_status', flat=True)), {'pending'}
+        )
+
+    def test_reanalyze_command_hands_documents_to_the_queue(self):
+        old = timezone.now() - timedelta(days=1)
+        candidate = create_document(self.user, analysis_status='failed')
+        live = create_document(self.user, analysis_status='processing',
+                               analysis_lease_until=timezone.now() + timedelta(minutes=5))
+        analyzed = create_document(self.user, analysis_status='completed', analyzed_data={'total_amount': 1})
+        Document.objects.update(created_at=old)
+
+        with mock.patch('core.tasks.analysis_queue.submit') as submit:
+            call_command('reanalyze_documents', restart=True, checkpoint='/tmp/reanalyze_test.checkpoint',
+                         stdout=io.StringIO())
+            requeue_stale_analyses()
+
+        self.assertEqual([call.args[0].document_id for call in submit.call_args_list], [candidate.id])
+        self.assertEqual(submit.call_args.args[0].priority, PRIORITY_BULK)
+        live.refresh_from_db()
+        analyzed.refresh_from_db()
+        self.assertEqual((live.analysis_status, analyzed.analysis_status), ('processing', 'completed'))
+
+    def test_stale_analyses_are_requeued_with_bulk_priority(self):
+        now = timezone.now()
+        stale = create_document(self.user, analysis_status='processing',
+                                analysis_lease_until=now - timedelta(minutes=1))
+        unleased = create_document(self.user, analysis_status='pending')
+        create_document(self.user, analysis_status='pending', analysis_lease_until=now + timedelta(minutes=5))
+        create_document(self.user, analysis_status='completed')
+
+        with mock.patch('core.tasks.analysis_queue.submit') as submit:
+            self.assertEqual(requeue_stale_analyses(), 2)
+
+        jobs = [call.args[0] for call in submit.call_args_list]
+        self.assertEqual({job.document_id for job in jobs}, {stale.id, unleased.id})
+        self.assertTrue(all(job.priority == PRIORITY_BULK for job in jobs))
+        stale.refresh_from_db()
+        self.assertEqual(stale.analysis_status, 'pending')
+        self.assertGreater(stale.analysis_lease_until, now)
+
+
+class BatchAnalysisTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.backend = FakeBackend()
+        self.client = AnalysisClient(self.backend, settings.RECEIPT_ANALYSIS_CLIENT)
+        patches = [
+            mock.patch('core.analysis.get_analysis_client', return_value=self.client),
+            mock.patch('core.analysis.preprocess_receipt', side_effect=lambda data: [data]),
+            mock.patch.dict(settings.RECEIPT_ANALYSIS_CLIENT, {'FAKE_LATENCY': 0}),
+            mock.patch.dict(settings.RECEIPT_ANALYSIS, {'BATCH_SIZE': 5}),
+            # Süreç genelindeki indeks geri alınan test kayıtlarını tutmasın
+            mock.patch('core.vendors.vendor_index', VendorIndex()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _items(self, count):
+        return [(create_document(self.user, analysis_status='processing'), b'fis %d' % index) for index in range(count)]
+
+    def test_batch_is_one_model_call(self):
+        items = self._items(5)
+        with mock.patch.object(self.backend, 'complete', wraps=self.backend.complete) as complete:
+            results = analyze_receipts_batch(items)
+
+        self.assertEqual(results, {document.id: None for document, _ in items})
+        self.assertEqual(complete.call_count, 1)
+        self.assertEqual(
+            set(Document.objects.values_list('analysis_status', flat=True)), {'completed'}
+        )
+
+    def test_malformed_batch_response_falls_back_to_single_calls(self):
+        items = self._items(3)
+        replies = iter([('{"seller_name": "tek nesne"}', {})])
+
+        def complete(messages, max_tokens, timeout):
+            return next(replies, None) or FakeBackend.complete(self.backend, messages, max_tokens, timeout)
+
+        with mock.patch.object(self.backend, 'complete', side_effect=complete) as backend_complete:
+            results = analyze_receipts_batch(items)
+
+        self.assertEqual(results, {document.id: None for document, _ in items})
+        self.assertEqual(backend_complete.call_count, 1 + 3)
+
+
+class BatchResponseMappingTests(SimpleTestCase):
+    def test_items_are_matched_by_receipt_id(self):
+        mapped = map_batch_response('[{"receipt_id": 8, "seller_name": "B"}, {"receipt_id": 7, "seller_name": "A"}]', [7, 8])
+        self.assertEqual(mapped, {7: {'seller_name': 'A'}, 8: {'seller_name': 'B'}})
+
+    def test_items_without_ids_are_matched_by_position(self):
+        mapped = map_batch_response('```json\n[{"seller_name": "A"}, {"seller_name": "B"}]\n```', [7, 8])
+        self.assertEqual(mapped, {7: {'seller_name': 'A'}, 8: {'seller_name': 'B'}})
+
+    def test_wrong_length_is_malformed(self):
+        with self.assertRaises(MalformedBatchResponse):
+            map_batch_response('[{"seller_name": "A"}]', [7, 8])
+
+
+class VendorIndexTests(TestCase):
+    def test_turkish_case_folding(self):
+        self.assertEqual({fold_turkish(name) for name in ('MİGROS', 'Mıgros', 'migros')}, {'migros'})
+        self.assertEqual(fold_turkish('IŞIK ŞÖLEN ÇAĞ'), 'isik solen cag')
+
+    def test_legal_suffixes_are_stripped(self):
+        self.assertEqual(vendor_key('Migros Ticaret A.Ş.'), 'migros')
+        self.assertEqual(vendor_key('ABC Gıda San. ve Tic. Ltd. Şti.'), 'abc gida')
+        # Tek kelimelik ad ek olsa da korunur
+        self.assertEqual(vendor_key('Ticaret'), 'ticaret')
+
+    def test_longest_prefix_match(self):
+        migros = Vendor.objects.create(name='Migros', normalized_name='migros')
+        jet = Vendor.objects.create(name='Migros Jet', normalized_name='migros jet', aliases=['mjet'])
+        index = VendorIndex()
+        index.refresh()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(index.match('MİGROS JET KADIKÖY')[0], jet.id)
+            self.assertEqual(index.match('Migros Kadıköy A.Ş.')[0], migros.id)
+            self.assertEqual(index.match('MJET Ataşehir')[0], jet.id)
+            self.assertIsNone(index.match('Mig'))
+            self.assertIsNone(index.match('Jet Migros'))
+
+    def test_deleted_and_deactivated_vendors_are_evicted(self):
+        index = VendorIndex()
+        with mock.patch('core.signals.vendor_index', index):
+            with self.captureOnCommitCallbacks(execute=True):
+                vendor = Vendor.objects.create(name='Şok', normalized_name='sok')
+            self.assertEqual(index.match('ŞOK MARKET')[0], vendor.id)
+
+            vendor.is_active = False
+            with self.captureOnCommitCallbacks(execute=True):
+                vendor.save()
+            self.assertIsNone(index.match('ŞOK MARKET'))
+
+            vendor.is_active = True
+            with self.captureOnCommitCallbacks(execute=True):
+                vendor.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                vendor.delete()
+            self.assertIsNone(index.match('ŞOK MARKET'))
+
+    def test_refresh_drops_vendors_deleted_elsewhere(self):
+        vendor = Vendor.objects.create(name='BİM', normalized_name='bim')
+        index = VendorIndex()
+        index.refresh()
+        self.assertIsNotNone(index.match('BİM'))
+
+        # Başka bir süreçte silinmiş gibi: bu sürecin sinyal güncellemesi çalışmaz
+        with self.captureOnCommitCallbacks(execute=False):
+            vendor.delete()
+        index.refresh()
+        self.assertIsNone(index.match('BİM'))
+
+
+class DuplicateScopeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.other = User.objects.create_user('baska@example.com', user_type='client')
+
+    def test_cached_analysis_is_not_shared_across_users(self):
+        create_document(self.other, content_hash='abc', analyzed_data={'total_amount': 50})
+        document = create_document(self.user, content_hash='abc')
+        self.assertIsNone(find_cached_analysis(document))
+
+        create_document(self.user, content_hash='abc', analyzed_data={'total_amount': 70})
+        self.assertEqual(find_cached_analysis(document), {'total_amount': 70})
+
+    def test_duplicate_of_outside_uploader_is_hidden(self):
+        foreign = create_document(self.other)
+        own = create_document(self.user)
+        leaked = create_document(self.user, duplicate_of=foreign)
+        linked = create_document(self.user, duplicate_of=own)
+
+        self.assertIsNone(DocumentSerializer(leaked).data['duplicate_of'])
+        self.assertEqual(DocumentSerializer(linked).data['duplicate_of'], own.id)
+
+
+class AnalysisClientTests(SimpleTestCase):
+    def _client(self, backend):
+        return AnalysisClient(backend, {**settings.RECEIPT_ANALYSIS_CLIENT, 'CIRCUIT_RESET_TIMEOUT': 0})
+
+    def test_unexpected_error_releases_half_open_probe(self):
+        backend = mock.Mock()
+        client = self._client(backend)
+        client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        client.breaker.record_failure()
+
+        backend.complete.side_effect = ValueError('beklenmedik')
+        with self.assertRaises(ValueError):
+            client.complete([], max_tokens=10)
+
+        backend.complete.side_effect = None
+        backend.complete.return_value = ('{}', {'prompt_tokens': 1, 'completion_tokens': 1})
+        self.assertEqual(client.complete([], max_tokens=10), '{}')
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_client_does_not_retry(self):
+        backend = mock.Mock()
+        backend.complete.side_effect = RetryableLLMError('429')
+        with self.assertRaises(RetryableLLMError):
+            self._client(backend).complete([], max_tokens=10)
+        self.assertEqual(backend.complete.call_count, 1)
+
+    def test_breaker_opens_after_threshold_and_fails_fast(self):
+        backend = mock.Mock()
+        backend.complete.side_effect = RetryableLLMError('503')
+        client = AnalysisClient(backend, {
+            **settings.RECEIPT_ANALYSIS_CLIENT, 'CIRCUIT_FAILURE_THRESHOLD': 2, 'CIRCUIT_RESET_TIMEOUT': 60,
+        })
+        for _ in range(2):
+            with self.assertRaises(RetryableLLMError):
+                client.complete([], max_tokens=10)
+
+        with self.assertRaises(CircuitOpenError):
+            client.complete([], max_tokens=10)
+        self.assertEqual(backend.complete.call_count, 2)
+        self.assertEqual(client.stats()['circuit'], 'open')
+
+    def test_half_open_probe_success_closes_breaker(self):
+        backend = mock.Mock()
+        backend.complete.return_value = ('{}', {'prompt_tokens': 1, 'completion_tokens': 1})
+        client = self._client(backend)
+        client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        client.breaker.record_failure()
+        self.assertEqual(client.breaker.state, 'half-open')
+
+        client.complete([], max_tokens=10)
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_client_errors_do_not_open_breaker(self):
+        backend = mock.Mock()
+        backend.complete.side_effect = LLMError('400')
+        client = AnalysisClient(backend, {**settings.RECEIPT_ANALYSIS_CLIENT, 'CIRCUIT_FAILURE_THRESHOLD': 1})
+        for _ in range(3):
+            with self.assertRaises(LLMError):
+                client.complete([], max_tokens=10)
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_concurrency_is_capped(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        class SlowBackend:
+            def complete(self, messages, max_tokens, timeout):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.02)
+                with lock:
+                    active.pop()
+                return '{}', {'prompt_tokens': 0, 'completion_tokens': 0}
+
+        client = AnalysisClient(SlowBackend(), {**settings.RECEIPT_ANALYSIS_CLIENT, 'MAX_CONCURRENCY': 2})
+        threads = [threading.Thread(target=client.complete, args=([], 10)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(peak), 2)
+
+    def test_timeout_and_usage_are_accounted(self):
+        backend = mock.Mock()
+        backend.complete.return_value = ('{}', {'prompt_tokens': 120, 'completion_tokens': 30})
+        client = AnalysisClient(backend, {**settings.RECEIPT_ANALYSIS_CLIENT, 'TIMEOUT': 7})
+        client.complete([], max_tokens=10)
+        client.complete([], max_tokens=10)
+
+        self.assertEqual(backend.complete.call_args.args[2], 7)
+        stats = client.stats()
+        self.assertEqual((stats['calls'], stats['prompt_tokens'], stats['completion_tokens']), (2, 240, 60))
+        self.assertGreaterEqual(stats['avg_latency_ms'], 0)
+
+    def test_openai_errors_are_classified(self):
+        import openai
+
+        from core.llm import OpenAIBackend
+
+        cases = [
+            (openai.error.RateLimitError('429'), RetryableLLMError),
+            (openai.error.APIError('502', http_status=502), RetryableLLMError),
+            (openai.error.InvalidRequestError('400', param=None), LLMError),
+        ]
+        for error, expected in cases:
+            with self.subTest(error=type(error).__name__), \
+                    mock.patch('openai.ChatCompletion.create', side_effect=error):
+                with self.assertRaises(expected) as raised:
+                    OpenAIBackend().complete([], max_tokens=10, timeout=1)
+                self.assertIs(type(raised.exception), expected)
+
+
+class AnalysisRetryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+
+    def _fail(self, error):
+        document = create_document(self.user, analysis_status='processing')
+        job = AnalysisJob(document_id=document.id)
+        with mock.patch('core.tasks.analysis_queue.retry_later') as retry_later:
+            _handle_failure(job, error)
+        document.refresh_from_db()
+        return document.analysis_status, retry_later.call_count
+
+    def test_transient_errors_are_retried_by_the_queue(self):
+        self.assertEqual(self._fail(RetryableLLMError('503')), ('pending', 1))
+        self.assertEqual(self._fail(CircuitOpenError('devre açık')), ('pending', 1))
+
+    def test_permanent_model_error_fails_without_retry(self):
+        self.assertEqual(self._fail(LLMError('geçersiz istek')), ('failed', 0))
+
+
+IN_MEMORY_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class DocumentUploadPriorityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _upload(self, count):
+        files = [SimpleUploadedFile(f'fis{index}.jpg', f'fis {index}'.encode(), 'image/jpeg') for index in range(count)]
+        with mock.patch('core.serializers.enqueue_receipt_analysis') as enqueue:
+            response = self.api.post('/api/v1/documents/', {
+                'document_type': 'receipt', 'date': '2026-03-15', 'file': files
+            }, format='multipart', secure=True)
+        return response, [call.kwargs['priority'] for call in enqueue.call_args_list]
+
+    def test_single_upload_is_interactive(self):
+        response, priorities = self._upload(1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(priorities, [PRIORITY_INTERACTIVE])
+
+    def test_multi_file_upload_is_bulk(self):
+        response, priorities = self._upload(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(priorities, [PRIORITY_BULK] * 3)
+        self.assertEqual(Document.objects.filter(uploaded_by=self.user).count(), 3)
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class FileDeletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def drain(self, errors=()):
+        """Sahte S3 istemcisiyle kuyruğu işle; istek sırasındaki transaction derinliğini kaydet"""
+        baseline = len(connection.atomic_blocks)
+        calls = []
+
+        def delete_objects(Bucket, Delete):
+            calls.append({
+                'keys': sorted(item['Key'] for item in Delete['Objects']),
+                'in_transaction': len(connection.atomic_blocks) > baseline,
+                'claimable': PendingFileDeletion.objects.filter(next_attempt_at__lte=timezone.now()).count(),
+            })
+            return {'Errors': [
+                {'Key': key, 'Code': 'AccessDenied', 'Message': 'yetki yok'} for key in errors
+            ]}
+
+        client = mock.Mock(delete_objects=mock.Mock(side_effect=delete_objects))
+        with mock.patch('core.deletions.s3_client', return_value=client), \
+                mock.patch('core.deletions.storage_key', side_effect=lambda name: name), \
+                mock.patch('core.deletions.default_storage', mock.Mock(bucket_name='test')):
+            return drain_file_deletions(), calls
+
+    def test_delete_records_tombstone_without_storage_call(self):
+        document = create_document(self.user, file='documents/fis.jpg')
+        with mock.patch('core.deletions.s3_client') as client, \
+                mock.patch('core.deletions.deletion_drainer') as drainer, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.api.delete(f'/api/v1/documents/{document.id}/', secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(PendingFileDeletion.objects.values_list('name', flat=True)), ['documents/fis.jpg'])
+        client.assert_not_called()
+        # Storage isteği commit sonrası arka planda yapılır
+        drainer.wake.assert_called_once()
+
+    def test_drain_deletes_skips_referenced_and_retries_failures(self):
+        create_document(self.user, file='documents/kullanimda.jpg')
+        schedule_file_deletion(['documents/silinecek.jpg', 'documents/kullanimda.jpg', 'documents/hatali.jpg'])
+
+        result, calls = self.drain(errors=['documents/hatali.jpg'])
+
+        self.assertEqual(result, {'deleted': 1, 'skipped': 1, 'failed': 1})
+        self.assertEqual(calls[0]['keys'], ['documents/hatali.jpg', 'documents/silinecek.jpg'])
+        # DeleteObjects satır kilitleri bırakıldıktan sonra yapılır; alınan kayıtlar başka worker'a kapalı
+        self.assertFalse(calls[0]['in_transaction'])
+        self.assertEqual(calls[0]['claimable'], 0)
+        failed = PendingFileDeletion.objects.get()
+        self.assertEqual((failed.name, failed.attempts), ('documents/hatali.jpg', 1))
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+        self.assertIn('AccessDenied', failed.last_error)
+
+        PendingFileDeletion.objects.update(next_attempt_at=timezone.now())
+        result, _ = self.drain()
+        self.assertEqual(result, {'deleted': 1, 'skipped': 0, 'failed': 0})
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_replacing_receipt_file_resets_analysis_and_requeues(self):
+        original = create_document(self.user, file='documents/eski.jpg', content_hash='eski')
+        document = create_document(self.user, file='documents/eski2.jpg', content_hash='eski', duplicate_of=original)
+        apply_analysis(document, {'seller_name': 'Migros', 'total_amount': 100, 'vat_amount': 20, 'date': '2026-03-15'})
+        self.assertTrue(ReceiptSeller.objects.filter(document=document).exists())
+
+        with mock.patch('core.vendors.vendor_index', VendorIndex()), \
+                mock.patch('core.tasks.analysis_queue') as queue, \
+                self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('core.deletions.deletion_drainer'):
+            response = self.api.put(f'/api/v1/documents/{document.id}/', {
+                'file': SimpleUploadedFile('yeni.jpg', b'yeni fis', 'image/jpeg'),
+            }, format='multipart', secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        document.refresh_from_db()
+        self.assertNotEqual(document.file.name, 'documents/eski2.jpg')
+        self.assertEqual(
+            (document.analyzed_data, document.amount, document.vat_rate, document.duplicate_of_id),
+            (None, None, None, None)
+        )
+        self.assertEqual(document.content_hash, hashlib.sha256(b'yeni fis').hexdigest())
+        self.assertEqual(document.analysis_status, 'pending')
+        self.assertFalse(ReceiptSeller.objects.filter(document=document).exists())
+        job = queue.submit.call_args.args[0]
+        self.assertEqual((job.document_id, job.image_data), (document.id, b'yeni fis'))
+        self.assertEqual(list(PendingFileDeletion.objects.values_list('name', flat=True)), ['documents/eski2.jpg'])
+
+
+class LocalBucket:
+    """ListObjectsV2 sayfalama ve DeleteObjects'i bellekte taklit eden S3 istemcisi"""
+
+    def __init__(self, objects):
+        self.objects = dict(objects)  # anahtar -> LastModified
+        self.deleted = []
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        return self
+
+    def paginate(self, Bucket, Prefix, PaginationConfig, StartAfter=''):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > StartAfter)
+        size = PaginationConfig['PageSize']
+        for start in range(0, len(keys), size):
+            yield {'Contents': [
+                {'Key': key, 'LastModified': self.objects[key]} for key in keys[start:start + size]
+            ]}
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.deleted.append(item['Key'])
+            self.objects.pop(item['Key'], None)
+        return {}
+
+
+class OrphanedFileCollectionTests(TestCase):
+    def setUp(self):
+        self.accountant = User.objects.create_user('muhasebe@example.com', user_type='accountant')
+        self.client_user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.room = Room.objects.create(name='oda', accountant=self.accountant, client=self.client_user)
+
+    def message(self, url):
+        return Message.objects.create(room=self.room, sender=self.client_user, message_type='file', file_url=url)
+
+    def collect(self, bucket, *args):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('core.management.commands.collect_orphaned_files.s3_client', return_value=bucket), \
+                mock.patch('core.management.commands.collect_orphaned_files.storage_key', side_effect=lambda name: name), \
+                mock.patch('core.management.commands.collect_orphaned_files.storage_name', side_effect=lambda key: key), \
+                mock.patch('core.deletions.storage_key', side_effect=lambda name: name):
+            call_command(
+                'collect_orphaned_files', '--bucket', 'cekfisi', '--page-size', '2',
+                '--checkpoint', os.path.join(directory, 'checkpoint'), *args, stdout=io.StringIO()
+            )
+
+    def test_files_referenced_by_chat_urls_are_kept(self):
+        old = timezone.now() - timedelta(days=7)
+        create_document(self.client_user, file='documents/1/fis.jpg')
+        self.message('https://cekfisi.fra1.digitaloceanspaces.com/chat_files/2026/03/15/rapor%201.pdf')
+        self.message('https://fra1.digitaloceanspaces.com/cekfisi/chat_files/2026/03/15/yol.pdf?X-Amz-Expires=60')
+        self.message('https://cekfisi.fra1.cdn.digitaloceanspaces.com/chat_files/2026/03/15/cdn.pdf')
+        bucket = LocalBucket({
+            'documents/1/fis.jpg': old,
+            'documents/1/sahipsiz.jpg': old,
+            'chat_files/2026/03/15/rapor 1.pdf': old,
+            'chat_files/2026/03/15/yol.pdf': old,
+            'chat_files/2026/03/15/cdn.pdf': old,
+            'chat_files/2026/03/15/sahipsiz.pdf': old,
+            'chat_files/2026/03/15/yeni.pdf': timezone.now(),
+        })
+
+        self.collect(bucket, '--dry-run')
+        self.assertEqual(bucket.deleted, [])
+
+        self.collect(bucket)
+        self.assertEqual(sorted(bucket.deleted), ['chat_files/2026/03/15/sahipsiz.pdf', 'documents/1/sahipsiz.jpg'])
+
+    def test_url_key_candidates(self):
+        self.assertIn(
+            'chat_files/a b.pdf', url_key_candidates('https://x.example.com/bucket/chat_files/a%20b.pdf?sig=1')
+        )
+        self.assertEqual(url_key_candidates('https://x.example.com/'), set())
+
+
+class ReceiptAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _get(self, **params):
+        return self.api.get('/api/v1/analytics/receipts/', params, secure=True)
+
+    def test_invalid_date_is_rejected(self):
+        response = self._get(start='foo')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start', response.json())
+
+    def test_oversized_amounts_do_not_break_analysis(self):
+        document = create_document(self.user, analysis_status='processing')
+        apply_analysis(document, {
+            'seller_name': 'Market', 'total_amount': '12345678901234567,89', 'vat_amount': 18,
+            'items': [{'name': 'Ürün', 'quantity': 10 ** 9, 'unit_price': 10 ** 9}],
+        })
+
+        document.refresh_from_db()
+        self.assertEqual(document.analysis_status, 'completed')
+        self.assertIsNone(document.amount)
+        seller = ReceiptSeller.objects.get(document=document)
+        self.assertIsNone(seller.total_amount)
+        self.assertIsNone(seller.line_items.get().total_price)
+
+    def test_sellers_without_total_are_listed_last(self):
+        for name, total in (('Boş', None), ('Küçük', 10), ('Büyük', 500)):
+            apply_analysis(create_document(self.user), {'seller_name': name, 'total_amount': total, 'date': '2026-03-15', 'items': []})
+
+        response = self._get(start='2000-01-01')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([seller['name'] for seller in response.json()['top_sellers']], ['Büyük', 'Küçük', 'Boş'])
+
+
+class DownloadStreamingTests(SimpleTestCase):
+    def test_asgi_sends_first_chunk_before_object_is_read(self):
+        size = 4 * settings.DOCUMENT_DOWNLOAD['CHUNK_SIZE']
+        raw = io.BytesIO(b'x' * size)
+        client = mock.Mock()
+        client.get_object.return_value = {
+            'Body': StreamingBody(raw, size), 'ContentLength': size, 'ContentType': 'application/pdf',
+        }
+        request = RequestFactory().get('/download/', {'mode': 'stream'})
+        with mock.patch.object(downloads, 's3_client', return_value=client), \
+                mock.patch.object(downloads, 'storage_key', side_effect=lambda name: name), \
+                mock.patch.object(downloads, 'default_storage', mock.Mock(bucket_name='test')):
+            response = downloads.file_download_response(request, 'belge.pdf', 'belge.pdf')
+
+        bodies = []
+
+        async def send(message):
+            if message.get('body'):
+                bodies.append((message.get('body', b''), raw.tell()))
+
+        async_to_sync(ASGIHandler().send_response)(response, send)
+        _, read_at_first = bodies[0]
+        self.assertLess(read_at_first, size)
+        self.assertEqual(sum(len(body) for body, _ in bodies), size)
+
+
+class ClientExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_failed_files_are_listed_and_archive_stays_valid(self):
+        intact = create_document(self.user, file='documents/saglam.jpg')
+        broken = create_document(self.user, file='documents/bozuk.jpg')
+        unreadable = create_document(self.user, file='documents/yok.jpg')
+
+        def open_object(entry):
+            _, name = entry
+            if name == unreadable.file.name:
+                raise OSError('NoSuchKey')
+            yield b'ilk parca'
+            if name == broken.file.name:
+                raise OSError('bağlantı koptu')
+            yield b'son parca'
+
+        with mock.patch('core.exports._open_object', side_effect=open_object):
+            response = self.api.get('/api/v1/exports/client-documents/', secure=True)
+            content = b''.join(response)
+
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        names = archive.namelist()
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read(f'belgeler/2026-03-15_receipt_{intact.id}.jpg'), b'ilk parcason parca')
+        # Başlığı yazılmış dosya kesik kalır, hiç açılamayan dosya eklenmez
+        self.assertEqual(archive.read(f'belgeler/2026-03-15_receipt_{broken.id}.jpg'), b'ilk parca')
+        self.assertNotIn(f'belgeler/2026-03-15_receipt_{unreadable.id}.jpg', names)
+        self.assertEqual(archive.read('eksik_dosyalar.txt').decode().splitlines(), [
+            f'belgeler/2026-03-15_receipt_{broken.id}.jpg (eksik - okuma yarıda kaldı)',
+            f'belgeler/2026-03-15_receipt_{unreadable.id}.jpg',
+        ])
+
+    def test_invalid_date_is_rejected(self):
+        response = self.api.get('/api/v1/exports/client-documents/', {'start': '15.03.2026'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start', response.json())
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _walk(self, url, key='results'):
+        ids = []
+        while url:
+            response = self.api.get(url, secure=True).json()
+            ids += [document['id'] for document in response[key]]
+            url = response['next']
+        return ids
+
+    def test_same_date_documents_page_by_id(self):
+        documents = [create_document(self.user) for _ in range(7)]
+
+        ids = self._walk('/api/v1/documents/?ordering=-date&page_size=3')
+        self.assertEqual(ids, sorted((document.id for document in documents), reverse=True))
+        ids = self._walk('/api/v1/documents/?ordering=date&page_size=3')
+        self.assertEqual(ids, sorted(document.id for document in documents))
+
+    def test_previous_link_returns_the_same_page(self):
+        for _ in range(7):
+            create_document(self.user)
+        first = self.api.get('/api/v1/documents/?ordering=-date&page_size=3', secure=True).json()
+        second = self.api.get(first['next'], secure=True).json()
+        back = self.api.get(second['previous'], secure=True).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.api.get('/api/v1/documents/?cursor=cD1mb28%3D', secure=True)
+        self.assertEqual(response.status_code, 404)
+
+    def _page_query(self, url, table):
+        """İkinci sayfanın (imleç koşullu) sorgusu"""
+        next_url = self.api.get(url, secure=True).json()['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get(next_url, secure=True)
+        return next(
+            query['sql'] for query in queries.captured_queries
+            if f'FROM "{table}"' in query['sql'] and 'ORDER BY' in query['sql']
+        )
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Küçük tabloda planlayıcı tam taramayı seçer; indeks kullanılabiliyor mu bakılır
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(str(row) for row in cursor.fetchall())
+
+    def assertIndexOrdered(self, plan, index_name):
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_document_orderings_use_indexes(self):
+        for _ in range(5):
+            create_document(self.user)
+        for ordering, index_name in (
+            ('-created_at', 'document_user_created_idx'),
+            ('created_at', 'document_user_created_idx'),
+            ('-date', 'document_user_date_idx'),
+            ('date', 'document_user_date_idx'),
+        ):
+            with self.subTest(ordering=ordering):
+                sql = self._page_query(f'/api/v1/documents/?ordering={ordering}&page_size=2', 'core_document')
+                self.assertIndexOrdered(self._plan(sql), index_name)
+
+    def test_client_document_listing_uses_index(self):
+        for index in range(5):
+            ClientDocument.objects.create(
+                client=self.user, title=f'belge {index}', document_type='tax', file='client_documents/a.pdf'
+            )
+        sql = self._page_query('/api/v1/client-documents/?page_size=2', 'core_clientdocument')
+        self.assertIndexOrdered(self._plan(sql), 'clientdoc_client_created_idx')
+
+
+class ClientScopeTests(TestCase):
+    def test_scope_is_shared_and_invalidated_on_membership_change(self):
+        accountant = User.objects.create_user('muhasebe@example.com', user_type='accountant')
+        client = User.objects.create_user('mukellef@example.com', user_type='client')
+        inactive = User.objects.create_user('pasif@example.com', user_type='client', is_active=False)
+        firm = AccountingFirm.objects.create(owner=accountant, name='Büro')
+        firm.clients.add(inactive)
+
+        self.assertEqual(get_client_scope(accountant).client_ids, frozenset())
+        self.assertIsNotNone(caches['shared'].get(f'client_scope_{accountant.id}'))
+
+        firm.clients.add(client)
+        self.assertIsNone(caches['shared'].get(f'client_scope_{accountant.id}'))
+        self.assertEqual(get_client_scope(accountant).client_ids, frozenset([client.id]))
+
+
+class DocumentStatsTests(TestCase):
+    def setUp(self):
+        self.accountant = User.objects.create_user('muhasebe@example.com', user_type='accountant')
+        self.client_user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.firm = AccountingFirm.objects.create(owner=self.accountant, name='Büro')
+        self.firm.clients.add(self.client_user)
+
+    def test_deleting_user_with_documents_does_not_recreate_counters(self):
+        create_document(self.client_user)
+        create_document(self.client_user, status='completed')
+
+        self.client_user.delete()
+        connection.check_constraints()
+        self.assertFalse(UserDocumentStats.objects.filter(user_id=self.client_user.id).exists())
+        self.assertEqual(FirmDocumentStats.objects.get(firm=self.firm).total, 0)
+
+    def test_reconcile_fixes_drifted_counters(self):
+        create_document(self.client_user)
+        create_document(self.client_user, status='completed')
+        UserDocumentStats.objects.update(total=10, pending=0)
+        FirmDocumentStats.objects.update(processed=7)
+
+        call_command('reconcile_document_stats', stdout=io.StringIO())
+        stats = UserDocumentStats.objects.get(user=self.client_user)
+        self.assertEqual((stats.total, stats.pending, stats.processed), (2, 1, 1))
+        self.assertEqual(FirmDocumentStats.objects.get(firm=self.firm).processed, 1)
+
+    def test_dashboard_reads_firm_counters_of_active_clients(self):
+        inactive = User.objects.create_user('pasif@example.com', user_type='client')
+        self.firm.clients.add(inactive)
+        create_document(self.client_user)
+        create_document(inactive)
+        inactive.is_active = False
+        inactive.save()
+        stats = FirmDocumentStats.objects.get(firm=self.firm)
+        self.assertEqual((stats.total, stats.pending), (1, 1))
+
+        inactive.is_active = True
+        inactive.save()
+        self.assertEqual(FirmDocumentStats.objects.get(firm=self.firm).pending, 2)
+
+    def test_dashboard_recent_activity_is_bounded(self):
+        documents = [create_document(self.client_user) for _ in range(7)]
+        documents[0].status = 'completed'
+        documents[0].save()
+        other = User.objects.create_user('baska@example.com', user_type='client')
+        create_document(other)
+
+        api = APIClient()
+        api.force_authenticate(self.accountant)
+        api.get('/api/v1/dashboard/stats/', secure=True)
+        # Belge sayısı artsa da sorgu sayısı sabit kalır
+        create_document(self.client_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get('/api/v1/dashboard/stats/', secure=True).json()
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual((response['stats']['total'], response['stats']['pending_documents']), (1, 7))
+        # GREATEST(NULL, x) SQLite'ta NULL döner; ilk aktivite kaybolmamalı
+        self.assertIsNotNone(response['stats']['last_activity'])
+        recent = [activity['id'] for activity in response['recent_activities']]
+        self.assertEqual(len(recent), 5)
+        self.assertEqual(recent[1], documents[0].id)
+        self.assertEqual(recent, list(
+            Document.objects.filter(uploaded_by=self.client_user)
+            .order_by('-updated_at', '-id').values_list('id', flat=True)[:5]
+        ))
+
+    def test_reconcile_rebuilds_recent_activity(self):
+        documents = [create_document(self.client_user) for _ in range(3)]
+        FirmDocumentStats.objects.update(recent_document_ids=[999])
+
+        call_command('reconcile_document_stats', stdout=io.StringIO())
+        self.assertEqual(
+            FirmDocumentStats.objects.get(firm=self.firm).recent_document_ids,
+            [document.id for document in reversed(documents)]
+        )
+
+
+class MonthlyRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+
+    def rows(self):
+        return {
+            (row.document_type, row.vat_rate): (row.document_count, row.amount_total, row.vat_total)
+            for row in MonthlyDocumentRollup.objects.filter(client=self.user)
+        }
+
+    def test_documents_without_vat_rate_share_one_row(self):
+        for _ in range(3):
+            create_document(self.user, amount=Decimal('10.00'))
+        create_document(self.user, amount=Decimal('100.00'), vat_rate=Decimal('20.00'))
+
+        self.assertEqual(self.rows(), {
+            ('receipt', NO_VAT_RATE): (3, Decimal('30.00'), Decimal('0.00')),
+            ('receipt', Decimal('20.00')): (1, Decimal('100.00'), Decimal('20.00')),
+        })
+        series = monthly_series([self.user.id], date(2026, 3, 1), date(2026, 3, 1), group_by='vat_rate')
+        self.assertEqual([(row['vat_rate'], row['amount']) for row in series], [
+            (None, Decimal('30.00')), (Decimal('20.00'), Decimal('100.00')),
+        ])
+
+    def test_update_moves_document_between_rows(self):
+        document = create_document(self.user, amount=Decimal('10.00'))
+        document.amount = Decimal('50.00')
+        document.save()
+        self.assertEqual(self.rows(), {('receipt', NO_VAT_RATE): (1, Decimal('50.00'), Decimal('0.00'))})
+
+        document.vat_rate = Decimal('10.00')
+        document.date = date(2026, 4, 2)
+        document.save()
+        self.assertEqual(self.rows(), {('receipt', Decimal('10.00')): (1, Decimal('50.00'), Decimal('5.00'))})
+        self.assertEqual(MonthlyDocumentRollup.objects.get(client=self.user).month, date(2026, 4, 1))
+
+    def test_delete_decrements_and_removes_empty_rows(self):
+        first = create_document(self.user, amount=Decimal('10.00'))
+        second = create_document(self.user, amount=Decimal('15.00'))
+        first.delete()
+        self.assertEqual(self.rows(), {('receipt', NO_VAT_RATE): (1, Decimal('15.00'), Decimal('0.00'))})
+        second.delete()
+        self.assertEqual(self.rows(), {})
+
+    def test_rebuild_matches_incremental_rows(self):
+        create_document(self.user, amount=Decimal('10.00'))
+        create_document(self.user, amount=Decimal('12.34'), vat_rate=Decimal('18.00'))
+        create_document(self.user, document_type='invoice', amount=Decimal('99.99'))
+        incremental = self.rows()
+
+        call_command('rebuild_monthly_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rows(), incremental)
+
+
+class BulkProcessDocumentsTests(TestCase):
+    def setUp(self):
+        self.accountant = User.objects.create_user('muhasebe@example.com', user_type='accountant')
+        self.client_user = User.objects.create_user('mukellef@example.com', user_type='client')
+        AccountingFirm.objects.create(owner=self.accountant, name='Büro').clients.add(self.client_user)
+        other_accountant = User.objects.create_user('diger@example.com', user_type='accountant')
+        self.other_client = User.objects.create_user('baska@example.com', user_type='client')
+        AccountingFirm.objects.create(owner=other_accountant, name='Başka büro').clients.add(self.other_client)
+        self.api = APIClient()
+        self.api.force_authenticate(self.accountant)
+
+    def process(self, ids, new_status='completed'):
+        return self.api.post(
+            '/api/v1/documents/process/bulk/', {'ids': ids, 'status': new_status}, format='json', secure=True
+        )
+
+    def test_partial_failures_are_reported_per_id(self):
+        pending = create_document(self.client_user)
+        done = create_document(self.client_user, status='completed')
+        foreign = create_document(self.other_client)
+
+        with mock.patch('core.events.send_user_events') as send, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.process([pending.id, done.id, foreign.id, 999999])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual({row['id']: row['result'] for row in response.json()['results']}, {
+            pending.id: 'updated', done.id: 'unchanged', foreign.id: 'forbidden', 999999: 'not_found',
+        })
+        pending.refresh_from_db()
+        foreign.refresh_from_db()
+        self.assertEqual((pending.status, pending.processed_by_id), ('completed', self.accountant.id))
+        self.assertEqual(foreign.status, 'pending')
+        # Sadece değişen belge için yükleyene ve büro sahibine birer olay
+        events = send.call_args.args[0]
+        self.assertEqual(sorted((user_id, data['id']) for user_id, _, data in events), sorted([
+            (self.client_user.id, pending.id), (self.accountant.id, pending.id),
+        ]))
+
+    def test_request_over_limit_is_rejected_without_changes(self):
+        documents = [create_document(self.client_user) for _ in range(3)]
+        with self.settings(DOCUMENT_BULK_PROCESS={'MAX_DOCUMENTS': 2}):
+            response = self.process([document.id for document in documents])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exclude(status='pending').exists())
+
+    def test_event_serialization_query_count_is_constant(self):
+        def queries_for(count):
+            original = create_document(self.client_user)
+            ids = [create_document(self.client_user, duplicate_of=original).id for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.process(ids).json()['updated'], count)
+            Document.objects.filter(id__in=ids).update(status='pending')
+            return len(queries)
+
+        queries_for(1)  # Kapsam önbelleği ve sayaç satırları
+        self.assertEqual(queries_for(2), queries_for(10))
+
+
+class DocumentExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mukellef@example.com', user_type='client')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_csv_cells_cannot_start_a_formula(self):
+        create_document(self.user, amount=Decimal('-12.50'), analyzed_data={
+            'seller_name': '=HYPERLINK("http://example.com","Market")',
+            'items': [{'name': '@SUM(A1:A9)', 'quantity': 1, 'unit_price': 5}],
+        })
+
+        response = self.api.get('/api/v1/exports/documents/', {'file_format': 'csv'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        rows = [line.split(';') for line in b''.join(response).decode('utf-8-sig').splitlines()]
+        row = dict(zip(rows[0], rows[1]))
+        self.assertEqual(row['satici'], '"\'=HYPERLINK(""http://example.com"",""Market"")"')
+        self.assertEqual(row['kalem'], "'@SUM(A1:A9)")
+        self.assertEqual(row['tutar'], '-12.50')
+
+    def test_manifest_cells_cannot_start_a_formula(self):
+        ClientDocument.objects.create(
+            client=self.user, title='+90 555 000 00 00', document_type='other', file='client_documents/a.pdf'
+        )
+        with mock.patch('core.exports._open_object', return_value=iter([b'pdf'])):
+            response = self.api.get('/api/v1/exports/client-documents/', secure=True)
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(response)))
+
+        manifest = archive.read('manifest.csv').decode('utf-8-sig').splitlines()
+        self.assertIn(";'+90 555 000 00 00;", manifest[1])
+
+
+class ExpiryDigestTests(TestCase):
+    def setUp(self):
+        self.accountant = User.objects.create_user('muhasebe@example.com', user_type='accountant')
+        self.client_user = User.objects.create_user('mukellef@example.com', user_type='client')
+        firm = AccountingFirm.objects.create(owner=self.accountant, name='Büro')
+        firm.clients.add(self.client_user)
+
+    def _document(self, client):
+        return ClientDocument.objects.create(
+            client=client, title='Vergi levhası', document_type='other', file='client_documents/a.pdf',
+            expiry_date=timezone.localdate() + timedelta(days=5)
+        )
+
+    def _recipients(self, send):
+        return [call.kwargs['to_list'] for call in send.call_args_list]
+
+    def test_failed_recipient_is_retried_alone(self):
+        document = self._document(self.client_user)
+
+        def fail_for_accountant(**kwargs):
+            if kwargs['to_list'] == self.accountant.email:
+                raise RuntimeError('smtp')
+
+        with mock.patch('core.expiry.send_email_via_smtp2go', side_effect=fail_for_accountant) as send:
+            result = send_expiry_digests()
+        self.assertEqual(sorted(self._recipients(send)), [self.accountant.email, self.client_user.email])
+        self.assertEqual(result, {'emails': 1, 'documents': 0})
+        document.refresh_from_db()
+        self.assertIsNone(document.expiry_notified_at)
+
+        with mock.patch('core.expiry.send_email_via_smtp2go') as send:
+            result = send_expiry_digests()
+        self.assertEqual(self._recipients(send), [self.accountant.email])
+        self.assertEqual(result, {'emails': 1, 'documents': 1})
+        document.refresh_from_db()
+        self.assertIsNotNone(document.expiry_notified_at)
+        self.assertEqual(ExpiryNotice.objects.filter(document=document).count(), 2)
+
+    def test_document_without_recipients_is_not_marked(self):
+        orphan = User.objects.create_user('bagimsiz@example.com', user_type='client')
+        document = self._document(orphan)
+
+        with override_settings(CLIENT_DOCUMENT_EXPIRY={**settings.CLIENT_DOCUMENT_EXPIRY, 'NOTIFY_CLIENTS': False}), \
+                mock.patch('core.expiry.send_email_via_smtp2go') as send:
+            result = send_expiry_digests()
+        send.assert_not_called()
+        self.assertEqual(result, {'emails': 0, 'documents': 0})
+        document.refresh_from_db()
+        self.assertIsNone(document.expiry_notified_at)
+
+    def test_notified_document_is_not_sent_again(self):
+        document = self._document(self.client_user)
+
+        with mock.patch('core.expiry.send_email_via_smtp2go') as send:
+            self.assertEqual(send_expiry_digests(), {'emails': 2, 'documents': 1})
+            self.assertEqual(send_expiry_digests(), {'emails': 0, 'documents': 0})
+        self.assertEqual(send.call_count, 2)
+        document.refresh_from_db()
+        self.assertIsNotNone(document.expiry_notified_at)
+
+    def test_renewed_document_is_sent_again(self):
+        document = self._document(self.client_user)
+        with mock.patch('core.expiry.send_email_via_smtp2go'):
+            send_expiry_digests()
+
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+        response = api.patch(
+            f'/api/v1/client-documents/{document.id}/',
+            {'expiry_date': (timezone.localdate() + timedelta(days=10)).isoformat()}, format='multipart', secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ExpiryNotice.objects.filter(document=document).exists())
+
+        with mock.patch('core.expiry.send_email_via_smtp2go') as send:
+            self.assertEqual(send_expiry_digests(), {'emails': 2, 'documents': 1})
+
+
+class ReceiptPreprocessingTests(SimpleTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        if receipt_images._executor is not None:
+            receipt_images._reset_executor(receipt_images._executor)
+        super().tearDownClass()
+
+    def _jpeg(self, size):
+        from PIL import Image
+
+        output = io.BytesIO()
+        Image.new('RGB', size, 'white').save(output, format='JPEG', quality=95)
+        return output.getvalue()
+
+    def test_large_photo_is_downscaled(self):
+        from PIL import Image
+
+        pages = receipt_images.preprocess_receipt(self._jpeg((3000, 4000)))
+        self.assertEqual(len(pages), 1)
+        with Image.open(io.BytesIO(pages[0])) as image:
+            self.assertEqual(max(image.size), settings.RECEIPT_IMAGE_PROCESSING['MAX_SIDE'])
+
+    def test_undecodable_file_is_sent_as_is(self):
+        heic = b'\x00\x00\x00\x18ftypheic' + b'\x00' * 64
+        self.assertEqual(receipt_images.preprocess_receipt(heic), [heic])
+        self.assertTrue(image_content(heic)['image_url']['url'].startswith('data:image/jpeg;base64,'))
+
+    def test_pool_is_recreated_after_worker_crash(self):
+        import os
+        from concurrent.futures.process import BrokenProcessPool
+
+        broken = receipt_images._get_executor()
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result(timeout=30)
+
+        pages = receipt_images.preprocess_receipt(self._jpeg((100, 100)))
+        self.assertNotEqual(pages, [self._jpeg((100, 100))])
+        self.assertIsNot(receipt_images._executor, broken)
@@ -31,7 +31,12 @@ urlpatterns = [
     # Diğer endpoints
     path('users/profile/', views.ProfileUpdateView.as_view(), name='profile-update'),
     path('documents/process/<int:pk>/', views.ProcessDocumentView.as_view(), name='document-process'),
+    path('documents/process/bulk/', views.BulkProcessDocumentsView.as_view(), name='document-process-bulk'),
     path('dashboard/stats/', views.DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('devices/', views.DeviceTokenView.as_view(), name='device-tokens'),
+    path('analysis/queue/', views.AnalysisQueueStatsView.as_view(), name='analysis-queue-stats'),
+    path('analytics/receipts/', views.ReceiptAnalyticsView.as_view(), name='receipt-analytics'),
+    path('analytics/monthly/', views.MonthlyRollupView.as_view(), name='monthly-rollups'),
     path('subscriptions/', views.SubscriptionView.as_view(), name='subscription-create'),
     path('subscriptions/current/', views.SubscriptionView.as_view(), name='subscription-current'),
     path('forgot-password/', ForgotPasswordView.as_view(), name='forgot-password'),
@@ -40,6 +45,8 @@ urlpatterns = [
     path('cities/', views.city_list, name='city-list'),
     path('cities/<int:city_id>/districts/', views.district_list, name='district-list'),
     path('client-documents/<int:document_id>/download/', views.download_document, name='document-download'),
+    path('exports/client-documents/', views.export_client_documents, name='client-documents-export'),
+    path('exports/documents/', views.export_documents, name='documents-export'),
     
     # Router URLs en sonda olmalı
     path('', include(router.urls)),
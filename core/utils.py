@@ -119,7 +119,7 @@ def send_email_via_smtp2go(
     Returns:
         dict: API yanıtı
     """
-    url = "https://api.smtp2go.com/v3/email/send"
+    url = settings.SMTP2GO_API_URL
     
     headers = {
         'Content-Type': 'application/json',
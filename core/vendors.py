@@ -0,0 +1,202 @@
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Türkçe küçük harfe çevirdikten sonra karşılaştırma için ASCII'ye indir
+TURKISH_FOLD = str.maketrans({
+    'ç': 'c', 'ğ': 'g', 'ı': 'i', 'ö': 'o', 'ş': 's', 'ü': 'u', 'â': 'a', 'î': 'i', 'û': 'u',
+})
+
+# Satıcıyı ayırt etmeyen şirket türü ve ticaret ekleri
+LEGAL_SUFFIXES = {
+    'as', 'anonim', 'sirketi', 'sirket', 'ltd', 'limited', 'sti', 'ltdsti', 'tic', 'ticaret',
+    'san', 'sanayi', 've', 'paz', 'pazarlama', 'ith', 'ihr', 'ithalat', 'ihracat', 'koll', 'inc', 'co',
+}
+
+
+def fold_turkish(text):
+    """'MİGROS', 'Mıgros' ve 'migros' aynı sonucu verir"""
+    text = (text or '').replace('İ', 'i').replace('I', 'ı').lower()
+    return text.translate(TURKISH_FOLD)
+
+
+def vendor_tokens(name):
+    """Satıcı adını karşılaştırılabilir kelimelere ayır, hukuki ekleri at"""
+    folded = fold_turkish(name).replace('.', '')
+    tokens = re.findall(r'[a-z0-9]+', folded)
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return tuple(tokens)
+
+
+def vendor_key(name):
+    return ' '.join(vendor_tokens(name))
+
+
+class VendorIndex:
+    """
+    Vendor tablosunun bellekteki kelime trie'si. Fiş üzerindeki ad, kayıtlı bir satıcı
+    anahtarıyla başlıyorsa ('migros jet kadikoy' -> 'migros') en uzun eşleşme döner.
+
+    Eşleştirme veritabanına gitmez. Bu süreçteki değişiklikler sinyallerle hemen yansır;
+    diğer süreçlerdeki değişiklikler arka plandaki yenileme thread'iyle alınır. Yenilemede
+    tablo baştan okunmaz; sadece updated_at'i son yüklemeden yeni olanlar alınır ve
+    silinen satıcılar id listesiyle ayıklanır.
+    """
+
+    def __init__(self):
+        self._root = {}
+        self._keys = {}  # vendor id -> trie'deki anahtarlar
+        self._vendors = {}  # vendor id -> (id, name, normalized_name, category)
+        self._loaded_until = None
+        self._loaded = False
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+    def match(self, name):
+        """
+        Returns:
+            tuple: (id, name, normalized_name, category) veya None
+        """
+        if not self._loaded:
+            # Yenileme thread'i çalışmayan süreçlerde (yönetim komutları) tek seferlik yükleme
+            self.refresh()
+        node = self._root
+        match = None
+        for token in vendor_tokens(name):
+            node = node.get(token)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return self._vendors.get(match) if match is not None else None
+
+    def start_refresh_loop(self):
+        """İndeksi REFRESH_INTERVAL aralıklarla yenileyen thread'i başlat (web sürecinde)"""
+        with self._lock:
+            if self._refresh_thread is not None:
+                return
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_loop, name='vendor-index-refresh', daemon=True
+            )
+            self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            close_old_connections()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.exception(f"Satıcı indeksi yenilenemedi: {str(e)}")
+            finally:
+                close_old_connections()
+            time.sleep(settings.VENDOR_INDEX['REFRESH_INTERVAL'])
+
+    def refresh(self):
+        from .models import Vendor
+
+        with self._lock:
+            vendors = Vendor.objects.order_by('updated_at').values(
+                'id', 'name', 'normalized_name', 'aliases', 'category', 'is_active', 'updated_at'
+            )
+            if self._loaded_until is not None:
+                vendors = vendors.filter(updated_at__gte=self._loaded_until)
+            changed = 0
+            for vendor in vendors:
+                self._remove(vendor['id'])
+                if vendor['is_active']:
+                    self._add(vendor)
+                self._loaded_until = vendor['updated_at']
+                changed += 1
+            if self._loaded:
+                # Silinen satıcılar updated_at ile görünmez
+                deleted = set(self._vendors) - set(Vendor.objects.values_list('id', flat=True))
+                for vendor_id in deleted:
+                    self._remove(vendor_id)
+                changed += len(deleted)
+            self._loaded = True
+            if changed:
+                logger.debug(f"Satıcı indeksi güncellendi: {changed} kayıt, toplam {len(self._vendors)}")
+
+    def add(self, vendor):
+        """Kaydedilen satıcıyı yenilemeyi beklemeden indekse yansıt"""
+        with self._lock:
+            self._remove(vendor.id)
+            if not vendor.is_active:
+                return
+            self._add({
+                'id': vendor.id,
+                'name': vendor.name,
+                'normalized_name': vendor.normalized_name,
+                'aliases': vendor.aliases,
+                'category': vendor.category,
+            })
+
+    def discard(self, vendor_id):
+        """Silinen satıcıyı indeksten çıkar"""
+        with self._lock:
+            self._remove(vendor_id)
+
+    def _add(self, vendor):
+        keys = {vendor_tokens(vendor['normalized_name'])}
+        keys.update(vendor_tokens(alias) for alias in vendor['aliases'] or [])
+        keys.discard(())
+        for key in keys:
+            node = self._root
+            for token in key:
+                node = node.setdefault(token, {})
+            node[None] = vendor['id']
+        self._keys[vendor['id']] = keys
+        self._vendors[vendor['id']] = (
+            vendor['id'], vendor['name'], vendor['normalized_name'], vendor['category']
+        )
+
+    def _remove(self, vendor_id):
+        for key in self._keys.pop(vendor_id, ()):
+            node = self._root
+            for token in key:
+                node = node.get(token)
+                if node is None:
+                    break
+            else:
+                if node.get(None) == vendor_id:
+                    del node[None]
+        self._vendors.pop(vendor_id, None)
+
+
+vendor_index = VendorIndex()
+
+
+def resolve_vendor(raw_name, category=None):
+    """
+    Fiş üzerindeki satıcı adını kanonik satıcıya eşle. Bilinmeyen satıcı, model çıktısındaki
+    kategoriyle birlikte kaydedilir; sonraki fişler aynı kategoriyi buradan alır. Yeni kayıt
+    indekse transaction commit olduktan sonra eklenir (signals.update_vendor_index).
+
+    Returns:
+        tuple: (id, name, normalized_name, category) veya None
+    """
+    from .models import Vendor
+
+    match = vendor_index.match(raw_name)
+    if match is not None or not settings.VENDOR_INDEX['AUTO_CREATE']:
+        return match
+
+    key = vendor_key(raw_name)
+    if not key:
+        return None
+    vendor, created = Vendor.objects.get_or_create(
+        normalized_name=key[:255],
+        defaults={'name': raw_name.strip()[:255], 'category': category}
+    )
+    if not vendor.is_active:
+        return None
+    if not created and vendor.category is None and category:
+        vendor.category = category
+        vendor.save(update_fields=['category', 'updated_at'])
+    return vendor.id, vendor.name, vendor.normalized_name, vendor.category
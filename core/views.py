@@ -3,7 +3,7 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from .models import User, AccountingFirm, Document, SubscriptionPlan, AccountantSubscription, ClientDocument
+from .models import User, AccountingFirm, Document, SubscriptionPlan, AccountantSubscription, ClientDocument, DeviceToken, ReceiptSeller, ReceiptLineItem, FirmDocumentStats, UserDocumentStats
 from allauth.account.models import EmailAddress, EmailConfirmation  # allauth'dan import
 from .serializers import (
     UserSerializer, 
@@ -20,7 +20,9 @@ from .serializers import (
     CitySerializer,
     RegionSerializer,
     SubRegionSerializer,
-    ClientDocumentSerializer
+    ClientDocumentSerializer,
+    DeviceTokenSerializer,
+    with_duplicate_owner
 )
 from .permissions import IsAccountant, IsClientOrAccountant
 from rest_framework.decorators import action, api_view, permission_classes
@@ -32,25 +34,138 @@ from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.db.models import Count, Q, Max
+from django.db import transaction
+from django.db.models import Count, F, Q, Max, Sum
 from django.utils import timezone
 from datetime import timedelta
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from .utils import PayTRService, send_email_via_smtp2go
+from .push import queue_push
+from .events import notify_document_event, notify_document_events
+from .receipts import store_receipt_rows
+from .tasks import PRIORITY_BULK, analysis_queue, enqueue_receipt_analysis
+from .dedup import compute_content_hash, find_stored_copy
+from .deletions import schedule_file_deletion
+from .downloads import aiter_chunks, file_download_response
+from .exports import DOCUMENT_EXPORT_HEADER, iter_client_export, iter_csv, iter_document_rows
+from .filters import choice_params, date_param, filter_client_documents, filter_documents, month_param
+from .scope import get_client_scope
+from .stats import PROCESSED_STATUSES, record_status_changes
+from .rollups import monthly_series
+from .xlsx import iter_xlsx
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import NotFound, ValidationError as DRFValidationError
 from django.core.cache import cache
 from rest_framework.permissions import AllowAny
 from allauth.account.views import ConfirmEmailView
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from cities_light.models import City, Region, SubRegion
-import requests
 from django.contrib.auth.hashers import make_password
 
 # Create your views here.
 
+class DocumentCursorPagination(CursorPagination):
+    """
+    OFFSET yerine son görülen satırdan devam eden sayfalama; derin sayfalarda da sabit maliyetli.
+    Sıralama sadece boş olamayan ve indeksli alanlarda yapılabilir. İmleç (alan, id) çiftini
+    taşır; aynı tarihli çok sayıda belge olsa da sayfalar OFFSET'e düşmeden sabit kalır.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
+    allowed_orderings = ['-created_at', 'created_at', '-date', 'date']
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get('ordering') or self.ordering
+        if ordering not in self.allowed_orderings:
+            raise DRFValidationError({'ordering': f"Geçerli değerler: {', '.join(self.allowed_orderings)}"})
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """CursorPagination ile aynı akış; konum filtresi tek alan yerine (alan, id) üzerinden"""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*[
+                field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering
+            ])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.position_filter(queryset.model, current_position))
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def position_filter(self, model, position):
+        """
+        (alan, id) > konum koşulu. Alan üzerindeki aralık koşulu indeksle taranır,
+        eşit alanlı satırlar id ile ayrılır; sıralama için ayrıca sort gerekmez.
+        """
+        order = self.ordering[0]
+        field_name = order.lstrip('-')
+        value, _, pk = position.rpartition('|')
+        try:
+            value = model._meta.get_field(field_name).to_python(value)
+        except ValidationError:
+            value = None
+        if value is None or not pk.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+
+        # (imleç geri yönde) XOR (sıralama azalan)
+        op = 'lt' if self.cursor.reverse != order.startswith('-') else 'gt'
+        return Q(**{f'{field_name}__{op}e': value}) & (
+            Q(**{f'{field_name}__{op}': value}) | Q(**{f'id__{op}': int(pk)})
+        )
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = super()._get_position_from_instance(instance, ordering)
+        pk = instance['id'] if isinstance(instance, dict) else instance.id
+        return f'{position}|{pk}'
+
+class ClientDocumentCursorPagination(DocumentCursorPagination):
+    allowed_orderings = ['-created_at', 'created_at']
+
 class CurrentUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -74,27 +189,25 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def documents(self, request, pk=None):
         user = self.get_object()
-        documents = user.uploaded_documents.all()
-        serializer = DocumentSerializer(documents, many=True)
-        return Response(serializer.data)
+        documents = filter_documents(user.uploaded_documents.all(), request.query_params)
+        paginator = DocumentCursorPagination()
+        page = paginator.paginate_queryset(documents, request, view=self)
+        serializer = DocumentSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
         user = self.get_object()
         thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_documents = user.uploaded_documents.filter(
+        counts = user.uploaded_documents.filter(
             created_at__gte=thirty_days_ago
+        ).aggregate(
+            total_documents=Count('id'),
+            pending_documents=Count('id', filter=Q(status='pending')),
+            processed_documents=Count('id', filter=Q(status__in=PROCESSED_STATUSES)),
         )
         
-        total_documents = recent_documents.count()
-        pending_documents = recent_documents.filter(status='pending').count()
-        processed_documents = recent_documents.filter(status__in=['completed', 'rejected']).count()
-        
-        return Response({
-            'total_documents': total_documents,
-            'pending_documents': pending_documents,
-            'processed_documents': processed_documents
-        })
+        return Response(counts)
 
 class AccountingFirmViewSet(viewsets.ModelViewSet):
     queryset = AccountingFirm.objects.all()
@@ -108,18 +221,28 @@ class DocumentViewSet(viewsets.ModelViewSet):
     serializer_class = DocumentSerializer
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = DocumentCursorPagination
 
     def get_queryset(self):
         if self.request.user.user_type == 'client':
-            return Document.objects.filter(uploaded_by=self.request.user)
+            queryset = Document.objects.filter(uploaded_by=self.request.user)
         elif self.request.user.user_type == 'accountant':
-            client_ids = self.request.user.accounting_firms.first().clients.values_list('id', flat=True)
-            return Document.objects.filter(uploaded_by_id__in=client_ids)
-        return Document.objects.none()
+            scope = get_client_scope(self.request.user, self.request)
+            queryset = Document.objects.filter(uploaded_by_id__in=scope.client_ids)
+        else:
+            return Document.objects.none()
+
+        if self.action == 'list':
+            queryset = filter_documents(queryset, self.request.query_params)
+        # duplicate_of yalnızca aynı kullanıcının belgesine işaret ediyorsa gösterilir
+        return with_duplicate_owner(queryset)
 
     def create(self, request, *args, **kwargs):
         print("Gelen veri:", request.data)  # Debug için
-        
+
+        if len(request.FILES.getlist('file')) > 1:
+            return self.create_many(request)
+
         try:
             data = {
                 'document_type': request.data.get('document_type'),
@@ -141,6 +264,41 @@ class DocumentViewSet(viewsets.ModelViewSet):
             print("Hata:", str(e))  # Debug için
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    def create_many(self, request):
+        """
+        Aynı istekte yüklenen birden fazla dosya için belge oluşturur (ortak tür/tarih).
+        Fiş analizleri toplu öncelikle kuyruğa alınır; tekil yüklemelerin önüne geçmez.
+        """
+        files = request.FILES.getlist('file')
+        max_files = settings.DOCUMENT_UPLOAD['MAX_FILES']
+        if len(files) > max_files:
+            return Response(
+                {'error': f'Tek seferde en fazla {max_files} dosya yüklenebilir'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        context = {**self.get_serializer_context(), 'analysis_priority': PRIORITY_BULK}
+        serializers_ = [
+            DocumentSerializer(data={
+                'document_type': request.data.get('document_type'),
+                'file': uploaded_file,
+                'date': request.data.get('date'),
+            }, context=context)
+            for uploaded_file in files
+        ]
+        errors = {
+            index: serializer.errors
+            for index, serializer in enumerate(serializers_)
+            if not serializer.is_valid()
+        }
+        if errors:
+            return Response({'files': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            for serializer in serializers_:
+                self.perform_create(serializer)
+        return Response([serializer.data for serializer in serializers_], status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
         serializer.save(uploaded_by=self.request.user)
 
@@ -169,26 +327,48 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if 'vat_rate' in update_data:
             update_data['vat_rate'] = float(update_data['vat_rate'])
 
-        # Yeni dosya yüklendiyse eski dosyayı sil ve yenisini kaydet
-        if 'file' in request.FILES:
-            # Eski dosyayı sil
-            if instance.file:
-                try:
-                    instance.file.delete(save=False)
-                except Exception as e:
-                    print(f"Error deleting old file: {e}")
-            
-            update_data['file'] = request.FILES['file']
-        
         serializer = self.get_serializer(instance, data=update_data, partial=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+
+        with transaction.atomic():
+            self.perform_update(serializer)
+
+            # Yeni dosya yüklendiyse kaydet; eski dosya silme kuyruğuna alınır
+            # (başka bir belge aynı içeriği kullanıyorsa kuyruk işlenirken atlanır)
+            if 'file' in request.FILES:
+                self.replace_file(instance, request.FILES['file'], update_data)
         
-        return Response(serializer.data)
+        return Response(self.get_serializer(instance).data)
 
     def perform_update(self, serializer):
         serializer.save()
 
+    def replace_file(self, instance, uploaded_file, update_data):
+        """
+        Belgenin dosyasını değiştir. Eski dosyadan türetilen her şey (içerik özeti, kopya eşleşmesi,
+        fiş analizi ve analizden gelen tutar/KDV) sıfırlanır; fiş yeni dosyayla tekrar analize alınır.
+        """
+        old_name = instance.file.name
+        instance.file = uploaded_file
+        instance.content_hash = compute_content_hash(uploaded_file)
+        instance.perceptual_hash = None
+        instance.duplicate_of = None
+        image_data = None
+        if instance.document_type == 'receipt':
+            image_data = uploaded_file.read()
+            uploaded_file.seek(0)
+            instance.analyzed_data = None
+            # İstekte açıkça verilen tutar/KDV korunur
+            if 'amount' not in update_data:
+                instance.amount = None
+            if 'vat_rate' not in update_data:
+                instance.vat_rate = None
+        instance.save()
+        schedule_file_deletion([old_name])
+        if image_data is not None:
+            store_receipt_rows(instance)
+            enqueue_receipt_analysis(instance, image_data=image_data)
+
     def destroy(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
@@ -201,25 +381,13 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 )
             elif request.user.user_type == 'accountant':
                 # Muhasebecinin müşterisi değilse erişim yok
-                client_ids = request.user.accounting_firms.first().clients.values_list('id', flat=True)
-                if instance.uploaded_by.id not in client_ids:
+                if instance.uploaded_by_id not in get_client_scope(request.user, request):
                     return Response(
                         {'error': 'Bu belgeyi silme yetkiniz yok'},
                         status=status.HTTP_403_FORBIDDEN
                     )
             
-            # Önce S3'teki dosyayı sil
-            if instance.file:
-                try:
-                    # Storage'dan dosyayı sil
-                    instance.file.delete(save=False)
-                    print(f"Dosya silindi: {instance.file.name}")
-                except Exception as e:
-                    print(f"Dosya silinirken hata: {str(e)}")
-                    # Dosya silinirken hata olsa bile devam et
-                    pass
-            
-            # Sonra veritabanından kaydı sil
+            # Kaydı sil; dosya aynı transaction içinde silme kuyruğuna alınır (drain_file_deletions)
             instance.delete()
             
             return Response({
@@ -239,6 +407,11 @@ class ProcessDocumentView(APIView):
     def post(self, request, pk):
         try:
             document = Document.objects.get(pk=pk)
+            if document.uploaded_by_id not in get_client_scope(request.user, request):
+                return Response(
+                    {'error': 'Bu belgeyi işleme yetkiniz yok'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
             new_status = request.data.get('status')
 
             # Status değerini kontrol et
@@ -250,10 +423,22 @@ class ProcessDocumentView(APIView):
                 )
 
             # Belgeyi güncelle
+            old_status = document.status
             document.status = new_status
             document.processed_by = request.user
             document.save()
 
+            # Yükleyen kullanıcının mobil cihazlarına bildir
+            if old_status != new_status:
+                queue_push(
+                    [document.uploaded_by_id],
+                    collapse_key=f'document_{document.id}',
+                    title='Belge durumu güncellendi',
+                    body=f"{document.get_document_type_display()} ({document.date}): {document.get_status_display()}",
+                    data={'type': 'document_status', 'document_id': document.id, 'status': new_status}
+                )
+                notify_document_event(document, 'document.status_changed')
+
             # Belgeyi serialize et ve dön
             serializer = DocumentSerializer(document)
             return Response(serializer.data)
@@ -269,6 +454,271 @@ class ProcessDocumentView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class BulkProcessDocumentsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAccountant]
+
+    def post(self, request):
+        """
+        Birden fazla belgenin durumunu tek seferde değiştir.
+        Body: {"ids": [1, 2, ...], "status": "completed"}
+        Her id için sonuç: updated, unchanged, not_found veya forbidden
+        """
+        new_status = request.data.get('status')
+        valid_statuses = [choice for choice, _ in Document.STATUS_CHOICES]
+        if new_status not in valid_statuses:
+            return Response(
+                {'error': f'Geçersiz durum değeri. Geçerli değerler: {", ".join(valid_statuses)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(id_, int) and not isinstance(id_, bool) for id_ in ids):
+            return Response({'error': 'ids tam sayı listesi olmalı'}, status=status.HTTP_400_BAD_REQUEST)
+        max_documents = settings.DOCUMENT_BULK_PROCESS['MAX_DOCUMENTS']
+        if len(ids) > max_documents:
+            return Response(
+                {'error': f'Tek istekte en fazla {max_documents} belge işlenebilir'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = list(dict.fromkeys(ids))
+
+        scope = get_client_scope(request.user, request)
+        now = timezone.now()
+        with transaction.atomic():
+            # Tek sorguda belgeleri kilitle ve yetkiyi kontrol et
+            found = {
+                document['id']: document
+                for document in Document.objects.select_for_update()
+                .filter(id__in=ids).values('id', 'uploaded_by_id', 'status')
+            }
+            allowed = [id_ for id_ in ids if id_ in found and found[id_]['uploaded_by_id'] in scope]
+            changed = [id_ for id_ in allowed if found[id_]['status'] != new_status]
+
+            if allowed:
+                # queryset.update auto_now alanlarını ve sinyalleri atlar
+                Document.objects.filter(id__in=allowed).update(
+                    status=new_status, processed_by=request.user, updated_at=now
+                )
+            if changed:
+                record_status_changes(
+                    [(id_, found[id_]['uploaded_by_id'], found[id_]['status']) for id_ in changed],
+                    new_status, now
+                )
+                notify_document_events(
+                    with_duplicate_owner(Document.objects.filter(id__in=changed)).order_by('id'),
+                    'document.status_changed'
+                )
+                self._queue_pushes([found[id_]['uploaded_by_id'] for id_ in changed], new_status)
+
+        results = []
+        for id_ in ids:
+            if id_ not in found:
+                result = 'not_found'
+            elif found[id_]['uploaded_by_id'] not in scope:
+                result = 'forbidden'
+            elif found[id_]['status'] == new_status:
+                result = 'unchanged'
+            else:
+                result = 'updated'
+            results.append({'id': id_, 'result': result})
+
+        return Response({
+            'status': new_status,
+            'updated': len(changed),
+            'results': results,
+        })
+
+    def _queue_pushes(self, client_ids, new_status):
+        """Müşteri başına belge sayısını içeren tek bildirim; aynı sayıdaki müşteriler tek seferde"""
+        counts = {}
+        for client_id in client_ids:
+            counts[client_id] = counts.get(client_id, 0) + 1
+        by_count = {}
+        for client_id, count in counts.items():
+            by_count.setdefault(count, []).append(client_id)
+
+        status_display = dict(Document.STATUS_CHOICES)[new_status]
+        for count, users in by_count.items():
+            queue_push(
+                users,
+                collapse_key='documents_status',
+                title='Belge durumları güncellendi',
+                body=f"{count} belge: {status_display}",
+                data={'type': 'documents_status', 'status': new_status, 'count': count}
+            )
+
+class DeviceTokenView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """Push bildirimleri için cihaz token'ını kaydet"""
+        serializer = DeviceTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Token başka bir kullanıcıya aitse (cihazda hesap değişti) bu kullanıcıya taşı
+        device, created = DeviceToken.objects.update_or_create(
+            token=serializer.validated_data['token'],
+            defaults={
+                'user': request.user,
+                'platform': serializer.validated_data.get('platform', 'android')
+            }
+        )
+        return Response(
+            DeviceTokenSerializer(device).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    def delete(self, request):
+        """Çıkış yapılırken cihaz token'ını sil"""
+        token = request.data.get('token')
+        if not token:
+            return Response({'error': 'token zorunludur'}, status=status.HTTP_400_BAD_REQUEST)
+        DeviceToken.objects.filter(user=request.user, token=token).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class AnalysisQueueStatsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """Fiş analizi kuyruğunun büro bazında derinliği ve bekleme süreleri"""
+        stats = analysis_queue.stats()
+        if not request.user.is_staff:
+            if request.user.user_type != 'accountant':
+                return Response(status=status.HTTP_403_FORBIDDEN)
+            firm_ids = set(request.user.owned_firm.values_list('id', flat=True))
+            stats = {tenant_id: data for tenant_id, data in stats.items() if tenant_id in firm_ids}
+
+        firm_names = dict(AccountingFirm.objects.filter(id__in=stats).values_list('id', 'name'))
+        return Response({
+            'tenants': [
+                {
+                    'firm_id': tenant_id,
+                    'firm_name': firm_names.get(tenant_id),
+                    **data,
+                    'oldest_wait': round(data['oldest_wait'], 2),
+                    'avg_wait': round(data['avg_wait'], 2),
+                }
+                for tenant_id, data in sorted(
+                    stats.items(), key=lambda item: item[1]['oldest_wait'], reverse=True
+                )
+            ],
+            'total': sum(data['interactive'] + data['bulk'] for data in stats.values()),
+        })
+
+class ReceiptAnalyticsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """
+        Fiş harcamalarının satıcı ve kategori dağılımı.
+        Query: client (muhasebeci için müşteri id), start, end (YYYY-AA-GG), limit
+        """
+        user = request.user
+        client_id = request.query_params.get('client')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+        except ValueError:
+            return Response({'error': 'limit sayı olmalı'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if user.user_type == 'accountant':
+            client_ids = get_client_scope(user, request).client_ids
+            if client_id:
+                if not client_id.isdigit() or int(client_id) not in client_ids:
+                    return Response({'error': 'Müşteri bulunamadı'}, status=status.HTTP_404_NOT_FOUND)
+                client_ids = [int(client_id)]
+        else:
+            client_ids = [user.id]
+
+        receipts = ReceiptSeller.objects.filter(client_id__in=client_ids)
+        items = ReceiptLineItem.objects.filter(client_id__in=client_ids)
+        start = date_param(request.query_params, 'start')
+        end = date_param(request.query_params, 'end')
+        if start:
+            receipts = receipts.filter(date__gte=start)
+            items = items.filter(receipt__date__gte=start)
+        if end:
+            receipts = receipts.filter(date__lte=end)
+            items = items.filter(receipt__date__lte=end)
+
+        # Tutarı okunamamış fişlerin toplamı NULL; PostgreSQL'de azalan sırada başa gelmesin
+        top_sellers = (
+            receipts.exclude(normalized_name='')
+            .values('normalized_name')
+            .annotate(name=Max('name'), total=Sum('total_amount'), vat=Sum('vat_amount'), count=Count('id'))
+            .order_by(F('total').desc(nulls_last=True))[:limit]
+        )
+        categories = (
+            items.values('category')
+            .annotate(total=Sum('total_price'), count=Count('id'))
+            .order_by(F('total').desc(nulls_last=True))
+        )
+        return Response({
+            'top_sellers': [
+                {
+                    'name': seller['name'],
+                    'total': seller['total'],
+                    'vat': seller['vat'],
+                    'count': seller['count'],
+                }
+                for seller in top_sellers
+            ],
+            'categories': [
+                {
+                    'category': category['category'] or 'other',
+                    'total': category['total'],
+                    'count': category['count'],
+                }
+                for category in categories
+            ],
+        })
+
+class MonthlyRollupView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """
+        Aylık tutar ve KDV serisi (büro veya müşteri bazında).
+        Query: client (muhasebeci için müşteri id), start, end (YYYY-AA), document_type,
+               group_by (document_type | vat_rate)
+        """
+        user = request.user
+        params = request.query_params
+        client_id = params.get('client')
+
+        if user.user_type == 'accountant':
+            client_ids = get_client_scope(user, request).client_ids
+            if client_id:
+                if not client_id.isdigit() or int(client_id) not in client_ids:
+                    return Response({'error': 'Müşteri bulunamadı'}, status=status.HTTP_404_NOT_FOUND)
+                client_ids = [int(client_id)]
+        else:
+            client_ids = [user.id]
+
+        group_by = params.get('group_by') or None
+        if group_by not in (None, 'document_type', 'vat_rate'):
+            raise DRFValidationError({'group_by': 'document_type veya vat_rate olmalı'})
+
+        # Varsayılan: içinde bulunulan ay dahil son 12 ay
+        current_month = timezone.localdate().replace(day=1)
+        end = month_param(params, 'end', current_month)
+        year, month = divmod(end.year * 12 + end.month - 12, 12)
+        start = month_param(params, 'start', end.replace(year=year, month=month + 1))
+        if start > end:
+            raise DRFValidationError({'start': 'Başlangıç ayı bitişten sonra olamaz'})
+        if (end.year - start.year) * 12 + end.month - start.month >= 120:
+            raise DRFValidationError({'start': 'En fazla 120 aylık aralık sorgulanabilir'})
+
+        return Response({
+            'start': start.strftime('%Y-%m'),
+            'end': end.strftime('%Y-%m'),
+            'group_by': group_by,
+            'series': monthly_series(
+                client_ids, start, end,
+                document_types=choice_params(params, 'document_type', Document.DOCUMENT_TYPES),
+                group_by=group_by,
+            ),
+        })
+
 class AccountantViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated, IsAccountant]
@@ -385,15 +835,21 @@ class AccountantViewSet(viewsets.ModelViewSet):
     def documents(self, request, pk=None):
         try:
             client = self.get_object()
-            if not client.accounting_firms.filter(owner=request.user).exists():
+            if client.id not in get_client_scope(request.user, request):
                 return Response(
                     {'error': 'Bu müşterinin belgelerine erişim yetkiniz yok'}, 
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            documents = Document.objects.filter(uploaded_by=client).order_by('-date')
-            serializer = DocumentSerializer(documents, many=True)
-            return Response(serializer.data)
+            documents = filter_documents(Document.objects.filter(uploaded_by=client), request.query_params)
+            paginator = DocumentCursorPagination()
+            paginator.ordering = '-date'
+            page = paginator.paginate_queryset(documents, request, view=self)
+            serializer = DocumentSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        except DRFValidationError:
+            raise
         
         except Exception as e:
             return Response(
@@ -407,7 +863,7 @@ class AccountantViewSet(viewsets.ModelViewSet):
             client = self.get_object()
             
             # Müşterinin bu muhasebeciye ait olup olmadığını kontrol et
-            if not client.accounting_firms.filter(owner=request.user).exists():
+            if client.id not in get_client_scope(request.user, request):
                 return Response(
                     {'error': 'Bu müşteri size ait değil'}, 
                     status=status.HTTP_403_FORBIDDEN
@@ -504,8 +960,7 @@ class AccountantViewSet(viewsets.ModelViewSet):
             document = Document.objects.get(id=document_id)
             
             # Muhasebecinin bu belgeyi güncelleme yetkisi var mı kontrol et
-            client_ids = accountant.accounting_firms.first().clients.values_list('id', flat=True)
-            if document.uploaded_by.id not in client_ids:
+            if document.uploaded_by_id not in get_client_scope(request.user, request):
                 return Response(
                     {"detail": "Bu belgeyi güncelleme yetkiniz yok."},
                     status=status.HTTP_403_FORBIDDEN
@@ -538,33 +993,41 @@ class DashboardStatsView(APIView):
         
         if user.user_type == 'accountant':
             # Muhasebeci için istatistikler
-            total_clients = user.owned_firm.first().clients.count() if user.owned_firm.exists() else 0
-            
-            # Tüm müşterilerin belgelerini al
-            client_ids = user.owned_firm.first().clients.values_list('id', flat=True) if user.owned_firm.exists() else []
-            documents = Document.objects.filter(uploaded_by_id__in=client_ids)
-            
-            pending_documents = documents.filter(status='pending').count()
-            latest_document = documents.order_by('-updated_at').first()
-            
+            scope = get_client_scope(user, request)
+            # Sayaçlar ve son aktiviteler belge yazımlarında güncellenen büro satırlarından okunur
+            # (muhasebecinin her bürosu için tek satır); belge veya müşteri sayısıyla büyümez
+            firm_stats = list(FirmDocumentStats.objects.filter(pk__in=scope.firm_ids))
+            total = len(scope.client_ids)
+            pending_documents = sum(stats.pending for stats in firm_stats)
+            last_activity = max(
+                (stats.last_activity for stats in firm_stats if stats.last_activity), default=None
+            )
+
             # Son aktiviteleri al
-            recent_activities = documents.order_by('-updated_at')[:5]
+            recent_ids = {id_ for stats in firm_stats for id_ in stats.recent_document_ids}
+            recent_activities = sorted(
+                (
+                    document for document in Document.objects.filter(id__in=recent_ids)
+                    if document.uploaded_by_id in scope
+                ),
+                key=lambda document: (document.updated_at, document.id), reverse=True
+            )[:5]
             
         else:
             # Müşteri için istatistikler
-            # 'documents' yerine 'uploaded_documents' kullanıyoruz
-            total_documents = user.uploaded_documents.count()
-            pending_documents = user.uploaded_documents.filter(status='pending').count()
-            latest_document = user.uploaded_documents.order_by('-updated_at').first()
+            stats = UserDocumentStats.objects.filter(pk=user.id).first()
+            total = stats.total if stats else 0
+            pending_documents = stats.pending if stats else 0
+            last_activity = stats.last_activity if stats else None
             
             # Son aktiviteleri al
             recent_activities = user.uploaded_documents.order_by('-updated_at')[:5]
 
         return Response({
             'stats': {
-                'total': total_clients if user.user_type == 'accountant' else total_documents,
+                'total': total,
                 'pending_documents': pending_documents,
-                'last_activity': latest_document.updated_at if latest_document else None
+                'last_activity': last_activity
             },
             'recent_activities': DocumentSerializer(recent_activities, many=True).data
         })
@@ -804,26 +1267,33 @@ class PasswordChangeView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-class DocumentPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 class ClientDocumentsView(APIView):
-    pagination_class = DocumentPagination
+    pagination_class = DocumentCursorPagination
     
     def get(self, request, pk):
+        if request.user.user_type == 'accountant':
+            allowed = pk in get_client_scope(request.user, request)
+        else:
+            allowed = pk == request.user.id
+        if not allowed:
+            return Response(
+                {'error': 'Bu müşterinin belgelerine erişim yetkiniz yok'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
         try:
-            documents = Document.objects.filter(
-                uploaded_by_id=pk
-            ).order_by('-created_at')
+            documents = filter_documents(
+                Document.objects.filter(uploaded_by_id=pk), request.query_params
+            )
             
             paginator = self.pagination_class()
-            paginated_documents = paginator.paginate_queryset(documents, request)
+            paginated_documents = paginator.paginate_queryset(documents, request, view=self)
             serializer = DocumentSerializer(paginated_documents, many=True)
             
             return paginator.get_paginated_response(serializer.data)
             
+        except DRFValidationError:
+            raise
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -1320,16 +1790,20 @@ class ClientDocumentViewSet(viewsets.ModelViewSet):
         if self.request.user.user_type == 'client':
             return ClientDocument.objects.filter(client=self.request.user)
         elif self.request.user.user_type == 'accountant':
-            client_ids = self.request.user.accounting_firms.first().clients.values_list('id', flat=True)
-            return ClientDocument.objects.filter(client_id__in=client_ids)
+            scope = get_client_scope(self.request.user, self.request)
+            return ClientDocument.objects.filter(client_id__in=scope.client_ids)
         return ClientDocument.objects.none()
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        queryset = filter_client_documents(self.get_queryset(), request.query_params)
+        paginator = ClientDocumentCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
         return Response({
             'status': 'success',
-            'data': serializer.data
+            'data': serializer.data,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link()
         })
 
     def perform_create(self, serializer):
@@ -1340,8 +1814,19 @@ class ClientDocumentViewSet(viewsets.ModelViewSet):
         
         if current_count >= 10:
             raise ValidationError('Maximum 10 aktif belge yükleyebilirsiniz')
-            
-        serializer.save(client=self.request.user)
+
+        extra = {}
+        uploaded_file = serializer.validated_data.get('file')
+        if uploaded_file:
+            extra['content_hash'] = compute_content_hash(uploaded_file)
+            stored_copy = find_stored_copy(
+                ClientDocument.objects.filter(client=self.request.user), extra['content_hash']
+            )
+            if stored_copy:
+                # Aynı içerik zaten storage'da; tekrar yüklemek yerine mevcut nesneyi kullan
+                extra['file'] = stored_copy.file.name
+
+        serializer.save(client=self.request.user, **extra)
 
     def destroy(self, request, *args, **kwargs):
         try:
@@ -1354,18 +1839,7 @@ class ClientDocumentViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Önce S3'teki dosyayı sil
-            if instance.file:
-                try:
-                    # Storage'dan dosyayı sil
-                    instance.file.delete(save=False)
-                    print(f"Dosya silindi: {instance.file.name}")
-                except Exception as e:
-                    print(f"Dosya silinirken hata: {str(e)}")
-                    # Dosya silinirken hata olsa bile devam et
-                    pass
-            
-            # Sonra veritabanından kaydı sil
+            # Kaydı sil; dosya aynı transaction içinde silme kuyruğuna alınır (drain_file_deletions)
             instance.delete()
             
             return Response({
@@ -1393,39 +1867,114 @@ def download_document(request, document_id):
             )
         elif request.user.user_type == 'accountant':
             # Muhasebecinin müşterisi değilse erişim yok
-            client_ids = request.user.accounting_firms.first().clients.values_list('id', flat=True)
-            if document.client.id not in client_ids:
+            if document.client_id not in get_client_scope(request.user, request):
                 return Response(
                     {'error': 'Bu belgeyi indirme yetkiniz yok'},
                     status=status.HTTP_403_FORBIDDEN
                 )
-        
-        # CDN'den dosyayı al
-        response = requests.get(document.file.url)
-        
-        if response.status_code != 200:
+
+        if not document.file:
             return Response(
                 {'error': 'Dosya bulunamadı'},
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        # Content-Type ve diğer header'ları ayarla
-        content_type = response.headers.get('Content-Type', 'application/octet-stream')
-        
-        # Django response oluştur
-        django_response = HttpResponse(
-            response.content,
-            content_type=content_type
-        )
-        
-        # Dosya adını ayarla
-        filename = document.file.name.split('/')[-1]
-        django_response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return django_response
+
+        # Dosyayı belleğe almadan storage'dan aktar (veya imzalı URL'ye yönlendir)
+        return file_download_response(request, document.file.name, document.file_name)
         
     except Exception as e:
         return Response(
             {'error': str(e)},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_client_documents(request):
+    """
+    Müşterinin belgelerini tarih aralığına göre tek ZIP olarak indir.
+    Query: client (muhasebeci için zorunlu), start, end (YYYY-AA-GG),
+    include (documents,client_documents)
+    """
+    user = request.user
+    if user.user_type == 'accountant':
+        client_id = request.query_params.get('client', '')
+        client = None
+        if client_id.isdigit() and int(client_id) in get_client_scope(user, request):
+            client = User.objects.filter(id=client_id).first()
+        if client is None:
+            return Response({'error': 'Müşteri bulunamadı'}, status=status.HTTP_404_NOT_FOUND)
+    else:
+        client = user
+
+    start = date_param(request.query_params, 'start')
+    end = date_param(request.query_params, 'end')
+
+    include = request.query_params.get('include', 'documents,client_documents').split(',')
+    documents = Document.objects.filter(uploaded_by=client).exclude(file='').order_by('date', 'id')
+    client_documents = ClientDocument.objects.filter(client=client).exclude(file='').order_by('created_at', 'id')
+    if start:
+        documents = documents.filter(date__gte=start)
+        client_documents = client_documents.filter(created_at__date__gte=start)
+    if end:
+        documents = documents.filter(date__lte=end)
+        client_documents = client_documents.filter(created_at__date__lte=end)
+    if 'documents' not in include:
+        documents = documents.none()
+    if 'client_documents' not in include:
+        client_documents = client_documents.none()
+
+    file_count = documents.count() + client_documents.count()
+    if file_count > settings.DOCUMENT_EXPORT['MAX_FILES']:
+        return Response(
+            {'error': f"En fazla {settings.DOCUMENT_EXPORT['MAX_FILES']} dosya dışa aktarılabilir, tarih aralığını daraltın"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    filename = f"{_safe_filename(client.get_full_name() or client.email)}_{start or 'baslangic'}_{end or 'bugun'}.zip"
+    # ASGI altında senkron iteratör tamamen belleğe okunur; imleçler aynı thread'de kalmalı
+    response = StreamingHttpResponse(
+        aiter_chunks(iter_client_export(documents, client_documents), thread_sensitive=True),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_documents(request):
+    """
+    Belgeleri ve fiş kalemlerini muhasebe programlarına aktarım için CSV veya XLSX olarak indir.
+    Query: file_format (csv | xlsx; DRF 'format' parametresini kendisi kullanır), belge listesiyle aynı filtreler
+    """
+    user = request.user
+    export_format = request.query_params.get('file_format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        return Response({'error': 'file_format csv veya xlsx olmalı'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if user.user_type == 'accountant':
+        documents = Document.objects.filter(uploaded_by_id__in=get_client_scope(user, request).client_ids)
+    else:
+        documents = Document.objects.filter(uploaded_by=user)
+    documents = filter_documents(documents, request.query_params).order_by('date', 'id')
+
+    rows = iter_document_rows(documents, settings.DOCUMENT_EXPORT['ROW_CHUNK_SIZE'])
+    filename = f"belgeler_{timezone.localdate():%Y-%m-%d}.{export_format}"
+    # ASGI altında senkron iteratör tamamen belleğe okunur; imleç aynı thread'de kalmalı
+    if export_format == 'xlsx':
+        response = StreamingHttpResponse(
+            aiter_chunks(iter_xlsx(DOCUMENT_EXPORT_HEADER, rows, sheet_name='Belgeler'), thread_sensitive=True),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    else:
+        response = StreamingHttpResponse(
+            aiter_chunks(iter_csv(DOCUMENT_EXPORT_HEADER, rows), thread_sensitive=True),
+            content_type='text/csv; charset=utf-8'
+        )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private'
+    return response
+
+def _safe_filename(text):
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in text)[:60]
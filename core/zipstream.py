@@ -0,0 +1,132 @@
+import io
+import queue
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class StreamBuffer(io.RawIOBase):
+    """zipfile'ın yazdığı baytları toplayan, geri sarılamayan tampon"""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_zip(entries):
+    """
+    ZIP arşivini diske veya belleğe biriktirmeden parça parça üretir.
+
+    Args:
+        entries: (arşivdeki ad, parça iterator'ı, sıkıştırılsın mı) üçlüleri
+
+    Yields:
+        bytes: ZIP çıktısı
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w') as archive:
+        for name, chunks, compress in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            # JPEG/PDF zaten sıkıştırılmış; tekrar sıkıştırmak sadece CPU harcar
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            with archive.open(info, mode='w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # Merkez dizin arşiv kapanırken yazılır
+    yield buffer.drain()
+
+
+def prefetch(items, open_chunks, workers, max_chunks):
+    """
+    Sıradaki `workers` kadar öğenin içeriğini arka planda okumaya başlar, sırayı koruyarak döndürür.
+    Her öğe için en fazla `max_chunks` parça bekletildiğinden bellek kullanımı öğe sayısından bağımsızdır.
+
+    Args:
+        items: Okunacak öğeler
+        open_chunks: öğe -> bayt parçaları iterator'ı döndüren fonksiyon
+
+    Yields:
+        tuple: (öğe, parça iterator'ı veya okuma hatası)
+    """
+    cancelled = threading.Event()
+
+    def produce(item, chunks_queue):
+        try:
+            for chunk in open_chunks(item):
+                while not cancelled.is_set():
+                    try:
+                        chunks_queue.put(chunk, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+                if cancelled.is_set():
+                    return
+            result = _DONE
+        except Exception as e:
+            result = e
+        while not cancelled.is_set():
+            try:
+                chunks_queue.put(result, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def consume(chunks_queue, first):
+        yield first
+        while True:
+            chunk = chunks_queue.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    window = deque()
+    items = iter(items)
+    try:
+        for item in items:
+            chunks_queue = queue.Queue(maxsize=max_chunks)
+            executor.submit(produce, item, chunks_queue)
+            window.append((item, chunks_queue))
+            if len(window) < workers:
+                continue
+            yield _next_ready(window.popleft(), consume)
+        while window:
+            yield _next_ready(window.popleft(), consume)
+    finally:
+        # İstemci bağlantıyı keserse bekleyen okuyucular dursun
+        cancelled.set()
+        executor.shutdown(wait=False)
+
+
+def _next_ready(entry, consume):
+    """İlk parçayı bekle; okuma baştan başarısızsa hatayı döndür"""
+    item, chunks_queue = entry
+    first = chunks_queue.get()
+    if first is _DONE:
+        return item, iter(())
+    if isinstance(first, Exception):
+        return item, first
+    return item, consume(chunks_queue, first)